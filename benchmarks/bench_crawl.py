@@ -0,0 +1,119 @@
+"""
+Benchmark the crawl powerup against a local synthetic website.
+
+Usage:
+    python benchmarks/bench_crawl.py                    # 3000 pages, concurrency 8/32
+    python benchmarks/bench_crawl.py --pages 5000 -c 16 -c 64
+
+The site is served from localhost. Each page has a few paragraphs of text and
+links to neighbouring and random pages, so the crawl exercises the frontier,
+dedup and link extraction rather than network latency. The page cache is
+disabled so every run downloads and converts every page.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def start_local_site(pages, links_per_page, latency):
+    """Serve a synthetic site of `pages` interlinked pages and return its root URL."""
+    rng = random.Random(42)
+    words = "crawler frontier canonical politeness budget latency stream parse link text".split()
+
+    def render(index):
+        neighbours = {(index + 1) % pages, (index - 1) % pages}
+        neighbours.update(rng.randrange(pages) for _ in range(links_per_page))
+        links = "".join(f'<li><a href="/page/{n}?utm_source=bench#top">Page {n}</a></li>' for n in sorted(neighbours))
+        paragraphs = "".join(
+            "<p>" + " ".join(rng.choice(words) for _ in range(rng.randint(40, 400))) + "</p>"
+            for _ in range(rng.randint(2, 8))
+        )
+        return (f"<html><head><title>Page {index}</title></head><body>"
+                f"<h1>Page {index}</h1>{paragraphs}<ul>{links}</ul></body></html>").encode()
+
+    site = [render(i) for i in range(pages)]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            try:
+                body = site[0 if path == "/" else int(path.rsplit("/", 1)[1])]
+                status = 200
+            except (ValueError, IndexError):
+                body, status = b"not found", 404
+            if latency:
+                time.sleep(latency)
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+async def run_crawl(crawl, HostPoliteness, seed, pages, concurrency):
+    """Crawl the whole site once and return (pages, errors, seconds to first page, total seconds)."""
+    start = time.perf_counter()
+    first = None
+    fetched = errors = 0
+    async for page in crawl(
+        seed,
+        max_pages=pages,
+        max_depth=pages,
+        concurrency=concurrency,
+        time_budget=600,
+        byte_budget=10 ** 12,
+        politeness=HostPoliteness(concurrency=concurrency, delay=0),
+    ):
+        if first is None:
+            first = time.perf_counter() - start
+        if "error" in page:
+            errors += 1
+        else:
+            fetched += 1
+    return fetched, errors, first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3000, help="pages on the local site")
+    parser.add_argument("--links", type=int, default=8, help="random links per page")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency per page in seconds")
+    parser.add_argument("-c", "--concurrency", type=int, action="append", help="crawl concurrency (repeatable)")
+    args = parser.parse_args()
+    concurrencies = args.concurrency or [8, 32]
+
+    os.environ["POWERUPS_PAGE_CACHE"] = "0"
+    os.environ["POWERUPS_HTTP_MAX_PER_HOST"] = str(max(concurrencies))
+    os.environ["POWERUPS_HTTP_MAX_KEEPALIVE"] = str(max(concurrencies))
+
+    # Imported after the environment is set up
+    from internet.crawl.tools import crawl, HostPoliteness
+
+    seed = start_local_site(args.pages, args.links, args.latency)
+    print(f"site: {args.pages} pages at {seed}")
+    for concurrency in concurrencies:
+        fetched, errors, first, total = asyncio.run(run_crawl(crawl, HostPoliteness, seed, args.pages, concurrency))
+        print(f"concurrency={concurrency:<4} pages={fetched:<6} errors={errors:<4} "
+              f"first_page={first * 1000:7.1f}ms total={total:7.2f}s throughput={fetched / total:7.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
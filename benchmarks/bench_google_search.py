@@ -0,0 +1,137 @@
+"""
+Benchmark the synchronous google_search path against google_search_async.
+
+Usage:
+    python benchmarks/bench_google_search.py --local            # offline, local stand-in
+    python benchmarks/bench_google_search.py -n 20 -c 5         # live API (needs keys)
+
+The live run reads GOOGLE_CONSTELLA_API_KEY and GOOGLE_SEARCH_CX_ID. With --local a
+small Custom Search stand-in is started on localhost with an artificial latency,
+so the two paths can be compared without spending quota.
+
+Each path searches its own queries with the result cache emptied first, and the
+app's search rate limit is lifted (unless POWERUPS_SEARCH_RATE/BURST are set),
+so the client is timed rather than the cache or the token bucket.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+def start_local_custom_search(latency):
+    """Start a Custom Search stand-in on localhost and return its root URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"items": [
+                {"title": f"Result {i}", "link": f"https://example.com/{i}", "snippet": "Lorem ipsum " * 10}
+                for i in range(5)
+            ]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def summarize(name, latencies, wall):
+    """Print latency percentiles and throughput for one path."""
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<22} n={len(latencies):<4} wall={wall:7.3f}s  "
+          f"mean={statistics.mean(latencies) * 1000:7.1f}ms  "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms  "
+          f"p95={p95 * 1000:7.1f}ms  "
+          f"throughput={len(latencies) / wall:6.1f}/s")
+
+
+def bench_sync(google_search, queries, concurrency):
+    """Run google_search from a thread pool, as a blocking caller would."""
+    latencies = []
+
+    def one(query):
+        start = time.perf_counter()
+        google_search(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    return latencies, time.perf_counter() - start
+
+
+async def bench_async(google_search_async, queries, concurrency):
+    """Run google_search_async on one event loop with bounded concurrency."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            await google_search_async(query)
+            latencies.append(time.perf_counter() - start)
+
+    await google_search_async("warm up async")
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=50, help="searches per path")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="searches in flight at once")
+    parser.add_argument("--local", action="store_true", help="use a local Custom Search stand-in")
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in latency in seconds")
+    args = parser.parse_args()
+
+    if args.local:
+        os.environ["POWERUPS_GOOGLE_CSE_ROOT_URL"] = start_local_custom_search(args.latency)
+        os.environ.setdefault("GOOGLE_CONSTELLA_API_KEY", "local")
+        os.environ.setdefault("GOOGLE_SEARCH_CX_ID", "local")
+
+    # Let the shared pool open as many connections to the API host as the sync threads do
+    os.environ.setdefault("POWERUPS_HTTP_MAX_PER_HOST", str(args.concurrency))
+    # Measure the client, not the shared rate limit or the daily quota
+    os.environ.setdefault("POWERUPS_SEARCH_RATE", "100000")
+    os.environ.setdefault("POWERUPS_SEARCH_BURST", "100000")
+    os.environ.setdefault("POWERUPS_SEARCH_DAILY_QUOTA", "0")
+    os.environ.setdefault("POWERUPS_SEARCH_QUOTA_PATH", os.path.join(tempfile.mkdtemp(prefix="powerups_bench_"), "search_quota.sqlite3"))
+
+    # Imported after the environment is set up so the endpoint override applies
+    from internet.search.tools import SEARCH_CACHE, google_search, google_search_async
+
+    # Warm up both paths (service build, first connections) outside the measurement
+    google_search("warm up")
+    # Different queries per path and an empty cache, so every search reaches the API
+    SEARCH_CACHE.clear()
+    summarize("google_search (sync)", *bench_sync(
+        google_search, [f"sync benchmark query {i}" for i in range(args.requests)], args.concurrency))
+    SEARCH_CACHE.clear()
+    summarize("google_search_async", *asyncio.run(bench_async(
+        google_search_async, [f"async benchmark query {i}" for i in range(args.requests)], args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+"""
+Benchmark /powerup-demo end to end, fully offline.
+
+Usage:
+    python benchmarks/bench_powerup.py                          # concurrency 1/8/32, 100 requests each
+    python benchmarks/bench_powerup.py -c 16 -c 64 -n 500 --model-latency 0.5
+    python benchmarks/bench_powerup.py --save                   # also write benchmarks/results/<commit>-<time>.json
+    python benchmarks/bench_powerup.py --compare benchmarks/results/OLD.json
+    python benchmarks/bench_powerup.py --compare OLD.json NEW.json   # compare two saved runs, no benchmark
+
+Three local stand-ins replace the live services:
+  * a Responses API that scripts each conversation: a google_search call, then
+    get_website_url_content calls on the first --fetches result links (in
+    parallel), then a final answer, each after --model-latency seconds (with
+    +/-50% jitter);
+  * a Custom Search endpoint returning links to the local site;
+  * a web server whose pages have the sizes given by --page-sizes.
+
+The app runs under uvicorn in a subprocess pointed at the stand-ins through
+OPENAI_BASE_URL and POWERUPS_GOOGLE_CSE_ROOT_URL, with the page cache off and
+the search rate limit lifted. Every request uses different queries and pages,
+so caches only help where requests genuinely overlap. The report gives
+throughput, p50/p95/p99 latency and the server's memory (peak resident set of
+the app and its worker processes, read from /proc, so Linux only).
+
+Only the non-streaming endpoint is driven; the stand-in rejects stream=true.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+WORDS = ("agent model search result page latency throughput token budget stream cache "
+         "query passage index crawler frontier html text link convert pool").split()
+
+
+class Counters:
+    """Calls and bytes seen by the stand-ins, reset before each run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+
+COUNTERS = Counters()
+
+
+def _serve(handler):
+    """Start a threaded HTTP server on localhost and return its root URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_local_site(pages, page_sizes_kb, latency):
+    """Serve `pages` HTML pages with sizes cycling through page_sizes_kb and return the root URL."""
+    rng = random.Random(42)
+
+    def render(index):
+        size = page_sizes_kb[index % len(page_sizes_kb)] * 1024
+        parts = [f"<html><head><title>Page {index}</title></head><body><h1>Page {index}</h1>"]
+        length = len(parts[0])
+        while length < size:
+            paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 200))) + "</p>"
+            if rng.random() < 0.2:
+                paragraph = f"<h2>Section {length}</h2>" + paragraph
+            parts.append(paragraph)
+            length += len(paragraph)
+        parts.append("</body></html>")
+        return "".join(parts).encode()
+
+    site = [render(i) for i in range(pages)]
+
+    class Handler(_Handler):
+        def do_GET(self):
+            try:
+                body = site[int(self.path.split("?")[0].rsplit("/", 1)[1])]
+                status = 200
+            except (ValueError, IndexError):
+                body, status = b"not found", 404
+            if latency:
+                time.sleep(latency)
+            COUNTERS.add("page_fetches")
+            COUNTERS.add("page_bytes", len(body))
+            self.send_body(status, body, "text/html; charset=utf-8")
+
+    return _serve(Handler)
+
+
+def start_local_custom_search(site, pages, latency):
+    """Serve a Custom Search stand-in whose results link to the local site, and return its root URL."""
+
+    class Handler(_Handler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            if latency:
+                time.sleep(latency)
+            first = zlib.crc32(query.encode()) % pages
+            body = json.dumps({"items": [
+                {
+                    "title": f"{query} result {i}",
+                    "link": f"{site}/page/{(first + i) % pages}",
+                    "displayLink": "127.0.0.1",
+                    "snippet": " ".join(WORDS[(first + i + j) % len(WORDS)] for j in range(25)),
+                }
+                for i in range(5)
+            ]}).encode()
+            COUNTERS.add("search_calls")
+            self.send_body(200, body, "application/json; charset=UTF-8")
+
+    return _serve(Handler) + "/"
+
+
+def _call_round(call_id):
+    match = re.match(r"call_[0-9a-f]+_(\d+)_\d+$", call_id or "")
+    return int(match.group(1)) if match else 0
+
+
+def start_local_responses_api(site, pages, fetches, max_length, latency):
+    """
+    Serve a Responses API stand-in and return its base URL.
+
+    Conversations are scripted: round 1 searches, round 2 fetches `fetches` pages
+    in parallel, round 3 (or any request with tool_choice "none") answers. The
+    round is recovered from the call_ids of the tool outputs sent back, so it
+    works both with previous_response_id chaining and with the full conversation.
+    """
+    rng = random.Random(7)
+    rng_lock = threading.Lock()
+
+    def function_call(key, round_number, index, name, arguments):
+        return {
+            "type": "function_call",
+            "id": f"fc_{uuid.uuid4().hex}",
+            "call_id": f"call_{key}_{round_number}_{index}",
+            "name": name,
+            "arguments": json.dumps(arguments),
+            "status": "completed",
+        }
+
+    def script(request):
+        items = request.get("input") or []
+        if isinstance(items, str):
+            items = [{"role": "user", "content": items}]
+        message = next((item.get("content") for item in items if item.get("role") == "user"), None)
+        outputs = [item.get("call_id") for item in items if item.get("type") == "function_call_output"]
+        round_number = 1 + max((_call_round(call_id) for call_id in outputs), default=0)
+        # The conversation key: from the user message, or carried over in the call ids
+        key = format(zlib.crc32(message.encode()), "08x") if message else outputs[0].split("_")[1]
+        seed = int(key, 16)
+
+        if request.get("tool_choice") == "none" or round_number > 2:
+            return [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": f"Summary of {len(outputs)} tool results.", "annotations": []}],
+            }]
+        if round_number == 1:
+            query = " ".join(WORDS[(seed + i * 7) % len(WORDS)] for i in range(3)) + f" {seed}"
+            return [function_call(key, 1, 0, "google_search", {"query": query})]
+        # Open the top search results, like a model would
+        links = []
+        for item in items:
+            if item.get("type") == "function_call_output" and _call_round(item.get("call_id")) == 1:
+                try:
+                    links = [result["link"] for result in json.loads(item.get("output") or "[]")]
+                except (ValueError, TypeError, KeyError):
+                    links = []
+        links = links or [f"{site}/page/{(seed + i * 31) % pages}" for i in range(fetches)]
+        arguments = [{"url": link} for link in links[0:fetches]]
+        if max_length:
+            for argument in arguments:
+                argument["max_length"] = max_length
+        return [function_call(key, 2, i, "get_website_url_content", argument) for i, argument in enumerate(arguments)]
+
+    class Handler(_Handler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            COUNTERS.add("model_calls")
+            COUNTERS.add("model_request_bytes", len(body))
+            request = json.loads(body or b"{}")
+            if request.get("stream"):
+                error = {"error": {"message": "streaming is not supported by the benchmark stand-in", "type": "invalid_request_error"}}
+                return self.send_body(400, json.dumps(error).encode(), "application/json")
+            output = script(request)
+            if latency:
+                with rng_lock:
+                    delay = latency * rng.uniform(0.5, 1.5)
+                time.sleep(delay)
+            response = {
+                "id": f"resp_{uuid.uuid4().hex}",
+                "object": "response",
+                "created_at": int(time.time()),
+                "status": "completed",
+                "model": request.get("model", "gpt-4o"),
+                "output": output,
+                "parallel_tool_calls": True,
+                "tool_choice": request.get("tool_choice", "auto"),
+                "tools": [],
+                "usage": {
+                    "input_tokens": len(body) // 4,
+                    "input_tokens_details": {"cached_tokens": 0},
+                    "output_tokens": 50,
+                    "output_tokens_details": {"reasoning_tokens": 0},
+                    "total_tokens": len(body) // 4 + 50,
+                },
+            }
+            self.send_body(200, json.dumps(response).encode(), "application/json")
+
+    return _serve(Handler) + "/v1"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(env, log_path):
+    """Run the app under uvicorn in a subprocess and wait until it answers; returns (process, base URL)."""
+    port = _free_port()
+    log = open(log_path, "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.join(ROOT, "src"),
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited during startup, see {log_path}")
+        try:
+            httpx.get(f"{base_url}/tools", timeout=1).raise_for_status()
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"The app did not start within 60 seconds, see {log_path}")
+
+
+def _rss_kb(pid):
+    """Resident set of a process and its descendants in KB, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            total = next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as children:
+                for child in children.read().split():
+                    total += _rss_kb(int(child)) or 0
+        return total
+    except (OSError, StopIteration, ValueError):
+        return None
+
+
+class MemorySampler:
+    """Sample the resident set of a process tree in a background thread, keeping the peak."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _rss_kb(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+async def drive(base_url, tools, requests, concurrency, offset):
+    """Send `requests` requests to /powerup-demo with `concurrency` in flight; returns (latencies, errors, seconds)."""
+    latencies = []
+    errors = {}
+    next_index = iter(range(offset, offset + requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        async def worker():
+            for index in next_index:
+                payload = {"tools": tools, "message": f"Benchmark request {index}: research and summarize"}
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/powerup-demo", json=payload)
+                    error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    error = type(e).__name__
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def _prefetch_counters(base_url):
+    """The app's prefetch counters from /stats (empty if unavailable)."""
+    try:
+        stats = httpx.get(f"{base_url}/stats", timeout=10).json().get("prefetch") or {}
+    except (httpx.HTTPError, ValueError):
+        return {}
+    return {key: value for key, value in stats.items() if key in ("scheduled", "hits", "misses", "bytes_fetched", "bytes_wasted")}
+
+
+def run_level(base_url, pid, tools, requests, concurrency, offset):
+    """Benchmark one concurrency level and return its result record."""
+    COUNTERS.reset()
+    prefetch_before = _prefetch_counters(base_url)
+    with MemorySampler(pid) as memory:
+        latencies, errors, seconds = asyncio.run(drive(base_url, tools, requests, concurrency, offset))
+    counters = COUNTERS.reset()
+    prefetch = {key: value - prefetch_before.get(key, 0) for key, value in _prefetch_counters(base_url).items()}
+    lookups = prefetch.get("hits", 0) + prefetch.get("misses", 0)
+    if lookups:
+        prefetch["hit_rate"] = round(prefetch["hits"] / lookups, 3)
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 1) if value is not None else None
+    model_calls = counters.get("model_calls", 0)
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(latencies) / seconds, 2) if seconds else None,
+        "latency_ms": {
+            "mean": ms(statistics.mean(latencies)) if latencies else None,
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1] if latencies else None),
+        },
+        "memory_mb": {
+            "rss_peak": round(memory.peak / 1024, 1) if memory.peak else None,
+            "rss_end": round(_rss_kb(pid) / 1024, 1) if _rss_kb(pid) else None,
+        },
+        "model_calls": model_calls,
+        "model_request_kb_avg": round(counters.get("model_request_bytes", 0) / model_calls / 1024, 1) if model_calls else None,
+        "search_calls": counters.get("search_calls", 0),
+        "page_fetches": counters.get("page_fetches", 0),
+        "page_mb": round(counters.get("page_bytes", 0) / 1024 / 1024, 1),
+        "prefetch": prefetch,
+    }
+
+
+def print_run(run):
+    latency = run["latency_ms"]
+    errors = sum(run["errors"].values())
+    print(f"concurrency={run['concurrency']:<4} ok={run['ok']:<5} errors={errors:<4} "
+          f"throughput={run['throughput_rps']:7.2f} req/s  "
+          f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms  "
+          f"rss_peak={run['memory_mb']['rss_peak']}MB model_req_avg={run['model_request_kb_avg']}KB")
+    if run["errors"]:
+        print(f"    errors: {run['errors']}")
+    if run.get("prefetch", {}).get("scheduled"):
+        print(f"    prefetch: {run['prefetch']}")
+
+
+def git_revision():
+    """(short commit, whether the tree has uncommitted changes), or (None, None) outside a git checkout."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{results['commit'] or 'nogit'}{'-dirty' if results['dirty'] else ''}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(old, new):
+    """Print the change in throughput, latency and memory per concurrency level between two result sets."""
+    def label(results):
+        return f"{results.get('commit') or '?'}{'+dirty' if results.get('dirty') else ''}"
+
+    def delta(before, after, higher_is_better):
+        if before is None or after is None:
+            return f"{before} -> {after}"
+        change = (after - before) / before * 100 if before else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        marker = "" if abs(change) < 5 else (" (better)" if better else " (WORSE)")
+        return f"{before} -> {after} ({change:+.1f}%){marker}"
+
+    if old.get("config") != new.get("config"):
+        print("note: the two runs used different settings; compare with care")
+    print(f"{label(old)} -> {label(new)}")
+    old_runs = {run["concurrency"]: run for run in old["runs"]}
+    for run in new["runs"]:
+        before = old_runs.get(run["concurrency"])
+        if before is None:
+            continue
+        print(f"concurrency={run['concurrency']}")
+        print(f"    throughput req/s: {delta(before['throughput_rps'], run['throughput_rps'], True)}")
+        for key in ("p50", "p95", "p99"):
+            print(f"    {key} ms: {delta(before['latency_ms'][key], run['latency_ms'][key], False)}")
+        print(f"    rss_peak MB: {delta(before['memory_mb']['rss_peak'], run['memory_mb']['rss_peak'], False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--concurrency", type=int, action="append", help="requests in flight (repeatable)")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before measuring")
+    parser.add_argument("--model-latency", type=float, default=0.3, help="mean seconds per model response")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="seconds per Custom Search call")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="seconds per page fetch")
+    parser.add_argument("--page-sizes", default="4,20,60,250,1000", help="page sizes in KB, comma separated")
+    parser.add_argument("--pages", type=int, default=500, help="pages on the local site")
+    parser.add_argument("--fetches", type=int, default=3, help="pages fetched per request")
+    parser.add_argument("--max-length", type=int, default=8000, help="max_length passed to page fetches (0 for none)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra environment for the app (repeatable)")
+    parser.add_argument("--save", action="store_true", help=f"save the results under {os.path.relpath(RESULTS_DIR, ROOT)}")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS", help="saved results to compare against (two files: compare them and exit)")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two result files")
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return
+
+    concurrencies = args.concurrency or [1, 8, 32]
+    page_sizes = [int(size) for size in args.page_sizes.split(",")]
+    site = start_local_site(args.pages, page_sizes, args.page_latency)
+    search = start_local_custom_search(site, args.pages, args.search_latency)
+    model = start_local_responses_api(site, args.pages, args.fetches, args.max_length, args.model_latency)
+
+    workdir = tempfile.mkdtemp(prefix="powerups_bench_")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": model,
+        "GOOGLE_CONSTELLA_API_KEY": "benchmark",
+        "GOOGLE_SEARCH_CX_ID": "benchmark",
+        "POWERUPS_GOOGLE_CSE_ROOT_URL": search,
+        "POWERUPS_SEARCH_RATE": "100000",
+        "POWERUPS_SEARCH_BURST": "100000",
+        "POWERUPS_SEARCH_DAILY_QUOTA": "0",
+        "POWERUPS_SEARCH_QUOTA_PATH": os.path.join(workdir, "search_quota.sqlite3"),
+        "POWERUPS_PAGE_CACHE": "0",
+        "POWERUPS_HTTP_MAX_PER_HOST": str(max(concurrencies) * args.fetches),
+        "POWERUPS_LOG_LEVEL": "WARNING",
+    })
+    for assignment in args.env:
+        name, _, value = assignment.partition("=")
+        env[name] = value
+
+    process, base_url = start_app(env, os.path.join(workdir, "app.log"))
+    print(f"app pid {process.pid} at {base_url}, log in {workdir}")
+    runs = []
+    try:
+        tools = ["google_search", "get_website_url_content"]
+        if args.warmup:
+            asyncio.run(drive(base_url, tools, args.warmup, min(args.warmup, max(concurrencies)), 10 ** 6))
+        offset = 0
+        for concurrency in concurrencies:
+            run = run_level(base_url, process.pid, tools, args.requests, concurrency, offset)
+            offset += args.requests
+            runs.append(run)
+            print_run(run)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    commit, dirty = git_revision()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "model_latency": args.model_latency,
+            "search_latency": args.search_latency,
+            "page_latency": args.page_latency,
+            "page_sizes_kb": page_sizes,
+            "pages": args.pages,
+            "fetches": args.fetches,
+            "max_length": args.max_length,
+            "env": args.env,
+        },
+        "runs": runs,
+    }
+    if args.save:
+        print(f"saved {save_results(results)}")
+    if args.compare:
+        with open(args.compare[0]) as old:
+            compare(json.load(old), results)
+
+
+if __name__ == "__main__":
+    main()
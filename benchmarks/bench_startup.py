@@ -0,0 +1,184 @@
+"""
+Measure the app's cold start and the import cost of each tool.
+
+Usage:
+    python benchmarks/bench_startup.py                 # 5 runs of each measurement
+    python benchmarks/bench_startup.py -r 10 --serve   # also time uvicorn until the first answered request
+
+Every measurement runs in a fresh interpreter, so nothing is in sys.modules yet
+(one untimed run first warms the bytecode caches):
+  * import main: what every replica pays before it can serve;
+  * each tool: the extra time its first lookup (load_tool) takes after import
+    main, i.e. what the first request using the tool pays. Tools are measured
+    one per interpreter, so modules they share are counted for each of them;
+  * all tools: import main and then every tool, which is what the app paid
+    before tools were loaded on first use;
+  * ready (--serve): from starting uvicorn to the first answered /stats request.
+
+The heaviest modules pulled in by each tool are listed from python -X importtime.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+sys.path.insert(0, SRC)
+
+# Run in the child interpreter: import main, then load the tools named on the command line
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from utils.tool_decorator import load_tool
+tools = {}
+for name in sys.argv[1:]:
+    sys.stderr.write("--- tool " + name + "\\n")
+    sys.stderr.flush()
+    started = time.perf_counter()
+    load_tool(name)
+    tools[name] = time.perf_counter() - started
+print(json.dumps({"import_main": imported - start, "tools": tools}))
+"""
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env["POWERUPS_LOG_LEVEL"] = "WARNING"
+    return env
+
+
+def run_child(tools, importtime=False):
+    """Import main and load `tools` in a fresh interpreter; returns (timings, -X importtime lines per tool)."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD] + list(tools)
+    completed = subprocess.run(command, env=child_env(), capture_output=True, text=True, cwd=ROOT)
+    if completed.returncode:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "child failed")
+    sections = {}
+    current = None
+    for line in completed.stderr.splitlines():
+        if line.startswith("--- tool "):
+            current = line[len("--- tool "):]
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), sections
+
+
+def heaviest_imports(lines, count=5):
+    """The outermost modules imported in a -X importtime section, by cumulative microseconds."""
+    parsed = []
+    for line in lines:
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            parsed.append((len(match.group(3)), int(match.group(2)), match.group(4)))
+    if not parsed:
+        return []
+    top_level = min(depth for depth, _, _ in parsed)
+    outermost = [(module, cumulative) for depth, cumulative, module in parsed if depth == top_level]
+    return sorted(outermost, key=lambda entry: entry[1], reverse=True)[0:count]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_ready(timeout=60):
+    """Seconds from starting uvicorn until the app answers /stats."""
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SRC, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("The app exited during startup")
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).raise_for_status()
+                return time.perf_counter() - started
+            except httpx.HTTPError:
+                time.sleep(0.005)
+        raise RuntimeError(f"The app did not start within {timeout} seconds")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(samples):
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("-t", "--tool", action="append", help="tools to measure (repeatable, default: every tool in the manifest)")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn startup until the first answered request")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    from internet.manifest import TOOL_MODULES
+    tools = args.tool or list(TOOL_MODULES)
+
+    run_child(tools)  # warm the bytecode caches
+    import_main = []
+    per_tool = {name: [] for name in tools}
+    all_tools = []
+    for _ in range(args.repeat):
+        import_main.append(run_child([])[0]["import_main"])
+        for name in tools:
+            per_tool[name].append(run_child([name])[0]["tools"][name])
+        timings = run_child(tools)[0]
+        all_tools.append(timings["import_main"] + sum(timings["tools"].values()))
+
+    heaviest = {name: heaviest_imports(run_child([name], importtime=True)[1].get(name, [])) for name in tools}
+    results = {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "import_main": summarize(import_main),
+        "tools": {name: dict(summarize(per_tool[name]), module=TOOL_MODULES.get(name),
+                             heaviest_imports=[{"module": module, "ms": us / 1000} for module, us in heaviest[name]])
+                  for name in tools},
+        "all_tools": summarize(all_tools),
+    }
+    if args.serve:
+        results["ready"] = summarize([time_ready() for _ in range(args.repeat)])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"python {results['python']}, median (min) of {args.repeat} fresh interpreters")
+    print(f"{'import main':<28} {results['import_main']['median_ms']:8.1f} ms ({results['import_main']['min_ms']:.1f})")
+    for name in tools:
+        entry = results["tools"][name]
+        print(f"  + {name:<24} {entry['median_ms']:8.1f} ms ({entry['min_ms']:.1f})  [{entry['module']}]")
+        for heavy in entry["heaviest_imports"]:
+            print(f"      {heavy['module']:<36} {heavy['ms']:7.1f} ms")
+    print(f"{'import main + all tools':<28} {results['all_tools']['median_ms']:8.1f} ms ({results['all_tools']['min_ms']:.1f})")
+    if args.serve:
+        print(f"{'uvicorn ready':<28} {results['ready']['median_ms']:8.1f} ms ({results['ready']['min_ms']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+The agent loop shared by the PowerUp endpoints.
+
+The loop calls the model, runs the tool calls it asks for and feeds the results
+back until the model answers with plain text. It is written as an async generator
+of events so the same code serves the streaming endpoint (which forwards every
+event) and the regular endpoint (which only keeps the final one).
+"""
+import asyncio
+import json
+import logging
+import time
+
+from utils.tool_executor import execute_tool_calls
+from utils.config import env_bool, env_int
+from utils.deadline import DeadlineExceeded, cap_timeout, deadline_scope, expires_at, remaining
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event):
+	"""
+	Format an agent event as a Server-Sent Events message.
+
+	Args:
+		event (dict): The event, with its kind under the "type" key.
+
+	Returns:
+		str: The SSE message.
+	"""
+	return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _create_response(openai_client, stream, deadline=None, **kwargs):
+	"""
+	Call the Responses API and yield its events.
+
+	When not streaming, a single "response.completed"-shaped event is yielded so
+	the caller can handle both modes the same way. With a deadline, the call is
+	cancelled (raising DeadlineExceeded) when it runs out.
+	"""
+	timeout = cap_timeout(None, deadline)
+	if timeout is not None:
+		# Also bounds the client's own connect/read timeouts
+		kwargs["timeout"] = timeout
+
+	try:
+		if not stream:
+			response = await asyncio.wait_for(openai_client.responses.create(**kwargs), timeout)
+			yield {"type": "response.completed", "response": response}
+			return
+
+		events = await asyncio.wait_for(openai_client.responses.create(stream=True, **kwargs), timeout)
+	except asyncio.TimeoutError:
+		raise DeadlineExceeded("Request deadline exceeded while waiting for the model")
+
+	finished = False
+	async for event in events:
+		if deadline is not None and remaining(deadline) <= 0:
+			raise DeadlineExceeded("Request deadline exceeded while streaming the model response")
+		if event.type == "response.output_text.delta":
+			yield {"type": "output_text.delta", "delta": event.delta}
+		elif event.type in ("response.completed", "response.incomplete"):
+			# An incomplete response (e.g. max_output_tokens reached) still carries its output, as without streaming
+			finished = True
+			yield {"type": "response.completed", "response": event.response}
+		elif event.type in ("response.failed", "error"):
+			raise RuntimeError(f"Model response failed: {event}")
+	if not finished:
+		raise RuntimeError("Model response stream ended without a final response")
+
+
+def _default_format_output(tool_call, result):
+	"""Send the result as-is (JSON-encoded unless it is already a string)."""
+	return json.dumps(result) if not isinstance(result, str) else result, None
+
+
+def _item_size(item):
+	"""Approximate size in characters of an input item (a message dict or an SDK output item)."""
+	if isinstance(item, dict):
+		return len(item.get("content") or item.get("output") or "") + 50
+	return len(getattr(item, "arguments", "") or "") + len(getattr(item, "name", "") or "") + 50
+
+
+def _compact(input_messages, outputs, threshold, keep_chars):
+	"""
+	Shorten older tool outputs in place until the conversation is under threshold characters.
+
+	outputs lists (function_call_output item, tool name) pairs of earlier rounds,
+	oldest first; compacted ones are removed from it. The latest round's outputs
+	are never passed in, so the model always sees them in full. Each compacted
+	output keeps its first keep_chars characters and a note saying what was left out.
+
+	Returns:
+		int: Number of outputs compacted.
+	"""
+	size = sum(_item_size(item) for item in input_messages)
+	compacted = 0
+	while outputs and size > threshold:
+		item, name = outputs.pop(0)
+		output = item["output"]
+		if len(output) <= keep_chars:
+			continue
+		item["output"] = (
+			output[0:keep_chars]
+			+ f"… [{len(output) - keep_chars} more characters of this {name} result omitted to save space;"
+			+ " call the tool again if you need them]"
+		)
+		size -= len(output) - len(item["output"])
+		compacted += 1
+	return compacted
+
+
+def _plain_item(item):
+	"""An input item as plain JSON-serializable data (SDK output items are converted to dicts)."""
+	if isinstance(item, dict):
+		return item
+	if hasattr(item, "to_dict"):
+		return item.to_dict()
+	return item.model_dump(exclude_none=True)
+
+
+def _chaining_unsupported(error):
+	"""Whether an API error means previous_response_id can't be used (e.g. responses aren't stored)."""
+	return getattr(error, "status_code", None) in (400, 404)
+
+
+async def run_agent(openai_client, message, tools, execute, model="gpt-4o", stream=False, deadline=None, max_rounds=None,
+		format_output=None, chain=None, compact_threshold=None, checkpoints=False, resume=None):
+	"""
+	Run the tool-calling loop for a user message.
+
+	Args:
+		openai_client: An AsyncOpenAI client.
+		message (str): The user message.
+		tools (list): The tool definitions available to the model.
+		execute: Async callable executing a single function_call item.
+		model (str): The model to use.
+		stream (bool): Stream output text deltas from the model.
+		deadline (float, optional): Time budget in seconds for the whole loop. Model
+			calls and tool calls get the time that is left, and are cancelled when
+			it runs out (tools then return {"error": ...} results).
+		max_rounds (int, optional): Maximum number of model calls. The last round
+			doesn't offer tools, so the model has to answer in text.
+		format_output (callable, optional): Called as format_output(tool_call, result),
+			returns the output string sent to the model and a dict of size info (or None).
+			Defaults to sending the JSON-encoded result.
+		chain (bool, optional): Chain rounds with previous_response_id, sending only the
+			new tool outputs instead of the whole conversation. Falls back to resending
+			the conversation if the API refuses. Defaults to POWERUPS_CHAIN_RESPONSES (on).
+		compact_threshold (int, optional): When resending the conversation, older tool
+			outputs are shortened once it is larger than this many characters.
+			Defaults to POWERUPS_COMPACT_THRESHOLD (50000). Use 0 to disable.
+		checkpoints (bool, optional): Yield a round.completed event with a JSON-serializable
+			checkpoint after every round that ran tools.
+		resume (dict, optional): A checkpoint from an earlier, interrupted run of the same
+			message; the loop picks up after that round instead of starting over.
+
+	Yields:
+		dict: Events, in order:
+			- {"type": "round.started", "round": n}
+			- {"type": "output_text.delta", "delta": str} (streaming only)
+			- {"type": "tool_call.started", "call_id", "name", "arguments"}
+			- {"type": "tool_call.finished", "call_id", "name", "result"}
+			- {"type": "round.completed", "round": n, "checkpoint": dict} (with checkpoints only)
+			- {"type": "response.done", "response": str, "tool_calls_executed": list, "metadata": dict}
+
+	Raises:
+		DeadlineExceeded: If the deadline passes before the model has answered.
+	"""
+	# Initialize conversation with user message
+	input_messages = [{"role": "user", "content": message}]
+	tool_calls_executed = []
+	tool_outputs = []
+	round_stats = []
+	round_number = 0
+	format_output = format_output or _default_format_output
+	request_deadline = expires_at(deadline)
+	if chain is None:
+		chain = env_bool("POWERUPS_CHAIN_RESPONSES", True)
+	if compact_threshold is None:
+		compact_threshold = env_int("POWERUPS_COMPACT_THRESHOLD", 50000)
+	compact_keep_chars = env_int("POWERUPS_COMPACT_KEEP_CHARS", 500)
+
+	# The tool outputs added since the last response (all a chained request sends),
+	# and those of earlier rounds, which may be compacted when resending
+	new_items = []
+	latest_outputs = []
+	earlier_outputs = []
+	previous_response_id = None
+
+	if resume:
+		# Pick up after the last completed round of an interrupted run
+		round_number = resume["round"]
+		previous_response_id = resume.get("previous_response_id")
+		input_messages = resume["input_messages"]
+		tool_calls_executed = resume["tool_calls_executed"]
+		tool_outputs = resume["tool_outputs"]
+		round_stats = resume["round_stats"]
+		names = {item.get("call_id"): item.get("name") for item in input_messages if item.get("type") == "function_call"}
+		outputs = {item["call_id"]: item for item in input_messages if item.get("type") == "function_call_output"}
+		latest_outputs = [(outputs[call_id], names.get(call_id)) for call_id in resume["latest_call_ids"]]
+		earlier_outputs = [(outputs[call_id], names.get(call_id)) for call_id in resume["earlier_call_ids"]]
+		new_items = [item for item, name in latest_outputs]
+
+	# Continue processing until we get a text response (no more tool calls)
+	while True:
+		round_number += 1
+		last_round = bool(max_rounds) and round_number >= max_rounds
+		yield {"type": "round.started", "round": round_number}
+
+		# Call the model: chained to the previous response, or with the (compacted) conversation
+		response = None
+		for attempt in range(2):
+			request = {"model": model, "tools": tools}
+			if last_round:
+				request["tool_choice"] = "none"
+			compacted = 0
+			if chain and previous_response_id:
+				request["previous_response_id"] = previous_response_id
+				request["input"] = new_items
+			else:
+				if compact_threshold:
+					compacted = _compact(input_messages, earlier_outputs, compact_threshold, compact_keep_chars)
+				request["input"] = input_messages
+			request_chars = sum(_item_size(item) for item in request["input"])
+
+			started = time.perf_counter()
+			emitted = False
+			try:
+				with span("model_round", model):
+					async for event in _create_response(openai_client, stream, deadline=request_deadline, **request):
+						if event["type"] == "response.completed":
+							response = event["response"]
+						else:
+							emitted = True
+							yield event
+				break
+			except Exception as e:
+				if attempt == 0 and "previous_response_id" in request and not emitted and _chaining_unsupported(e):
+					logger.warning("Response chaining unavailable, resending the conversation instead: %s", e)
+					chain = False
+					continue
+				raise
+
+		latency = time.perf_counter() - started
+		round_stats.append({
+			"round": round_number,
+			"chained": "previous_response_id" in request,
+			"input_items": len(request["input"]),
+			"request_chars": request_chars,
+			"compacted_outputs": compacted,
+			"latency_seconds": round(latency, 3)
+		})
+		logger.info(
+			"Agent round %d: %s request of %d items (%d chars, %d outputs compacted) took %.3fs",
+			round_number, "chained" if "previous_response_id" in request else "full", len(request["input"]),
+			request_chars, compacted, latency
+		)
+		previous_response_id = getattr(response, "id", None)
+
+		# Collect the tool calls requested in this turn
+		tool_calls = [item for item in response.output if item.type == "function_call"]
+
+		# If no tool calls were made (or we're out of rounds), we have our final text response
+		if not tool_calls or last_round:
+			break
+
+		# Execute them concurrently, forwarding start/finish events as they happen
+		events = asyncio.Queue()
+
+		def on_start(index, tool_call):
+			events.put_nowait({
+				"type": "tool_call.started",
+				"call_id": tool_call.call_id,
+				"name": tool_call.name,
+				"arguments": tool_call.arguments
+			})
+
+		def on_finish(index, tool_call, result):
+			events.put_nowait({
+				"type": "tool_call.finished",
+				"call_id": tool_call.call_id,
+				"name": tool_call.name,
+				"result": result
+			})
+
+		# The tool calls (and everything they start) see the request deadline
+		with deadline_scope(request_deadline):
+			task = asyncio.ensure_future(execute_tool_calls(tool_calls, execute, on_start=on_start, on_finish=on_finish))
+		try:
+			while not (task.done() and events.empty()):
+				getter = asyncio.ensure_future(events.get())
+				await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+				if getter.done():
+					yield getter.result()
+				else:
+					getter.cancel()
+			# Results come back in the original order
+			results = task.result()
+		finally:
+			if not task.done():
+				task.cancel()
+
+		# The last round's outputs become compactable; this round's are sent in full
+		earlier_outputs.extend(latest_outputs)
+		latest_outputs = []
+		new_items = []
+		for tool_call, result in zip(tool_calls, results):
+			# Track executed tool calls for response
+			tool_calls_executed.append({
+				"name": tool_call.name,
+				"arguments": json.loads(tool_call.arguments),
+				"result": result
+			})
+
+			# Add the function call and result to messages
+			output, size = format_output(tool_call, result)
+			if size is not None:
+				tool_outputs.append(dict(size, call_id=tool_call.call_id, name=tool_call.name))
+			output_item = {
+				"type": "function_call_output",
+				"call_id": tool_call.call_id,
+				"output": output
+			}
+			input_messages.append(tool_call)
+			input_messages.append(output_item)
+			new_items.append(output_item)
+			latest_outputs.append((output_item, tool_call.name))
+
+		if checkpoints:
+			yield {
+				"type": "round.completed",
+				"round": round_number,
+				"checkpoint": {
+					"round": round_number,
+					"previous_response_id": previous_response_id if chain else None,
+					"input_messages": [_plain_item(item) for item in input_messages],
+					"latest_call_ids": [item["call_id"] for item, name in latest_outputs],
+					"earlier_call_ids": [item["call_id"] for item, name in earlier_outputs],
+					"tool_calls_executed": tool_calls_executed,
+					"tool_outputs": tool_outputs,
+					"round_stats": round_stats
+				}
+			}
+
+	yield {
+		"type": "response.done",
+		"response": response.output_text,
+		"tool_calls_executed": tool_calls_executed,
+		"metadata": {
+			"rounds": round_number,
+			"tool_output_tokens_before": sum(size["tokens_before"] for size in tool_outputs),
+			"tool_output_tokens_after": sum(size["tokens_after"] for size in tool_outputs),
+			"tool_output_chars_before": sum(size["chars_before"] for size in tool_outputs),
+			"tool_output_chars_after": sum(size["chars_after"] for size in tool_outputs),
+			"tool_outputs": tool_outputs,
+			"round_stats": round_stats
+		}
+	}
@@ -1,53 +1,28 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import json
 import asyncio
 from internet.search.tools import google_search
 from internet.browse.tools import get_website_url_content
-from utils.tool_decorator import get_tool_definition, create_tools_list
+from utils.tool_decorator import get_tool_definition, create_tools_list, dispatch_tool_call, TOOL_REGISTRY
+from utils.background_loop import run_sync
 import os
 
-# Initialize OpenAI client
+# Initialize OpenAI clients (the async one is used on the background loop, so model calls don't block it)
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 async def execute_tool_call_async(tool_call):
-    """Execute a tool call based on the name and arguments, supporting async functions"""
-    name = tool_call.name
-    args = json.loads(tool_call.arguments)
-    
-    if name == "google_search":
-        query = args.get("query")
-        api_key = os.getenv("GOOGLE_CONSTELLA_API_KEY")
-        search_id = os.getenv("GOOGLE_SEARCH_CX_ID")
-        return google_search(query, api_key, search_id)
-    
-    elif name == "get_website_url_content":
-        url = args.get("url")
-        ignore_links = args.get("ignore_links", False)
-        max_length = args.get("max_length", None)
-        # Call the async function and await its result
-        result = await get_website_url_content(url, ignore_links, max_length)
-        return result
-    
-    return {"error": f"Unknown tool: {name}"}
+    """Execute a tool call through the tool registry, supporting async functions"""
+    return await dispatch_tool_call(tool_call.name, tool_call.arguments)
 
 def execute_tool_call(tool_call):
-    """Execute a tool call, running async functions in an event loop if needed"""
-    name = tool_call.name
-    
-    if name == "get_website_url_content":
-        # For async functions, run them in an event loop
-        return asyncio.run(execute_tool_call_async(tool_call))
-    else:
-        # For synchronous functions
-        args = json.loads(tool_call.arguments)
-        
-        if name == "google_search":
-            query = args.get("query")
-            api_key = os.getenv("GOOGLE_CONSTELLA_API_KEY")
-            search_id = os.getenv("GOOGLE_SEARCH_CX_ID")
-            return google_search(query, api_key, search_id)
-        
-        return {"error": f"Unknown tool: {name}"}
+    """Execute a tool call, running async functions on the shared background loop if needed"""
+    registered = TOOL_REGISTRY.get(tool_call.name)
+    if registered is not None and not registered.is_async:
+        # Synchronous tools are called directly
+        return registered.call_sync(tool_call.arguments)
+    # Async functions run on the long-lived background loop, reusing its pooled connections
+    return run_sync(execute_tool_call_async(tool_call))
 
 async def browse_and_analyze_async(url, question, ignore_links=False, max_length=None):
     """
@@ -66,7 +41,7 @@ async def browse_and_analyze_async(url, question, ignore_links=False, max_length
     tools = [get_tool_definition(get_website_url_content)]
     
     # First call to get tool execution request
-    response = openai_client.responses.create(
+    response = await async_openai_client.responses.create(
         model="gpt-4o",
         input=[{"role": "user", "content": f"Please fetch and analyze the content from this URL: {url}. {question}"}],
         tools=tools
@@ -91,7 +66,7 @@ async def browse_and_analyze_async(url, question, ignore_links=False, max_length
         })
     
     # Get the final response with analysis
-    final_response = openai_client.responses.create(
+    final_response = await async_openai_client.responses.create(
         model="gpt-4o",
         input=input_messages,
         tools=tools
@@ -100,8 +75,37 @@ async def browse_and_analyze_async(url, question, ignore_links=False, max_length
     return final_response.output_text
 
 def browse_and_analyze(url, question, ignore_links=False, max_length=None):
-    """Wrapper to run the async function"""
-    return asyncio.run(browse_and_analyze_async(url, question, ignore_links, max_length))
+    """Wrapper running the async function on the shared background loop"""
+    return run_sync(browse_and_analyze_async(url, question, ignore_links, max_length))
+
+async def browse_and_analyze_many_async(urls, question, ignore_links=False, max_length=None, concurrency=8):
+    """
+    Browse and analyze several URLs concurrently
+    
+    Args:
+        urls: The URLs to browse
+        question: What question to answer about each webpage
+        ignore_links: Whether to ignore links in the pages
+        max_length: Maximum length of content to return
+        concurrency: How many URLs are processed at once
+        
+    Returns:
+        The analysis of each URL, in the order given; a URL that failed gets {"error": ...}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def analyze(url):
+        async with semaphore:
+            try:
+                return await browse_and_analyze_async(url, question, ignore_links, max_length)
+            except Exception as e:
+                return {"error": f"Error analyzing {url}: {str(e)}"}
+    
+    return await asyncio.gather(*(analyze(url) for url in urls))
+
+def browse_and_analyze_many(urls, question, ignore_links=False, max_length=None, concurrency=8):
+    """Synchronous browse_and_analyze_many_async, for batch scripts (one shared loop and connection pool for every URL)"""
+    return run_sync(browse_and_analyze_many_async(urls, question, ignore_links, max_length, concurrency))
 
 def test_browse_tool(url, question, ignore_links=False, max_length=10000):
     """
@@ -121,7 +125,7 @@ def test_browse_tool(url, question, ignore_links=False, max_length=10000):
     print("-" * 50)
     
     # First get the raw content
-    raw_content = asyncio.run(get_website_url_content(url, ignore_links, max_length))
+    raw_content = run_sync(get_website_url_content(url, ignore_links, max_length))
     
     print("RAW CONTENT PREVIEW:")
     if isinstance(raw_content, dict) and "error" in raw_content:
@@ -0,0 +1,207 @@
+"""
+What a fetched body is, and how to turn it into text.
+
+The first bytes of a response (with its Content-Type) decide how it is handled:
+HTML goes to html2text, plain text (and JSON, XML, CSV, markdown) is used
+nearly as-is, PDFs go to pypdf, and anything else (images, archives, media,
+executables) is rejected before the rest of the body is downloaded. Text bodies
+are decoded incrementally with the charset from the header, a BOM or a <meta>
+tag, so the whole body is never held as bytes.
+
+PDF extraction needs the optional pypdf package; without it PDFs are rejected.
+"""
+import codecs
+import io
+import re
+
+try:
+	import pypdf
+except ImportError:
+	pypdf = None
+
+HTML = "html"
+TEXT = "text"
+PDF = "pdf"
+
+# Bytes inspected before deciding what a body is (enough for magic numbers and a <meta charset>)
+SNIFF_BYTES = 1024
+
+PDF_SUPPORTED = pypdf is not None
+
+_HTML_TYPES = ("text/html", "application/xhtml+xml")
+_TEXT_TYPES = ("application/json", "application/xml", "application/ld+json", "application/rss+xml",
+	"application/atom+xml", "application/javascript", "application/x-ndjson")
+_BINARY_TYPE_PREFIXES = ("image/", "audio/", "video/", "font/", "model/")
+_BINARY_TYPES = ("application/zip", "application/gzip", "application/x-gzip", "application/x-tar",
+	"application/x-7z-compressed", "application/x-rar-compressed", "application/vnd.rar", "application/x-bzip2",
+	"application/x-xz", "application/java-archive", "application/x-msdownload", "application/x-executable",
+	"application/wasm", "application/vnd.ms-excel", "application/msword", "application/vnd.ms-powerpoint",
+	"application/x-shockwave-flash")
+_BINARY_TYPE_PARTS = ("officedocument", "opendocument", "vnd.android.package")
+
+# Magic numbers of formats we can't read, checked at the start of the body
+_BINARY_MAGIC = (
+	(b"\x89PNG\r\n\x1a\n", "PNG image"),
+	(b"\xff\xd8\xff", "JPEG image"),
+	(b"GIF87a", "GIF image"),
+	(b"GIF89a", "GIF image"),
+	(b"II*\x00", "TIFF image"),
+	(b"MM\x00*", "TIFF image"),
+	(b"\x00\x00\x01\x00", "icon"),
+	(b"PK\x03\x04", "ZIP archive or Office document"),
+	(b"\x1f\x8b", "gzip archive"),
+	(b"BZh", "bzip2 archive"),
+	(b"\xfd7zXZ\x00", "xz archive"),
+	(b"7z\xbc\xaf\x27\x1c", "7z archive"),
+	(b"Rar!\x1a\x07", "RAR archive"),
+	(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "legacy Office document"),
+	(b"\x7fELF", "executable"),
+	(b"\x00asm", "WebAssembly module"),
+	(b"ID3", "MP3 audio"),
+	(b"OggS", "Ogg media"),
+	(b"fLaC", "FLAC audio"),
+	(b"\x1aE\xdf\xa3", "Matroska/WebM video"),
+	(b"RIFF", "RIFF media (WebP, WAV or AVI)"),
+	(b"wOFF", "font"),
+	(b"wOF2", "font"),
+)
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_:.\-]+)""", re.IGNORECASE)
+
+# Labels browsers treat as windows-1252 (a superset that decodes the 0x80-0x9f range)
+_WINDOWS_1252_LABELS = ("iso-8859-1", "iso8859-1", "latin-1", "latin1", "l1", "ascii", "us-ascii")
+
+
+class UnsupportedContent(Exception):
+	"""Raised when a body is something we can't turn into text (an image, an archive, a too-large PDF)."""
+
+
+def _media_type(content_type):
+	return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def reject_by_header(content_type):
+	"""
+	Reject a response from its Content-Type alone, before reading any of the body.
+
+	Raises:
+		UnsupportedContent: For image, audio, video, font, archive and executable types,
+		and for PDFs when pypdf is not installed.
+	"""
+	media_type = _media_type(content_type)
+	if media_type.startswith(_BINARY_TYPE_PREFIXES) or media_type in _BINARY_TYPES or any(part in media_type for part in _BINARY_TYPE_PARTS):
+		raise UnsupportedContent(f"{media_type} content is not supported")
+	if media_type == "application/pdf" and not PDF_SUPPORTED:
+		raise UnsupportedContent("PDF extraction is not available (pypdf is not installed)")
+
+
+def sniff(content_type, head):
+	"""
+	Decide what a body is from its Content-Type and first bytes.
+
+	Magic numbers win over the header, since servers often send a generic or wrong type.
+
+	Args:
+		content_type (str): The Content-Type header, or None.
+		head (bytes): The first bytes of the body (SNIFF_BYTES or all of it, if shorter).
+
+	Returns:
+		str: HTML, TEXT or PDF.
+
+	Raises:
+		UnsupportedContent: If the body is a format we can't read.
+	"""
+	if head.lstrip(b"\xef\xbb\xbf\r\n\t ").startswith(b"%PDF-"):
+		if not PDF_SUPPORTED:
+			raise UnsupportedContent("PDF extraction is not available (pypdf is not installed)")
+		return PDF
+	for magic, description in _BINARY_MAGIC:
+		if head.startswith(magic):
+			raise UnsupportedContent(f"{description} content is not supported")
+	if head[4:8] == b"ftyp":
+		raise UnsupportedContent("MP4/QuickTime media content is not supported")
+
+	reject_by_header(content_type)
+	media_type = _media_type(content_type)
+	if media_type == "application/pdf":
+		return PDF
+	if media_type in _HTML_TYPES:
+		return HTML
+	if media_type.startswith("text/") or media_type in _TEXT_TYPES or media_type.endswith(("+json", "+xml")):
+		return TEXT
+
+	# No (or a generic) type: text has no NUL bytes, at least in UTF-8 and legacy encodings
+	if b"\x00" in head and not head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+		raise UnsupportedContent(f"binary content ({media_type or 'no content type'}) is not supported")
+	start = head.lstrip(b"\xef\xbb\xbf\r\n\t ")[0:64].lower()
+	return HTML if start.startswith(b"<") else TEXT
+
+
+def charset(content_type, head):
+	"""
+	The charset of a text body: from the Content-Type header, a BOM or a <meta> tag in the first bytes, else UTF-8.
+
+	Returns:
+		str: A codec name Python knows.
+	"""
+	candidates = []
+	for param in (content_type or "").split(";")[1:]:
+		name, _, value = param.partition("=")
+		if name.strip().lower() == "charset":
+			candidates.append(value.strip().strip("\"'"))
+	if head.startswith(codecs.BOM_UTF8):
+		candidates.insert(0, "utf-8-sig")
+	elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+		candidates.insert(0, "utf-16")
+	match = _META_CHARSET.search(head)
+	if match:
+		candidates.append(match.group(1).decode("ascii", "replace"))
+
+	for candidate in candidates:
+		label = candidate.lower()
+		if label in _WINDOWS_1252_LABELS:
+			return "cp1252"
+		try:
+			return codecs.lookup(label).name
+		except LookupError:
+			continue
+	return "utf-8"
+
+
+def incremental_decoder(content_type, head):
+	"""An incremental decoder for a text body (undecodable bytes become U+FFFD instead of failing)."""
+	return codecs.getincrementaldecoder(charset(content_type, head))(errors="replace")
+
+
+def pdf_to_text(data, max_length=None):
+	"""
+	Extract the text of a PDF, page by page (a module-level function, so it can run in a process pool).
+
+	Args:
+		data (bytes): The PDF file.
+		max_length (int): Stop after the page where the text reaches this many characters.
+
+	Returns:
+		str: The text of each page, separated by blank lines.
+	"""
+	reader = pypdf.PdfReader(io.BytesIO(data))
+	parts = []
+	length = 0
+	for page in reader.pages:
+		text = (page.extract_text() or "").strip()
+		if text:
+			parts.append(text)
+			length += len(text) + 2
+		if max_length and length >= max_length:
+			break
+	return "\n\n".join(parts)
+
+
+def plain_text_to_text(text):
+	"""
+	Tidy a plain text body: unify line endings, drop control characters and trailing spaces, collapse runs of blank lines.
+	"""
+	text = text.replace("\r\n", "\n").replace("\r", "\n")
+	text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]", "", text)
+	text = re.sub(r"[ \t]+\n", "\n", text)
+	return re.sub(r"\n{3,}", "\n\n", text).strip()
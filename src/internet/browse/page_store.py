@@ -0,0 +1,260 @@
+"""
+Disk-backed page cache for get_website_url_content, shared by every worker on a host.
+
+Pages are kept in a SQLite database in WAL mode, so several uvicorn workers can
+read and write the same file concurrently. Each page stores the raw HTML with its
+ETag/Last-Modified validators, and the html_to_text output per set of conversion
+options. Stale pages are revalidated with a conditional GET: a 304 reuses both
+the stored body and the stored conversion.
+"""
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from utils.config import env_bool, env_int, env_float
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+	url TEXT PRIMARY KEY,
+	etag TEXT,
+	last_modified TEXT,
+	html TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	validated_at REAL NOT NULL,
+	accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS texts (
+	url TEXT NOT NULL,
+	options TEXT NOT NULL,
+	text TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	PRIMARY KEY (url, options)
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+"""
+
+
+class PageStore:
+	"""
+	SQLite-backed store of fetched pages and their text conversions.
+
+	Args:
+		path (str): Database file. Every process using the same path shares the cache.
+		fresh_ttl (float): Seconds a page is served without revalidation.
+		max_age (float): Seconds after its last validation that a page is evicted.
+		max_bytes (int): Total size of stored HTML and text before LRU eviction.
+	"""
+
+	# Run an eviction pass at most this often (seconds)
+	EVICTION_INTERVAL = 60
+
+	def __init__(self, path, fresh_ttl=300, max_age=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+		self.path = path
+		self.fresh_ttl = fresh_ttl
+		self.max_age = max_age
+		self.max_bytes = max_bytes
+		self._lock = threading.Lock()
+		self._conn = None
+		self._last_eviction = 0.0
+		self._stats = {"fresh_hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "evicted_pages": 0, "errors": 0}
+
+	def _connection(self):
+		if self._conn is None:
+			conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			conn.executescript(_SCHEMA)
+			self._conn = conn
+		return self._conn
+
+	async def _run(self, func, *args):
+		"""Run a blocking database call in the default executor."""
+		loop = asyncio.get_running_loop()
+		try:
+			return await loop.run_in_executor(None, functools.partial(func, *args))
+		except sqlite3.Error as e:
+			# The cache is an optimization; a broken database must never fail a fetch
+			self._stats["errors"] += 1
+			logger.warning("Error in page store: %s", e)
+			return None
+
+	def _lookup(self, url, options):
+		with self._lock:
+			row = self._connection().execute(
+				"SELECT p.etag, p.last_modified, p.html, p.validated_at, t.text "
+				"FROM pages p LEFT JOIN texts t ON t.url = p.url AND t.options = ? "
+				"WHERE p.url = ?",
+				(options, url)
+			).fetchone()
+			if row is None:
+				self._stats["misses"] += 1
+				return None
+			etag, last_modified, html, validated_at, text = row
+			fresh = time.time() - validated_at < self.fresh_ttl
+			if fresh and text is not None:
+				self._stats["fresh_hits"] += 1
+				self._connection().execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+		return {
+			"etag": etag,
+			"last_modified": last_modified,
+			"html": html,
+			"text": text,
+			"fresh": fresh,
+		}
+
+	def _save(self, url, options, html, text, etag, last_modified):
+		now = time.time()
+		html_size = len(html.encode("utf-8"))
+		text_size = len(text.encode("utf-8"))
+		with self._lock:
+			conn = self._connection()
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				# A new body invalidates conversions made with other options
+				conn.execute("DELETE FROM texts WHERE url = ?", (url,))
+				conn.execute(
+					"INSERT OR REPLACE INTO pages (url, etag, last_modified, html, size, validated_at, accessed_at) "
+					"VALUES (?, ?, ?, ?, ?, ?, ?)",
+					(url, etag, last_modified, html, html_size, now, now)
+				)
+				conn.execute(
+					"INSERT OR REPLACE INTO texts (url, options, text, size) VALUES (?, ?, ?, ?)",
+					(url, options, text, text_size)
+				)
+				conn.execute("COMMIT")
+			except Exception:
+				conn.execute("ROLLBACK")
+				raise
+		self._stats["stores"] += 1
+		self._maybe_evict()
+
+	def _revalidated(self, url, options, text):
+		"""Mark a page as revalidated (304) and store a conversion made from its cached body."""
+		now = time.time()
+		with self._lock:
+			conn = self._connection()
+			conn.execute("UPDATE pages SET validated_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+			if text is not None:
+				conn.execute(
+					"INSERT OR REPLACE INTO texts (url, options, text, size) VALUES (?, ?, ?, ?)",
+					(url, options, text, len(text.encode("utf-8")))
+				)
+		self._stats["revalidated"] += 1
+
+	def _maybe_evict(self):
+		now = time.time()
+		if now - self._last_eviction < self.EVICTION_INTERVAL:
+			return
+		self._last_eviction = now
+		self._evict()
+
+	def _evict(self):
+		"""Drop pages past max_age, then least recently used pages until under max_bytes."""
+		with self._lock:
+			conn = self._connection()
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				expired = conn.execute(
+					"SELECT url FROM pages WHERE validated_at < ?", (time.time() - self.max_age,)
+				).fetchall()
+				evict = [url for (url,) in expired]
+				for url in evict:
+					conn.execute("DELETE FROM texts WHERE url = ?", (url,))
+					conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+				total = conn.execute(
+					"SELECT (SELECT COALESCE(SUM(size), 0) FROM pages) + (SELECT COALESCE(SUM(size), 0) FROM texts)"
+				).fetchone()[0]
+				if total > self.max_bytes:
+					rows = conn.execute(
+						"SELECT p.url, p.size + COALESCE((SELECT SUM(size) FROM texts t WHERE t.url = p.url), 0) "
+						"FROM pages p ORDER BY p.accessed_at"
+					).fetchall()
+					for url, size in rows:
+						if total <= self.max_bytes:
+							break
+						conn.execute("DELETE FROM texts WHERE url = ?", (url,))
+						conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+						evict.append(url)
+						total -= size
+				conn.execute("COMMIT")
+			except Exception:
+				conn.execute("ROLLBACK")
+				raise
+		self._stats["evicted_pages"] += len(evict)
+
+	async def lookup(self, url, options):
+		"""
+		Look up a page and its conversion for the given options.
+
+		Args:
+			url (str): The page URL.
+			options (str): Key describing the html_to_text options.
+
+		Returns:
+			dict: etag, last_modified, html, text (None if not converted with these
+			options yet) and fresh (no revalidation needed), or None if not cached.
+		"""
+		return await self._run(self._lookup, url, options)
+
+	async def save(self, url, options, html, text, etag=None, last_modified=None):
+		"""Store a freshly downloaded page and its conversion."""
+		await self._run(self._save, url, options, html, text, etag, last_modified)
+
+	async def revalidated(self, url, options, text=None):
+		"""Record a 304 for a page, optionally storing a new conversion of its cached body."""
+		await self._run(self._revalidated, url, options, text)
+
+	async def evict(self):
+		"""Run an eviction pass now."""
+		await self._run(self._evict)
+
+	def close(self):
+		with self._lock:
+			if self._conn is not None:
+				self._conn.close()
+				self._conn = None
+
+	def stats(self):
+		"""
+		Page cache counters.
+
+		Returns:
+			dict: Hit, revalidation, miss, store and eviction counts plus configuration.
+		"""
+		stats = dict(self._stats)
+		stats["path"] = self.path
+		stats["fresh_ttl"] = self.fresh_ttl
+		stats["max_age"] = self.max_age
+		stats["max_bytes"] = self.max_bytes
+		return stats
+
+
+_store = None
+
+def get_page_store():
+	"""
+	Get the process-wide page store, or None if disabled with POWERUPS_PAGE_CACHE=0.
+
+	Settings:
+		POWERUPS_PAGE_CACHE_PATH: Database file (default: powerups_page_cache.sqlite3 in the temp dir).
+		POWERUPS_PAGE_CACHE_FRESH_TTL: Seconds served without revalidation (default 300).
+		POWERUPS_PAGE_CACHE_MAX_AGE: Seconds before a page is evicted (default 7 days).
+		POWERUPS_PAGE_CACHE_MAX_BYTES: Size budget for stored pages (default 256 MB).
+	"""
+	global _store
+	if _store is None and env_bool("POWERUPS_PAGE_CACHE", True):
+		_store = PageStore(
+			path=os.getenv("POWERUPS_PAGE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "powerups_page_cache.sqlite3"),
+			fresh_ttl=env_float("POWERUPS_PAGE_CACHE_FRESH_TTL", 300),
+			max_age=env_float("POWERUPS_PAGE_CACHE_MAX_AGE", 7 * 24 * 3600),
+			max_bytes=env_int("POWERUPS_PAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+		)
+	return _store
@@ -0,0 +1,254 @@
+"""
+Speculative prefetch of pages the model is likely to open next.
+
+After a search the model usually browses one of the top results, a full model
+round trip later. With prefetch enabled, the top result links are fetched and
+converted in the background as soon as the search returns, and held in a store
+that lives as long as the request; the browse call then joins the prefetch
+(finished or still in flight) instead of starting its own fetch.
+
+Prefetch is off unless POWERUPS_PREFETCH_TOP_N is set. Each request may spend
+up to POWERUPS_PREFETCH_MAX_BYTES on it: a prefetch reserves its share of that
+budget when it starts and downloads no more than the share. Pages are only
+converted up to POWERUPS_PREFETCH_MAX_LENGTH characters, so a browse call asking
+for more of a long (or byte-capped) page fetches it again. Hit rate and the bytes fetched but never used are
+reported by prefetch_stats(), so N can be tuned.
+"""
+import asyncio
+import contextlib
+import contextvars
+import time
+
+from utils.config import env_int, env_float
+from utils.tool_decorator import TOOL_CALL_COALESCING
+from utils.urls import canonicalize_url
+
+# Result links prefetched per search (0 turns prefetch off)
+PREFETCH_TOP_N = env_int("POWERUPS_PREFETCH_TOP_N", 0)
+
+# Bytes a single request may download speculatively
+PREFETCH_MAX_BYTES = env_int("POWERUPS_PREFETCH_MAX_BYTES", 4 * 1024 * 1024)
+
+# Characters of text prefetched per page (0 for whole pages, which costs far more to convert)
+PREFETCH_MAX_LENGTH = env_int("POWERUPS_PREFETCH_MAX_LENGTH", 20000)
+
+# Seconds a prefetched page may be served for
+PREFETCH_TTL = env_float("POWERUPS_PREFETCH_TTL", 60)
+
+_store = contextvars.ContextVar("powerups_prefetch_store", default=None)
+
+# A browse call shared by several requests may still use the first one's prefetched pages
+TOOL_CALL_COALESCING.share_context_var(_store)
+
+_stats = {
+	"requests": 0,
+	"scheduled": 0,
+	"skipped_budget": 0,
+	"failed": 0,
+	"cancelled": 0,
+	"hits": 0,
+	"hits_in_flight": 0,
+	"misses": 0,
+	"too_short": 0,
+	"expired": 0,
+	"bytes_fetched": 0,
+	"bytes_used": 0,
+	"bytes_wasted": 0,
+}
+
+
+class _Entry:
+	__slots__ = ("task", "started_at", "used")
+
+	def __init__(self, task):
+		self.task = task
+		self.started_at = time.monotonic()
+		self.used = False
+
+
+class PrefetchStore:
+	"""
+	The pages prefetched for one request.
+
+	Args:
+		max_bytes (int): Download budget for the request's prefetches.
+		max_length (int): Characters of text pages are prefetched with (0 for whole pages).
+		ttl (float): Seconds after which a prefetched page is no longer served.
+	"""
+
+	def __init__(self, max_bytes=PREFETCH_MAX_BYTES, max_length=PREFETCH_MAX_LENGTH, ttl=PREFETCH_TTL):
+		self.max_bytes = max_bytes
+		self.max_length = max_length
+		self.ttl = ttl
+		self.bytes_fetched = 0
+		# Budget held by prefetches in flight plus bytes downloaded by finished ones
+		self.bytes_reserved = 0
+		self._entries = {}
+
+	def schedule(self, url, fetch):
+		"""
+		Start fetching url in the background, unless it is already prefetched or the budget is spent.
+
+		Args:
+			url (str): The page to prefetch.
+			fetch: Coroutine function called with the url, max_length and max_bytes, returning a fetch_page result.
+
+		Returns:
+			bool: Whether a prefetch was started.
+		"""
+		key = canonicalize_url(url)
+		if key is None or key in self._entries:
+			return False
+		left = self.max_bytes - self.bytes_reserved
+		if left <= 0:
+			_stats["skipped_budget"] += 1
+			return False
+		# Reserve this page's share of the budget up front, so prefetches started together can't overrun it
+		reserved = min(left, max(1, self.max_bytes // max(1, PREFETCH_TOP_N)))
+		self.bytes_reserved += reserved
+
+		async def run():
+			# The prefetch itself must not find (and wait for) its own entry
+			_store.set(None)
+			used = 0
+			try:
+				page = await fetch(url, max_length=self.max_length or None, max_bytes=reserved)
+				if "error" in page:
+					_stats["failed"] += 1
+				else:
+					used = min(reserved, page.get("bytes", 0))
+					self.bytes_fetched += page.get("bytes", 0)
+					_stats["bytes_fetched"] += page.get("bytes", 0)
+				return page
+			finally:
+				# Give back the part of the reservation that wasn't downloaded
+				self.bytes_reserved -= reserved - used
+
+		self._entries[key] = _Entry(asyncio.ensure_future(run()))
+		_stats["scheduled"] += 1
+		return True
+
+	async def take(self, url, max_length=None):
+		"""
+		The prefetched page for url, waiting for it if it is still being fetched.
+
+		Args:
+			url (str): The page.
+			max_length (int): Characters of text needed (None for the whole page).
+
+		Returns:
+			dict: The fetch_page result, or None if url was not prefetched, has
+			expired, or was cut shorter than max_length.
+		"""
+		entry = self._entries.get(canonicalize_url(url))
+		if entry is None:
+			_stats["misses"] += 1
+			return None
+		if time.monotonic() - entry.started_at > self.ttl:
+			_stats["expired"] += 1
+			return None
+		if not entry.task.done():
+			_stats["hits_in_flight"] += 1
+		try:
+			# Shielded, so a caller timing out doesn't cancel the prefetch for other callers
+			page = await asyncio.shield(entry.task)
+		except asyncio.CancelledError:
+			if not entry.task.cancelled():
+				raise
+			# The prefetch was cancelled (its request ended): fetch normally
+			return None
+		except Exception:
+			return None
+		text = page.get("text") or ""
+		cut = page.get("complete") is False or (self.max_length and len(text) >= self.max_length)
+		if "error" not in page and cut and not (max_length and len(text) >= max_length):
+			# Cut off (at the prefetch length or byte share), and more is needed
+			_stats["too_short"] += 1
+			return None
+		_stats["hits"] += 1
+		if not entry.used and "error" not in page:
+			entry.used = True
+			_stats["bytes_used"] += page.get("bytes", 0)
+		return page
+
+	def close(self):
+		"""Cancel unfinished prefetches and count the bytes of pages that were never used."""
+		for entry in self._entries.values():
+			if not entry.task.done():
+				entry.task.cancel()
+				_stats["cancelled"] += 1
+			elif not entry.used and not entry.task.cancelled() and entry.task.exception() is None:
+				_stats["bytes_wasted"] += entry.task.result().get("bytes", 0)
+		self._entries.clear()
+
+
+@contextlib.contextmanager
+def prefetch_scope():
+	"""
+	Give the request running in this block (and the tasks it creates) its own prefetch store.
+
+	Does nothing when prefetch is disabled.
+	"""
+	if not PREFETCH_TOP_N:
+		yield None
+		return
+	store = PrefetchStore()
+	token = _store.set(store)
+	_stats["requests"] += 1
+	try:
+		yield store
+	finally:
+		store.close()
+		try:
+			_store.reset(token)
+		except ValueError:
+			# Left from another context (e.g. a streaming response closed elsewhere)
+			pass
+
+
+def current_prefetch_store():
+	"""The current request's prefetch store, or None."""
+	return _store.get()
+
+
+def prefetch(urls, fetch, top_n=None):
+	"""
+	Prefetch the first top_n of urls into the current request's store, if it has one.
+
+	Args:
+		urls (list): Candidate links, best first.
+		fetch: Coroutine function called with each url, a max_length and a max_bytes.
+		top_n (int): How many to prefetch. Defaults to POWERUPS_PREFETCH_TOP_N.
+
+	Returns:
+		int: The number of prefetches started.
+	"""
+	store = _store.get()
+	if store is None:
+		return 0
+	started = 0
+	for url in urls[0:top_n or PREFETCH_TOP_N]:
+		if isinstance(url, str) and url.startswith(("http://", "https://")) and store.schedule(url, fetch):
+			started += 1
+	return started
+
+
+def prefetch_stats():
+	"""
+	Prefetch counters since startup.
+
+	Returns:
+		dict: Prefetches scheduled, skipped for budget, failed and cancelled; hits
+		(and those that joined a fetch in flight), misses, pages cut too short and
+		expired entries among browse calls of prefetching requests; bytes fetched,
+		used and wasted; the hit rate, the share of bytes wasted, and the configuration.
+	"""
+	stats = dict(_stats)
+	lookups = stats["hits"] + stats["misses"] + stats["too_short"] + stats["expired"]
+	stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+	stats["wasted_ratio"] = round(stats["bytes_wasted"] / stats["bytes_fetched"], 3) if stats["bytes_fetched"] else 0.0
+	stats["top_n"] = PREFETCH_TOP_N
+	stats["max_bytes"] = PREFETCH_MAX_BYTES
+	stats["max_length"] = PREFETCH_MAX_LENGTH
+	stats["ttl"] = PREFETCH_TTL
+	return stats
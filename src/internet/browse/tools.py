@@ -9,8 +9,30 @@ from datetime import datetime
 import traceback
 import httpx
 import html2text
+from html2text.utils import pad_tables_in_text
 import os
+import logging
+import random
+import time
 from utils.tool_decorator import tool
+from utils.http_client import get_http_pool
+from utils.config import env_int, env_float, env_bool
+from utils.offload import CPUOffloader
+from utils.deadline import DeadlineExceeded, cap_timeout, remaining
+from utils.hedge import LatencyTracker
+from utils.circuit_breaker import CircuitBreakers, CircuitOpen
+from utils.cache import TTLCache
+from utils.urls import url_host
+from utils.passages import build_index
+from utils.metrics import REGISTRY, observe_span, span
+from internet.browse.page_store import get_page_store
+from internet.browse.prefetch import current_prefetch_store, prefetch
+from internet.browse.content import (
+	HTML, TEXT, PDF, SNIFF_BYTES, UnsupportedContent,
+	incremental_decoder, pdf_to_text, plain_text_to_text, reject_by_header, sniff
+)
+
+logger = logging.getLogger(__name__)
 
 def clean_results(results):
 	"""
@@ -47,10 +69,487 @@ def html_to_text(html,ignore_links=False,bypass_tables=False,ignore_images=True)
 	text.ignore_images = ignore_images
 	return text.handle(html,)
 
+# Large conversions run in a process pool so they don't stall the event loop
+CONVERT_POOL = CPUOffloader(
+	name="html_to_text",
+	executor=os.getenv("POWERUPS_CONVERT_EXECUTOR", "process"),
+	workers=env_int("POWERUPS_CONVERT_WORKERS", None),
+	inline_max_size=env_int("POWERUPS_CONVERT_INLINE_MAX", 64 * 1024),
+	offload_max_size=env_int("POWERUPS_CONVERT_OFFLOAD_MAX", 8 * 1024 * 1024)
+)
+
+async def html_to_text_async(html,ignore_links=False,bypass_tables=False,ignore_images=True):
+	'''
+	Same as html_to_text, but pages larger than POWERUPS_CONVERT_INLINE_MAX characters
+	are converted in CONVERT_POOL instead of on the event loop thread.
+	'''
+	return await CONVERT_POOL.run(html_to_text, html, ignore_links, bypass_tables, ignore_images, size=len(html))
+
+# Hard ceiling on the bytes downloaded for a single page
+MAX_PAGE_BYTES = env_int("POWERUPS_BROWSE_MAX_BYTES", 5 * 1024 * 1024)
+
+# Hard ceiling on the size of a PDF (which is only readable once downloaded in full)
+MAX_PDF_BYTES = env_int("POWERUPS_BROWSE_MAX_PDF_BYTES", 20 * 1024 * 1024)
+
+# Characters of HTML fed to a streaming conversion between length checks
+FEED_SLICE_SIZE = 8192
+
+# Timeout for a page fetch (per connect/read), capped by the request's remaining budget
+FETCH_TIMEOUT = env_float("POWERUPS_BROWSE_TIMEOUT", 5.0)
+
+# Hedged fetches: a fetch slower than the recent p95 gets a second attempt, and the first to finish wins
+HEDGE_FETCHES = env_bool("POWERUPS_HEDGE_FETCHES", False)
+FETCH_LATENCY = LatencyTracker(
+	name="fetch_page",
+	percentile=env_float("POWERUPS_HEDGE_PERCENTILE", 95),
+	min_delay=env_float("POWERUPS_HEDGE_MIN_DELAY", 0.05)
+)
+
+# Hosts that keep failing (connection errors, timeouts, 5xx) are not retried for a while
+HOST_BREAKERS = CircuitBreakers(
+	name="browse_hosts",
+	failure_threshold=env_int("POWERUPS_BREAKER_FAILURES", 5),
+	reset_timeout=env_float("POWERUPS_BREAKER_RESET_TIMEOUT", 30)
+)
+
+# URLs that just failed (DNS errors, timeouts, 4xx/5xx) answer from here for a short while
+FAILED_URLS = TTLCache(
+	maxsize=env_int("POWERUPS_BROWSE_FAILED_URLS_SIZE", 4096),
+	ttl=env_float("POWERUPS_BROWSE_FAILED_URL_TTL", 60),
+	negative_ttl=env_float("POWERUPS_BROWSE_FAILED_URL_TTL", 60),
+	name="failed_urls"
+)
+
+# Bytes downloaded by page fetches
+FETCH_BYTES = REGISTRY.counter("powerups_fetch_bytes_total", "Bytes downloaded by page fetches", ("kind",))
+
+# Fraction of page fetches whose converted text is logged at DEBUG (the log can't hold every page)
+LOG_SAMPLE_RATE = env_float("POWERUPS_LOG_SAMPLE_RATE", 0.01)
+LOG_SAMPLE_CHARS = 500
+
+# Passage indexes of recently queried pages, so follow-up questions skip fetching, converting and indexing
+PASSAGE_INDEXES = TTLCache(
+	maxsize=env_int("POWERUPS_PASSAGE_INDEX_CACHE_SIZE", 256),
+	ttl=env_float("POWERUPS_PASSAGE_INDEX_TTL", 600),
+	name="passage_indexes"
+)
+
+class StreamingHTML2Text(html2text.HTML2Text):
+	'''
+	HTML2Text that counts the characters it has produced while being fed, so a
+	streamed conversion can stop as soon as it has enough text. It also collects
+	the href of every link as it parses, so crawlers get the links from the same
+	pass that produces the text.
+	'''
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.produced = 0
+		self.links = []
+
+	def outtextf(self, s):
+		super().outtextf(s)
+		self.produced += len(s)
+
+	def handle_tag(self, tag, attrs, start):
+		if start and tag == "a" and attrs.get("href"):
+			self.links.append(attrs["href"])
+		super().handle_tag(tag, attrs, start)
+
+	def result(self):
+		'''
+		Flush the parser and return the text converted so far, post-processed
+		the same way as HTML2Text.handle.
+		'''
+		self.feed("")
+		markdown = self.optwrap(self.finish())
+		if self.pad_tables:
+			return pad_tables_in_text(markdown)
+		return markdown
+
+def html_to_text_with_links(html,ignore_links=False,bypass_tables=False,ignore_images=True):
+	'''
+	Convert html to text like html_to_text, and return the page's link targets
+	found during the same parse.
+	
+	Returns:
+		tuple: (text, links) where links is the list of raw href values, in page order.
+	'''
+	text = StreamingHTML2Text()
+	text.ignore_links = ignore_links
+	text.bypass_tables = bypass_tables
+	text.ignore_images = ignore_images
+	return text.handle(html), text.links
+
+async def html_to_text_with_links_async(html,ignore_links=False,bypass_tables=False,ignore_images=True):
+	'''
+	Same as html_to_text_with_links, converting large pages in CONVERT_POOL.
+	'''
+	return await CONVERT_POOL.run(html_to_text_with_links, html, ignore_links, bypass_tables, ignore_images, size=len(html))
+
+async def _fetch_page(url, headers, ignore_links=False, max_length=None, max_bytes=None):
+	'''
+	Stream a page through the shared client, converting it as it arrives when
+	max_length is set. The download stops early once enough text for max_length
+	has been produced or max_bytes have been read; leaving the stream early closes
+	the connection instead of downloading the rest of the body.
+	
+	The Content-Type and the first bytes decide how the body is handled (see
+	internet.browse.content): HTML and plain text are decoded incrementally in the
+	page's charset, PDFs are collected as bytes for extraction, and anything else is
+	rejected before the rest of it is downloaded. Error responses are not read.
+	
+	Args:
+		url (str): The URL to fetch.
+		headers (dict): Request headers.
+		ignore_links (bool): Ignore links in the converted text.
+		max_length (int): Characters of text needed. If None, the whole body is read.
+		max_bytes (int): Byte ceiling for the download. Defaults to POWERUPS_BROWSE_MAX_BYTES.
+	
+	Returns:
+		dict: url (after redirects), status_code, headers, bytes (downloaded), kind
+		(HTML, TEXT or PDF), html (the decoded part of the body that was read, None for
+		PDFs), data (the PDF file, or None), text (the streamed conversion, or None if
+		the page still needs converting) and complete (whether the whole body was read).
+	
+	Raises:
+		UnsupportedContent: If the body is not something that can be turned into text.
+	'''
+	# PDFs are only cut short at an explicit cap, as part of a PDF can't be read
+	pdf_max_bytes = max_bytes
+	max_bytes = max_bytes or MAX_PAGE_BYTES
+	target_length = None
+	if max_length:
+		# Stop a bit past max_length; the final line wrapping can shift the length slightly
+		target_length = max_length + max(256, max_length // 10)
+	
+	kind = None
+	decoder = None
+	converter = None
+	head = b""
+	chunks = []
+	pdf_data = bytearray()
+	produced = 0
+	complete = True
+	# Time spent in the streamed conversion, which runs on the event loop between reads
+	convert_seconds = 0.0
+	convert_status = "ok"
+	
+	def classify(response):
+		"""Decide what the body is from its first bytes, and set up its decoding."""
+		nonlocal kind, decoder, converter
+		content_type = response.headers.get("Content-Type")
+		kind = sniff(content_type, head)
+		if kind == PDF:
+			if int(response.headers.get("Content-Length") or 0) > MAX_PDF_BYTES:
+				raise UnsupportedContent(f"PDFs larger than {MAX_PDF_BYTES} bytes are not supported")
+			return
+		decoder = incremental_decoder(content_type, head)
+		if kind == HTML and target_length:
+			converter = StreamingHTML2Text()
+			converter.ignore_links = ignore_links
+			converter.ignore_images = True
+	
+	def consume(data, final=False):
+		"""Take in part of the body; returns True once enough text has been produced."""
+		nonlocal converter, produced, convert_seconds, convert_status
+		if kind == PDF:
+			pdf_data.extend(data)
+			if len(pdf_data) > MAX_PDF_BYTES:
+				raise UnsupportedContent(f"PDFs larger than {MAX_PDF_BYTES} bytes are not supported")
+			return False
+		chunk = decoder.decode(data, final)
+		chunks.append(chunk)
+		produced += len(chunk)
+		if converter is not None:
+			started = time.perf_counter()
+			try:
+				# Feed in small slices so conversion stops close to the target length
+				for start in range(0, len(chunk), FEED_SLICE_SIZE):
+					converter.feed(chunk[start:start + FEED_SLICE_SIZE])
+					if converter.produced >= target_length:
+						return True
+			except Exception as e:
+				# Fall back to converting the whole page afterwards
+				logger.warning("Error in streamed html_to_text for %s: %s", url, e)
+				converter = None
+				convert_status = "error"
+			finally:
+				convert_seconds += time.perf_counter() - started
+			return False
+		return kind == TEXT and bool(target_length) and produced >= target_length
+	
+	with span("http_fetch", "page") as fetch_span:
+		async with get_http_pool().stream("GET", url, headers=headers, timeout=cap_timeout(FETCH_TIMEOUT)) as response:
+			try:
+				if response.status_code != 304 and response.status_code < 400:
+					# Obvious binaries are turned away before any of the body is read
+					reject_by_header(response.headers.get("Content-Type"))
+					async for data in response.aiter_bytes():
+						if kind is None:
+							head += data
+							if len(head) < SNIFF_BYTES:
+								continue
+							classify(response)
+							data = head
+						cap = pdf_max_bytes if kind == PDF else max_bytes
+						if consume(data) or (cap and response.num_bytes_downloaded >= cap):
+							complete = False
+							break
+					else:
+						if kind is None:
+							# A body shorter than SNIFF_BYTES
+							classify(response)
+							consume(head)
+						consume(b"", final=True)
+			except UnsupportedContent:
+				fetch_span.status = "rejected"
+				raise
+			finally:
+				FETCH_BYTES.inc(response.num_bytes_downloaded, kind=kind or "rejected")
+		if response.status_code >= 400:
+			fetch_span.status = "error"
+	
+	text = None
+	if converter is not None:
+		started = time.perf_counter()
+		try:
+			text = converter.result()
+		except Exception as e:
+			logger.warning("Error in streamed html_to_text for %s: %s", url, e)
+			convert_status = "error"
+		convert_seconds += time.perf_counter() - started
+	if convert_seconds:
+		observe_span("html_to_text", "streamed", convert_seconds, convert_status)
+	return {
+		"url": str(response.url),
+		"status_code": response.status_code,
+		"headers": response.headers,
+		"bytes": response.num_bytes_downloaded,
+		"kind": kind or HTML,
+		"html": "".join(chunks) if kind != PDF else None,
+		"data": pdf_data if kind == PDF else None,
+		"text": text,
+		"complete": complete
+	}
+
+def _conversion_options(ignore_links):
+	'''
+	Key identifying the html_to_text options a cached conversion was made with.
+	'''
+	return f"ignore_links={bool(ignore_links)}"
+
+def _cache_headers(cached_page):
+	'''
+	Conditional request headers revalidating a cached page.
+	'''
+	headers = {}
+	if cached_page["etag"]:
+		headers['If-None-Match'] = cached_page["etag"]
+	if cached_page["last_modified"]:
+		headers['If-Modified-Since'] = cached_page["last_modified"]
+	return headers
+
+async def _convert(html, ignore_links, with_links):
+	'''
+	Convert a page off the event loop, returning (text, links or None).
+	'''
+	if with_links:
+		return await html_to_text_with_links_async(html, ignore_links=ignore_links)
+	return await html_to_text_async(html, ignore_links=ignore_links), None
+
+async def _extract(page, ignore_links, with_links, max_length=None):
+	'''
+	Turn a fetched body into text with the extractor for its kind, off the event loop,
+	returning (text, links or None). Only HTML pages have links.
+	'''
+	if page["kind"] == PDF:
+		# Even a small PDF can take long to parse, so it never runs on the event loop
+		text = await CONVERT_POOL.run(pdf_to_text, page["data"], max_length, size=len(page["data"]), inline=False)
+	elif page["kind"] == TEXT:
+		text = await CONVERT_POOL.run(plain_text_to_text, page["html"], size=len(page["html"]))
+	else:
+		return await _convert(page["html"], ignore_links, with_links)
+	return text, ([] if with_links else None)
+
+async def fetch_page(url, ignore_links=False, max_length=None, with_links=False, max_bytes=None):
+	'''
+	Fetch a page and convert it to text, going through the shared page cache and
+	the pooled HTTP client. This is the pipeline behind get_website_url_content,
+	also used by other powerups (e.g. the crawler).
+	
+	Args:
+		url (str): The URL to fetch.
+		ignore_links (bool): Ignore links in the text.
+		max_length (int): Characters of text needed; lets the download stop early.
+			Ignored when with_links is set, since links need the whole page.
+		with_links (bool): Also return the page's link targets, found in the same parse.
+		max_bytes (int): Download at most this many bytes. Defaults to POWERUPS_BROWSE_MAX_BYTES
+			(PDFs: POWERUPS_BROWSE_MAX_PDF_BYTES).
+	
+	Returns:
+		dict: url (final URL, for resolving relative links), text, links (list of raw
+		href values, or None without with_links), bytes (downloaded, 0 for cache hits)
+		and, for downloaded pages, complete (False if the download stopped early),
+		or {"error": ...} if the page could not be fetched.
+	'''
+	header = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36'}
+	url = str(url)
+	options = _conversion_options(ignore_links)
+	
+	# Pages prefetched for this request are fetched with links kept, as the model usually asks
+	prefetch_store = current_prefetch_store()
+	if prefetch_store is not None and not ignore_links and not with_links:
+		page = await prefetch_store.take(url, max_length)
+		if page is not None:
+			return page
+	
+	# Serve from the page cache shared by all workers; fresh pages need no request at all
+	store = get_page_store()
+	cached_page = await store.lookup(url, options) if store else None
+	if cached_page and cached_page["fresh"] and cached_page["text"] is not None:
+		if with_links:
+			out, links = await _convert(cached_page["html"], ignore_links, True)
+		else:
+			out, links = cached_page["text"], None
+		return {"url": url, "text": out, "links": links, "bytes": 0}
+	
+	# Fail fast on URLs that just failed, and on hosts that keep failing
+	failed = FAILED_URLS.get(url)
+	if failed is not None:
+		return failed
+	host = url_host(url)
+	try:
+		HOST_BREAKERS.before_request(host)
+	except CircuitOpen as e:
+		if cached_page and cached_page["text"] is not None and not with_links:
+			# A stale copy beats no answer while the host is down
+			return {"url": url, "text": cached_page["text"], "links": None, "bytes": 0}
+		return {"error": f"Error fetching the url {url}: {str(e)}"}
+	
+	request_headers = dict(header)
+	if cached_page:
+		request_headers.update(_cache_headers(cached_page))
+	
+	# Whether the request deadline cuts the fetch timeout short (a timeout then says nothing about the host)
+	left = remaining()
+	deadline_bound = left is not None and (not FETCH_TIMEOUT or left < FETCH_TIMEOUT)
+	
+	try:
+		# Stream through the app-wide pooled client; with max_length set the download
+		# stops as soon as enough text has been converted
+		def attempt():
+			return _fetch_page(url, request_headers, ignore_links=ignore_links, max_length=None if with_links else max_length, max_bytes=max_bytes)
+		if HEDGE_FETCHES:
+			page = await FETCH_LATENCY.run(attempt, max_delay=remaining())
+		else:
+			page = await attempt()
+	except DeadlineExceeded as e:
+		# Out of time, which says nothing about the host
+		return {"error": f"Error fetching the url {url}: {str(e)}"}
+	except UnsupportedContent as e:
+		# The host answered; the body just isn't something we can read
+		HOST_BREAKERS.record_success(host)
+		error = {"error": f"Error fetching the url {url}: {str(e)}"}
+		FAILED_URLS.set(url, error, negative=True)
+		return error
+	except Exception as e:
+		if deadline_bound and isinstance(e, httpx.TimeoutException):
+			# Out of time as well: neither counted against the host nor cached for the URL
+			return {"error": f"Error fetching the url {url}: Request deadline exceeded"}
+		logger.warning("Error in webscrape of %s: %s", url, e)
+		HOST_BREAKERS.record_failure(host)
+		error = {"error": f"Error fetching the url {url}: {str(e) or type(e).__name__}"}
+		FAILED_URLS.set(url, error, negative=True)
+		return error
+	
+	if page["status_code"] >= 500:
+		HOST_BREAKERS.record_failure(host)
+	else:
+		HOST_BREAKERS.record_success(host)
+	if page["status_code"] >= 400:
+		error = {"error": f"Error fetching the url {url}: HTTP {page['status_code']}"}
+		FAILED_URLS.set(url, error, negative=True)
+		return error
+	
+	if page["status_code"] == 304 and cached_page:
+		# Not modified: reuse the cached body and, when we have it, the cached conversion
+		out, links = cached_page["text"], None
+		if out is None or with_links:
+			out, links = await _convert(cached_page["html"], ignore_links, with_links)
+			await store.revalidated(url, options, out if cached_page["text"] is None else None)
+		else:
+			await store.revalidated(url, options)
+		return {"url": url, "text": out, "links": links, "bytes": page["bytes"]}
+	
+	if page["kind"] == PDF and not page["complete"]:
+		# Cut off at max_bytes, and part of a PDF can't be read
+		return {"url": page["url"], "text": "", "links": [] if with_links else None, "bytes": page["bytes"], "complete": False}
+	
+	try:
+		out, links = page["text"], None
+		if out is None:
+			out, links = await _extract(page, ignore_links, with_links, max_length=None if with_links else max_length)
+		# Only whole HTML pages go to the cache, not ones cut off early
+		if store and page["kind"] == HTML and page["complete"] and page["status_code"] == 200 and 'no-store' not in page["headers"].get('Cache-Control', ''):
+			await store.save(url, options, page["html"], out, page["headers"].get('ETag'), page["headers"].get('Last-Modified'))
+	except Exception as e:
+		logger.warning("Error in %s extraction for %s: %s", page["kind"], url, e)
+		if page["kind"] == PDF:
+			return {"error": f"Error extracting the text of the PDF at {url}: {str(e) or type(e).__name__}"}
+		out, links = page["html"], ([] if with_links else None)
+	return {"url": page["url"], "text": out, "links": links, "bytes": page["bytes"], "complete": page["complete"]}
+
+async def get_passage_index(url, ignore_links=False):
+	'''
+	Get the passage index of a page, fetching and indexing the whole page on a miss.
+	
+	Args:
+		url (str): The page URL.
+		ignore_links (bool): Ignore links in the indexed text.
+	
+	Returns:
+		BM25Index, or an {"error": ...} dict if the page could not be fetched.
+	'''
+	key = (str(url), bool(ignore_links))
+	index = PASSAGE_INDEXES.get(key)
+	if index is not None:
+		return index
+	
+	page = await fetch_page(url, ignore_links=ignore_links)
+	if "error" in page:
+		return page
+	# Indexing is CPU work like conversion, so large pages go to the same pool
+	index = await CONVERT_POOL.run(build_index, page["text"], size=len(page["text"]))
+	PASSAGE_INDEXES.set(key, index)
+	return index
+
+def prefetch_pages(urls):
+	'''
+	Start fetching the first POWERUPS_PREFETCH_TOP_N of urls for the current request
+	(if prefetch is enabled), so a following get_website_url_content call finds them ready.
+	'''
+	return prefetch(urls, fetch_page)
+
+def format_passages(index, matches, max_length=None):
+	'''
+	Format matching passages for the model, best first, within max_length characters overall.
+	'''
+	parts = []
+	used = 0
+	for number, score in matches:
+		part = f"[Passage {number + 1} of {len(index.passages)}]\n{index.passages[number]}"
+		if max_length and used + len(part) > max_length:
+			if not parts:
+				parts.append(part[0:max_length])
+			break
+		parts.append(part)
+		used += len(part) + 2
+	return "\n\n".join(parts)
+
 @tool(
-    description="Fetch and extract text content from a webpage URL"
+    description="Fetch and extract text content from a webpage URL. Pass a query to get only the passages of the page relevant to it"
 )
-async def get_website_url_content(url: str, ignore_links: bool = False, max_length: int = None, tenant_name: str = None):
+async def get_website_url_content(url: str, ignore_links: bool = False, max_length: int = None, query: str = None, top_k: int = 5, tenant_name: str = None):
 	'''
 	This function is used to scrape a webpage.
 	It converts the html to text and returns the text.
@@ -59,30 +558,33 @@ async def get_website_url_content(url: str, ignore_links: bool = False, max_leng
 		url (str): The URL to scrape.
 		ignore_links (bool): Ignore links in the text. Use 'False' to receive the URLs of nested pages to scrape.
 		max_length (int): Maximum length of text to return. If None, return all text.
+		query (str): Return only the passages of the page that best match this question or keywords.
+		top_k (int): Number of passages to return with query.
 		tenant_name (str): Tenant name for tracking purposes.
 
 	Returns:
-		str: The text content of the webpage. If max_length is provided, the text will be truncated to the specified length.
+		str: The text content of the webpage (or, with query, its best matching passages). If max_length is provided, the text will be truncated to the specified length.
 	'''
-	header = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36'}
-	try:
-		async with httpx.AsyncClient(follow_redirects=True) as client:
-			response = await client.get(str(url), headers=header, timeout=5)
-	except Exception as e:
-		print('Error in webscrape: ', e)
-		return {"error": f"Error fetching the url {url}: {str(e)}"}
+	if query:
+		index = await get_passage_index(url, ignore_links=ignore_links)
+		if isinstance(index, dict):
+			return index
+		matches = index.search(query, top_k=max(1, top_k or 5))
+		if not matches:
+			return {"error": f"No passages of {url} match the query: {query}"}
+		return format_passages(index, matches, max_length=max_length)
 	
+	page = await fetch_page(url, ignore_links=ignore_links, max_length=max_length)
+	if "error" in page:
+		return page
 	
-	try:
-		out = html_to_text(response.text, ignore_links=ignore_links)
-		print("\n\nOut: ", out)
-		if max_length:
-			return out[0:max_length]
-		else:
-			return out
-	except Exception as e:
-		print('Error in html_to_text: ', e)
-		return response.text
+	out = page["text"]
+	if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+		logger.debug("Content of %s (%d chars): %s", url, len(out), out[0:LOG_SAMPLE_CHARS])
+	if max_length:
+		return out[0:max_length]
+	else:
+		return out
 
 # Define the tool parameters
 get_website_url_content._tool_params = {
@@ -101,6 +603,16 @@ get_website_url_content._tool_params = {
 			"type": "integer",
 			"description": "Maximum length of text to return. If not provided, returns all text.",
 			"default": None
+		},
+		"query": {
+			"type": "string",
+			"description": "Optional question or keywords. If given, only the passages of the page most relevant to it are returned instead of the text from the top of the page.",
+			"default": None
+		},
+		"top_k": {
+			"type": "integer",
+			"description": "Number of passages to return when a query is given.",
+			"default": 5
 		}
 	},
 	"required": ["url"],
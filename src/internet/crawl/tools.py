@@ -0,0 +1,225 @@
+"""
+The actual functions that are called when a tool is used by the assistant.
+The entire file is passed and using the function name specified in the tools to the
+assistant, the function is called and its results are returned.
+NOTE: tenant_name and other extra_args are passed to all the functions to prevent
+an unexpected keyword error from happening.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from utils.tool_decorator import tool
+from utils.urls import canonicalize_url, url_host
+from utils.config import env_int, env_float
+from utils.deadline import current_deadline
+from internet.browse.tools import fetch_page
+
+# Pages fetched at once by a crawl
+CRAWL_CONCURRENCY = env_int("POWERUPS_CRAWL_CONCURRENCY", 8)
+# Politeness: requests in flight per host, and seconds between request starts to one host
+CRAWL_HOST_CONCURRENCY = env_int("POWERUPS_CRAWL_HOST_CONCURRENCY", 4)
+CRAWL_HOST_DELAY = env_float("POWERUPS_CRAWL_HOST_DELAY", 0.0)
+# Upper bound on pages the model may ask for in one crawl
+CRAWL_MAX_PAGES = env_int("POWERUPS_CRAWL_MAX_PAGES", 100)
+# Overall budgets for one crawl; kept under the tool call timeout so partial results come back
+CRAWL_TIME_BUDGET = env_float("POWERUPS_CRAWL_TIME_BUDGET", 20)
+CRAWL_BYTE_BUDGET = env_int("POWERUPS_CRAWL_BYTE_BUDGET", 20 * 1024 * 1024)
+
+class HostPoliteness:
+	'''
+	Per-host concurrency cap and minimum delay between request starts to the same host.
+	'''
+	def __init__(self, concurrency=CRAWL_HOST_CONCURRENCY, delay=CRAWL_HOST_DELAY):
+		self.concurrency = concurrency
+		self.delay = delay
+		self._semaphores = {}
+		self._next_start = {}
+
+	@asynccontextmanager
+	async def slot(self, host):
+		semaphore = self._semaphores.get(host)
+		if semaphore is None:
+			semaphore = self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+		async with semaphore:
+			if self.delay:
+				now = time.monotonic()
+				start_at = max(now, self._next_start.get(host, 0.0))
+				self._next_start[host] = start_at + self.delay
+				if start_at > now:
+					await asyncio.sleep(start_at - now)
+			yield
+
+async def crawl(url, max_pages=10, max_depth=2, same_domain=True, max_length_per_page=2000, ignore_links=True,
+		concurrency=None, time_budget=None, byte_budget=None, politeness=None):
+	'''
+	Crawl from a seed URL, yielding each page as soon as it has been fetched.
+	
+	Pages are fetched concurrently from an async frontier. Links are canonicalized
+	and deduplicated, and come from the same parse that converts the page to text.
+	
+	Args:
+		url (str): The seed URL.
+		max_pages (int): Maximum number of pages to fetch, seed included.
+		max_depth (int): Maximum link depth from the seed.
+		same_domain (bool): Only follow links on the seed's host.
+		max_length_per_page (int): Characters of text kept per page.
+		ignore_links (bool): Leave links out of the page text (they are still followed).
+		concurrency (int): Pages fetched at once. Defaults to POWERUPS_CRAWL_CONCURRENCY.
+		time_budget (float): Seconds before the crawl stops. Defaults to POWERUPS_CRAWL_TIME_BUDGET,
+			and never runs past the request's deadline.
+		byte_budget (int): Bytes downloaded before no new pages are started.
+			Defaults to POWERUPS_CRAWL_BYTE_BUDGET.
+		politeness (HostPoliteness): Per-host limits. Defaults to a new HostPoliteness().
+	
+	Yields:
+		dict: {"url", "depth", "content", "links_found"} per page, or {"url", "depth", "error"}.
+	'''
+	concurrency = concurrency or CRAWL_CONCURRENCY
+	time_budget = time_budget or CRAWL_TIME_BUDGET
+	byte_budget = byte_budget or CRAWL_BYTE_BUDGET
+	politeness = politeness or HostPoliteness()
+
+	seed = canonicalize_url(url)
+	if seed is None:
+		yield {"url": url, "depth": 0, "error": f"Invalid URL: {url}"}
+		return
+	seed_host = url_host(seed)
+
+	deadline = time.monotonic() + time_budget
+	request_deadline = current_deadline()
+	if request_deadline is not None:
+		# Stop a little before the request runs out, so the pages found so far still come back
+		deadline = min(deadline, request_deadline - 0.1 * (request_deadline - time.monotonic()))
+	frontier = asyncio.Queue()
+	results = asyncio.Queue()
+	seen = {seed}
+	downloaded = 0
+	frontier.put_nowait((seed, 0))
+
+	def enqueue(links, base, depth):
+		for href in links:
+			if len(seen) >= max_pages:
+				return
+			link = canonicalize_url(href, base)
+			if link is None or link in seen:
+				continue
+			if same_domain and url_host(link) != seed_host:
+				continue
+			seen.add(link)
+			frontier.put_nowait((link, depth))
+
+	async def worker():
+		nonlocal downloaded
+		while True:
+			page_url, depth = await frontier.get()
+			try:
+				# Out of budget: drain the frontier without fetching
+				if downloaded >= byte_budget or time.monotonic() >= deadline:
+					continue
+				async with politeness.slot(url_host(page_url)):
+					page = await fetch_page(page_url, ignore_links=ignore_links, with_links=True)
+				if "error" in page:
+					results.put_nowait({"url": page_url, "depth": depth, "error": page["error"]})
+					continue
+				downloaded += page["bytes"]
+				if depth < max_depth:
+					enqueue(page["links"], page["url"], depth + 1)
+				results.put_nowait({
+					"url": page_url,
+					"depth": depth,
+					"content": page["text"][0:max_length_per_page],
+					"links_found": len(page["links"])
+				})
+			except Exception as e:
+				results.put_nowait({"url": page_url, "depth": depth, "error": str(e)})
+			finally:
+				frontier.task_done()
+
+	workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+	finished = asyncio.ensure_future(frontier.join())
+	try:
+		while True:
+			if finished.done() and results.empty():
+				break
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				break
+			getter = asyncio.ensure_future(results.get())
+			await asyncio.wait({getter, finished}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+			if getter.done():
+				yield getter.result()
+			else:
+				getter.cancel()
+		# Pages that finished right at the deadline
+		while not results.empty():
+			yield results.get_nowait()
+	finally:
+		finished.cancel()
+		for task in workers:
+			task.cancel()
+
+@tool(
+	description="Crawl a website starting from a URL, following its links, and return the text of each page found",
+	# Crawls stop early at the request deadline and return what they have; a shared crawl would end at another request's
+	coalesce=False
+)
+async def crawl_website(url: str, max_pages: int = 10, max_depth: int = 2, same_domain: bool = True, max_length_per_page: int = 2000, tenant_name: str = None):
+	'''
+	Crawl a website from a seed URL.
+	
+	Args:
+		url (str): The URL to start crawling from.
+		max_pages (int): Maximum number of pages to fetch (capped by POWERUPS_CRAWL_MAX_PAGES).
+		max_depth (int): How many links deep to follow from the seed page.
+		same_domain (bool): Only follow links on the same host as the seed URL.
+		max_length_per_page (int): Maximum length of text returned per page.
+		tenant_name (str): Tenant name for tracking purposes.
+	
+	Returns:
+		list: One entry per page, in the order they were fetched, with url, depth,
+		content and links_found (or error).
+	'''
+	max_pages = max(1, min(max_pages or 10, CRAWL_MAX_PAGES))
+	return [
+		page async for page in crawl(
+			url,
+			max_pages=max_pages,
+			max_depth=max_depth,
+			same_domain=same_domain,
+			max_length_per_page=max_length_per_page
+		)
+	]
+
+# Define the tool parameters
+crawl_website._tool_params = {
+	"type": "object",
+	"properties": {
+		"url": {
+			"type": "string",
+			"description": "The URL to start crawling from"
+		},
+		"max_pages": {
+			"type": "integer",
+			"description": "Maximum number of pages to fetch.",
+			"default": 10
+		},
+		"max_depth": {
+			"type": "integer",
+			"description": "How many links deep to follow from the starting page.",
+			"default": 2
+		},
+		"same_domain": {
+			"type": "boolean",
+			"description": "Only follow links on the same website as the starting URL.",
+			"default": True
+		},
+		"max_length_per_page": {
+			"type": "integer",
+			"description": "Maximum length of text to return for each page.",
+			"default": 2000
+		}
+	},
+	"required": ["url"],
+	"additionalProperties": False
+}
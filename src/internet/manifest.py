@@ -0,0 +1,15 @@
+"""
+Where each tool is defined.
+
+The app registers this manifest instead of importing the tool modules, so a
+tool's module (and its dependencies, e.g. html2text for browsing) is imported
+the first time a request uses the tool. Add new tools here.
+"""
+
+# Tool name -> module that defines it with @tool
+TOOL_MODULES = {
+	"google_search": "internet.search.tools",
+	"google_search_batch": "internet.search.tools",
+	"get_website_url_content": "internet.browse.tools",
+	"crawl_website": "internet.crawl.tools",
+}
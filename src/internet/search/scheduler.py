@@ -0,0 +1,483 @@
+"""
+Process-wide scheduler for Custom Search API calls.
+
+The API enforces a per-second rate and a daily quota. Instead of firing every
+search immediately (and handing 429s back to the model), each call takes a token
+from a token bucket first. Callers wait in a priority queue, so interactive
+searches go before batch ones. A 429 pauses the bucket for the Retry-After time
+(or an exponential backoff). The daily count is kept in SQLite, so it survives
+restarts and is shared by every worker on the host.
+
+Only the caller at the head of the queue waits on the clock (for the next token
+or the end of a backoff); the others sleep until the scheduler wakes them when
+they reach the head.
+"""
+import asyncio
+import contextvars
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from utils.config import env_int, env_float
+from utils.deadline import remaining
+
+logger = logging.getLogger(__name__)
+
+# Search priorities: lower goes first
+INTERACTIVE = 0
+BATCH = 1
+
+_priority = contextvars.ContextVar("powerups_search_priority", default=INTERACTIVE)
+
+@contextmanager
+def search_priority(priority):
+	"""
+	Set the priority of searches made in this block (and in tasks created in it).
+
+	Args:
+		priority (int): INTERACTIVE or BATCH.
+	"""
+	token = _priority.set(priority)
+	try:
+		yield
+	finally:
+		_priority.reset(token)
+
+
+class SearchThrottled(Exception):
+	"""Raised when a search can't be scheduled in time, or the daily quota is used up."""
+
+
+def _resolve(future):
+	if not future.done():
+		future.set_result(None)
+
+
+class _LoopWakeup:
+	"""
+	Wakes a caller waiting on an event loop, like threading.Event for the sync
+	path: set() may be called from any thread, wait() returns once set or timed out.
+	"""
+
+	__slots__ = ("_loop", "_is_set", "_future")
+
+	def __init__(self):
+		self._loop = asyncio.get_running_loop()
+		self._is_set = False
+		self._future = None
+
+	def _set(self):
+		self._is_set = True
+		if self._future is not None:
+			_resolve(self._future)
+
+	def set(self):
+		try:
+			self._loop.call_soon_threadsafe(self._set)
+		except RuntimeError:
+			# The loop is closed; nobody is waiting any more
+			pass
+
+	def clear(self):
+		self._is_set = False
+
+	async def wait(self, timeout):
+		if self._is_set:
+			return
+		self._future = self._loop.create_future()
+		timer = self._loop.call_later(timeout, _resolve, self._future)
+		try:
+			await self._future
+		finally:
+			timer.cancel()
+			self._future = None
+
+
+def parse_retry_after(value):
+	"""
+	Parse a Retry-After header (seconds or an HTTP date).
+
+	Returns:
+		float: Seconds to wait, or None if missing or unparseable.
+	"""
+	if not value:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		retry_at = parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	if retry_at.tzinfo is None:
+		retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+	return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class SearchScheduler:
+	"""
+	Token bucket with a priority queue, a persistent daily quota and 429 backoff.
+
+	Safe to use from the event loop (acquire) and from worker threads (acquire_sync).
+	The quota is checked against an in-memory count; the count is written to the
+	shared database (and other processes' use read back) off the event loop, in
+	the default executor, so a locked database never stalls the loop.
+
+	Args:
+		rate (float): Tokens added per second.
+		burst (int): Bucket size.
+		daily_quota (int): Searches allowed per quota day (0 for no limit).
+		quota_path (str): SQLite file holding the daily count.
+		max_wait (float): Longest a caller queues before giving up.
+		utc_offset_hours (float): Offset of the quota day from UTC (the API resets at midnight Pacific).
+	"""
+
+	# Write the local quota count to the database after this many searches or seconds
+	FLUSH_EVERY = 10
+	FLUSH_INTERVAL = 5.0
+	# Longest pause after repeated 429s without a Retry-After hint
+	MAX_BACKOFF = 60.0
+
+	def __init__(self, rate=10.0, burst=10, daily_quota=10000, quota_path=None, max_wait=10.0, utc_offset_hours=-8.0):
+		self.rate = rate
+		self.burst = burst
+		self.daily_quota = daily_quota
+		self.quota_path = quota_path
+		self.max_wait = max_wait
+		self.utc_offset = datetime.timedelta(hours=utc_offset_hours)
+
+		self._lock = threading.Lock()
+		self._tokens = float(burst)
+		self._updated = time.monotonic()
+		self._waiters = []
+		self._sequence = itertools.count()
+		self._paused_until = 0.0
+		self._failures = 0
+
+		self._conn = None
+		self._flush_lock = threading.Lock()
+		self._flush_due = False
+		self._flushing = False
+		self._quota_day = None
+		self._quota_used = 0
+		# Searches not yet written to the database, per quota day
+		self._quota_pending = {}
+		self._quota_exhausted = False
+		self._last_flush = time.monotonic()
+
+		self._stats = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "throttled": 0, "backoffs": 0, "quota_rejections": 0, "errors": 0}
+
+	# Daily quota
+
+	def _today(self):
+		return (datetime.datetime.now(datetime.timezone.utc) + self.utc_offset).date().isoformat()
+
+	def _connection(self):
+		if self._conn is None:
+			conn = sqlite3.connect(self.quota_path, timeout=10, check_same_thread=False, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+			self._conn = conn
+		return self._conn
+
+	def _flush(self):
+		"""
+		Add the local counts to the shared ones and read back today's total.
+
+		Blocking (it may wait for the database), so never called on the event loop
+		or with the lock held.
+		"""
+		with self._flush_lock:
+			with self._lock:
+				# Counted locally until written, so the quota check keeps seeing them meanwhile
+				pending = dict(self._quota_pending)
+				day = self._quota_day
+				self._flush_due = False
+				self._last_flush = time.monotonic()
+			if not self.quota_path or day is None:
+				return
+			try:
+				conn = self._connection()
+				for pending_day, count in pending.items():
+					conn.execute(
+						"INSERT INTO quota (day, used) VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET used = used + excluded.used",
+						(pending_day, count)
+					)
+				row = conn.execute("SELECT used FROM quota WHERE day = ?", (day,)).fetchone()
+			except sqlite3.Error as e:
+				# Keep counting locally; the quota file is best effort
+				self._stats["errors"] += 1
+				logger.warning("Error in search quota store: %s", e)
+				return
+			with self._lock:
+				for pending_day, count in pending.items():
+					left = self._quota_pending.get(pending_day, 0) - count
+					if left > 0:
+						self._quota_pending[pending_day] = left
+					else:
+						self._quota_pending.pop(pending_day, None)
+				if self._quota_day == day:
+					self._quota_used = row[0] if row else 0
+
+	def _run_flush(self):
+		try:
+			self._flush()
+		finally:
+			self._flushing = False
+
+	def _flush_in_background(self):
+		"""Start a flush in the default executor if one is due (called on the event loop)."""
+		if self._flush_due and not self._flushing:
+			self._flushing = True
+			asyncio.get_running_loop().run_in_executor(None, self._run_flush)
+
+	def _pending_today(self):
+		return self._quota_pending.get(self._quota_day, 0)
+
+	def _check_quota(self):
+		"""Roll the quota day over if needed and raise if the quota is used up (lock held, no I/O)."""
+		today = self._today()
+		if today != self._quota_day:
+			# The old day's pending count is still written by the next flush
+			self._quota_day = today
+			self._quota_used = 0
+			self._quota_exhausted = False
+			self._flush_due = True
+		elif self._pending_today() >= self.FLUSH_EVERY or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+			self._flush_due = True
+		if not self.quota_path:
+			self._flush_due = False
+
+		if self._quota_exhausted or (self.daily_quota and self._quota_used + self._pending_today() >= self.daily_quota):
+			self._stats["quota_rejections"] += 1
+			raise SearchThrottled("Daily search quota exhausted")
+
+	# Token bucket
+
+	def _wake_head(self):
+		"""Drop callers that left the front of the queue and wake the one now at its head (lock held)."""
+		while self._waiters and self._waiters[0][2]:
+			heapq.heappop(self._waiters)
+		if self._waiters:
+			self._waiters[0][3].set()
+
+	def _try_acquire(self, waiter):
+		"""
+		Take a token if it's this waiter's turn (lock not held).
+
+		Returns:
+			float: Seconds to wait before trying again (infinite until woken at the
+			head of the queue), or None once the token is taken.
+		"""
+		with self._lock:
+			while self._waiters and self._waiters[0][2]:
+				heapq.heappop(self._waiters)
+			self._check_quota()
+			if self._waiters[0] is not waiter:
+				return float("inf")
+
+			now = time.monotonic()
+			if now < self._paused_until:
+				return self._paused_until - now
+
+			self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+			self._updated = now
+			if self._tokens >= 1:
+				heapq.heappop(self._waiters)
+				self._tokens -= 1
+				self._quota_pending[self._quota_day] = self._pending_today() + 1
+				self._stats["granted"] += 1
+				self._wake_head()
+				return None
+			return (1 - self._tokens) / self.rate
+
+	def _enqueue(self, priority, max_wait, wakeup):
+		if priority is None:
+			priority = _priority.get()
+		max_wait = self.max_wait if max_wait is None else max_wait
+		left = remaining()
+		if left is not None:
+			max_wait = min(max_wait, left)
+		# [priority, sequence, left the queue, wakeup]; the sequence is unique, so wakeups are never compared
+		waiter = [priority, next(self._sequence), False, wakeup]
+		with self._lock:
+			heapq.heappush(self._waiters, waiter)
+		return waiter, time.monotonic() + max_wait
+
+	def _waiting(self, give_up_at, wait):
+		"""Seconds to sleep before retrying, raising if the caller would wait past give_up_at."""
+		now = time.monotonic()
+		if now >= give_up_at:
+			self._stats["throttled"] += 1
+			raise SearchThrottled("Search rate limit reached, try again later")
+		return min(wait, give_up_at - now)
+
+	def _done(self, waiter, granted, start):
+		if granted:
+			waited = time.monotonic() - start
+			if waited > 0.001:
+				self._stats["waited"] += 1
+				self._stats["wait_seconds"] += waited
+			return
+		# Leave the queue (removed lazily when it reaches the front)
+		with self._lock:
+			waiter[2] = True
+			if self._waiters and self._waiters[0] is waiter:
+				self._wake_head()
+
+	async def acquire(self, priority=None, max_wait=None):
+		"""
+		Wait for a search token.
+
+		Args:
+			priority (int, optional): INTERACTIVE or BATCH. Defaults to the search_priority() in effect.
+			max_wait (float, optional): Longest to wait. Defaults to max_wait, capped by the request deadline.
+
+		Raises:
+			SearchThrottled: If no token is available in time, or the daily quota is used up.
+		"""
+		start = time.monotonic()
+		wakeup = _LoopWakeup()
+		waiter, give_up_at = self._enqueue(priority, max_wait, wakeup)
+		granted = False
+		try:
+			while True:
+				# Cleared before looking, so a wakeup that comes in after the look isn't lost
+				wakeup.clear()
+				try:
+					wait = self._try_acquire(waiter)
+				finally:
+					self._flush_in_background()
+				if wait is None:
+					granted = True
+					return
+				await wakeup.wait(self._waiting(give_up_at, wait))
+		finally:
+			self._done(waiter, granted, start)
+
+	def acquire_sync(self, priority=None, max_wait=None):
+		"""Blocking version of acquire, for the sync search path."""
+		start = time.monotonic()
+		wakeup = threading.Event()
+		waiter, give_up_at = self._enqueue(priority, max_wait, wakeup)
+		granted = False
+		try:
+			while True:
+				wakeup.clear()
+				try:
+					wait = self._try_acquire(waiter)
+				finally:
+					if self._flush_due:
+						self._flush()
+				if wait is None:
+					granted = True
+					return
+				wakeup.wait(self._waiting(give_up_at, wait))
+		finally:
+			self._done(waiter, granted, start)
+
+	# Feedback from responses
+
+	def backoff(self, retry_after=None):
+		"""
+		Pause all searches after a 429.
+
+		Args:
+			retry_after (float, optional): The server's Retry-After hint in seconds. Without one,
+				the pause doubles with every consecutive 429 (with jitter), up to MAX_BACKOFF.
+
+		Returns:
+			float: Seconds until searches resume.
+		"""
+		with self._lock:
+			self._failures += 1
+			if retry_after is None:
+				delay = min(self.MAX_BACKOFF, 2 ** (self._failures - 1))
+				delay += random.uniform(0, delay / 10)
+			else:
+				delay = retry_after
+			now = time.monotonic()
+			self._paused_until = max(self._paused_until, now + delay)
+			self._tokens = 0.0
+			self._updated = now
+			self._stats["backoffs"] += 1
+			return self._paused_until - now
+
+	def record_success(self):
+		"""Reset the backoff after a successful search."""
+		self._failures = 0
+
+	def quota_exhausted(self):
+		"""The API reported the daily limit as reached: stop searching until the quota day rolls over."""
+		with self._lock:
+			self._quota_exhausted = True
+
+	def close(self):
+		self._flush()
+		with self._flush_lock:
+			if self._conn is not None:
+				self._conn.close()
+				self._conn = None
+
+	def stats(self):
+		"""
+		Scheduler counters.
+
+		Returns:
+			dict: Grants, waits, throttled calls, backoffs, queue length, tokens, quota use and configuration.
+		"""
+		with self._lock:
+			stats = dict(self._stats)
+			stats["queued"] = sum(1 for waiter in self._waiters if not waiter[2])
+			stats["tokens"] = round(min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate), 2)
+			stats["paused_seconds"] = round(max(0.0, self._paused_until - time.monotonic()), 3)
+			stats["quota_day"] = self._quota_day
+			stats["quota_used"] = self._quota_used + self._pending_today()
+			stats["quota_exhausted"] = self._quota_exhausted
+		stats["config"] = {
+			"rate": self.rate,
+			"burst": self.burst,
+			"daily_quota": self.daily_quota,
+			"max_wait": self.max_wait,
+			"quota_path": self.quota_path,
+		}
+		return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_search_scheduler():
+	"""
+	Get the process-wide search scheduler.
+
+	Settings:
+		POWERUPS_SEARCH_RATE: Searches per second (default 10).
+		POWERUPS_SEARCH_BURST: Token bucket size (default 10).
+		POWERUPS_SEARCH_DAILY_QUOTA: Searches per day, 0 for no limit (default 10000).
+		POWERUPS_SEARCH_QUOTA_PATH: SQLite file for the daily count (default: powerups_search_quota.sqlite3 in the temp dir).
+		POWERUPS_SEARCH_MAX_WAIT: Seconds a search may queue for a token (default 10).
+		POWERUPS_SEARCH_QUOTA_UTC_OFFSET: Hours from UTC at which the quota day starts (default -8, Pacific).
+	"""
+	global _scheduler
+	with _scheduler_lock:
+		if _scheduler is None:
+			_scheduler = SearchScheduler(
+				rate=env_float("POWERUPS_SEARCH_RATE", 10.0),
+				burst=env_int("POWERUPS_SEARCH_BURST", 10),
+				daily_quota=env_int("POWERUPS_SEARCH_DAILY_QUOTA", 10000),
+				quota_path=os.getenv("POWERUPS_SEARCH_QUOTA_PATH") or os.path.join(tempfile.gettempdir(), "powerups_search_quota.sqlite3"),
+				max_wait=env_float("POWERUPS_SEARCH_MAX_WAIT", 10.0),
+				utc_offset_hours=env_float("POWERUPS_SEARCH_QUOTA_UTC_OFFSET", -8.0)
+			)
+	return _scheduler
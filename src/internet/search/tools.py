@@ -6,14 +6,124 @@ NOTE: tenant_name and other extra_args are passed to all the functions to preven
 an unexpected keyword error from happening.
 """
 import traceback
+import threading
+import asyncio
+import json
 
 import os
-from googleapiclient.discovery import build
 
-from utils.tool_decorator import tool
+from utils.tool_decorator import tool, async_implementation
+from utils.http_client import get_http_pool
+from utils.cache import TTLCache, cached, normalize_text
+from utils.config import env_int, env_float
+from utils.urls import canonicalize_url
+from utils.deadline import cap_timeout
+from utils.metrics import span
+from internet.search.scheduler import get_search_scheduler, search_priority, parse_retry_after, SearchThrottled, BATCH
+from internet.browse.prefetch import current_prefetch_store
+
+# Root of the Custom Search JSON API, overridable to point at a local stand-in
+CUSTOM_SEARCH_ROOT_URL = os.getenv("POWERUPS_GOOGLE_CSE_ROOT_URL", "https://customsearch.googleapis.com/")
+CUSTOM_SEARCH_URL = CUSTOM_SEARCH_ROOT_URL.rstrip("/") + "/customsearch/v1"
+
+# googleapiclient services wrap an httplib2 connection that is not thread-safe,
+# so the prepared service is cached per thread (and per API key)
+_services = threading.local()
+
+def _get_service(api_key):
+	"""
+	Get the prepared Custom Search service for an API key, building it once per thread.
+
+	Args:
+		api_key: Google API key
+
+	Returns:
+		The googleapiclient Custom Search service
+	"""
+	cache = getattr(_services, "by_key", None)
+	if cache is None:
+		cache = _services.by_key = {}
+
+	service = cache.get(api_key)
+	if service is None:
+		# Imported here: only the sync path uses googleapiclient, and it is slow to import
+		from googleapiclient.discovery import build
+		service = build(
+			"customsearch", "v1",
+			developerKey=api_key,
+			cache_discovery=False,
+			client_options={"api_endpoint": CUSTOM_SEARCH_ROOT_URL}
+		)
+		cache[api_key] = service
+	return service
+
+# Results cache shared by the sync and async search paths
+SEARCH_CACHE = TTLCache(
+	maxsize=env_int("POWERUPS_SEARCH_CACHE_SIZE", 1024),
+	ttl=env_float("POWERUPS_SEARCH_CACHE_TTL", 3600),
+	negative_ttl=env_float("POWERUPS_SEARCH_CACHE_NEGATIVE_TTL", 300),
+	name="google_search"
+)
+
+def _search_cache_key(query, api_key=None, search_id=None):
+	"""Cache key: the normalized query and the search engine ID (the API key doesn't change results)"""
+	return (normalize_text(query), search_id or os.getenv("GOOGLE_SEARCH_CX_ID"))
+
+def _is_no_results(result):
+	"""'No results found' is a stable answer worth caching, unlike transient errors"""
+	return result.get("error") == "No results found"
+
+# Times a search is retried after a 429, waiting for the scheduler's backoff in between
+SEARCH_RETRIES = env_int("POWERUPS_SEARCH_RETRIES", 2)
+
+# Error reasons from the API meaning "slow down" and "come back tomorrow"
+_RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+_DAILY_LIMIT_REASONS = ("dailyLimitExceeded", "quotaExceeded")
+
+def _error_reasons(result):
+	"""The reason codes of a Custom Search API error response"""
+	error = result.get("error") if isinstance(result, dict) else None
+	if not isinstance(error, dict):
+		return set()
+	return {item.get("reason") for item in error.get("errors", []) if isinstance(item, dict)}
+
+def _throttle_action(status_code, reasons):
+	"""How to react to a failed search: "retry" after a backoff, "stop" for the day, or None"""
+	if reasons & set(_DAILY_LIMIT_REASONS):
+		return "stop"
+	if status_code == 429 or reasons & set(_RATE_LIMIT_REASONS):
+		return "retry"
+	return None
+
+def _compact_result(item):
+	"""The fields of a search result the model needs"""
+	return {
+		"title": item.get("title"),
+		"link": item.get("link"),
+		"snippet": item.get("snippet")
+	}
+
+def _compact_results(items):
+	"""Keep only title, link and snippet of each result (no pagemap, thumbnails or metatags)"""
+	return [_compact_result(item) for item in items] if isinstance(items, list) else items
+
+def _prefetch_results(result):
+	"""Prefetch the top result pages, which the model is likely to open next"""
+	if current_prefetch_store() is None:
+		return
+	# Imported here, so searching alone doesn't load the browse tool
+	from internet.browse.tools import prefetch_pages
+	items = result.get("results") if isinstance(result, dict) else result
+	if isinstance(items, list):
+		prefetch_pages([item.get("link") for item in items if isinstance(item, dict)])
 
 @tool(
-	description="Search Google for information on a given query"
+	description="Search Google for information on a given query",
+	cache=SEARCH_CACHE,
+	cache_key=_search_cache_key,
+	cache_negative=_is_no_results,
+	project=_compact_results,
+	on_result=_prefetch_results
 )
 def google_search(query: str, api_key: str = None, search_id: str = None):
 	"""
@@ -29,29 +139,123 @@ def google_search(query: str, api_key: str = None, search_id: str = None):
 	"""
 	
 	# Use provided credentials or fall back to environment variables
-	google_api_key = api_key 
-	google_search_cx_id = search_id
+	google_api_key = api_key or os.getenv("GOOGLE_CONSTELLA_API_KEY")
+	google_search_cx_id = search_id or os.getenv("GOOGLE_SEARCH_CX_ID")
 
 	
 	if not google_api_key or not google_search_cx_id:
 		return {"error": "Google API key and Search Engine ID must be provided"}
 	
-	# Create the service
-	service = build("customsearch", "v1", developerKey=google_api_key)
+	from googleapiclient.errors import HttpError
 	
 	try:
-		# Execute the search
-		result = service.cse().list(
-			q=query,
-			cx=google_search_cx_id,
-			num=5  # Default to 5 results
-		).execute()
+		# Reuse the prepared service instead of rebuilding it from the discovery document
+		service = _get_service(google_api_key)
+		scheduler = get_search_scheduler()
+		
+		for attempt in range(SEARCH_RETRIES + 1):
+			# Wait for the shared rate limit instead of running into 429s
+			scheduler.acquire_sync()
+			try:
+				# Execute the search
+				result = service.cse().list(
+					q=query,
+					cx=google_search_cx_id,
+					num=5  # Default to 5 results
+				).execute()
+			except HttpError as e:
+				try:
+					reasons = _error_reasons(json.loads(e.content))
+				except ValueError:
+					reasons = set()
+				action = _throttle_action(e.resp.status, reasons)
+				if action == "stop":
+					scheduler.quota_exhausted()
+				if action != "retry" or attempt == SEARCH_RETRIES:
+					raise
+				scheduler.backoff(parse_retry_after(e.resp.get('retry-after')))
+			else:
+				scheduler.record_success()
+				break
 		
 		if result and result.get('items'):
 			return result.get('items')
 		else:
 			return {"error": "No results found"}
 			
+	except SearchThrottled as e:
+		# Refused by our own scheduler before reaching the API; not cached, so a later call can go through
+		return {"error": f"Search unavailable: {e}"}
+	except Exception as e:
+		return {"error": str(e)}
+
+@async_implementation(google_search)
+@cached(SEARCH_CACHE, key=_search_cache_key, is_negative=_is_no_results)
+async def google_search_async(query: str, api_key: str = None, search_id: str = None):
+	"""
+	Async version of google_search that calls the Custom Search JSON API directly
+	through the shared HTTP client pool, without blocking the event loop.
+
+	Args:
+		query: The search query string
+		api_key: Google API key (optional if set via environment variable)
+		search_id: Google Custom Search Engine ID (optional if set via environment variable)
+
+	Returns:
+		List of search results with titles, links, and snippets
+	"""
+
+	# Use provided credentials or fall back to environment variables
+	google_api_key = api_key or os.getenv("GOOGLE_CONSTELLA_API_KEY")
+	google_search_cx_id = search_id or os.getenv("GOOGLE_SEARCH_CX_ID")
+
+	if not google_api_key or not google_search_cx_id:
+		return {"error": "Google API key and Search Engine ID must be provided"}
+
+	try:
+		scheduler = get_search_scheduler()
+		for attempt in range(SEARCH_RETRIES + 1):
+			# Wait for the shared rate limit instead of running into 429s
+			await scheduler.acquire()
+
+			# Execute the search
+			with span("http_fetch", "search") as fetch_span:
+				response = await get_http_pool().get(
+					CUSTOM_SEARCH_URL,
+					params={
+						"key": google_api_key,
+						"cx": google_search_cx_id,
+						"q": query,
+						"num": 5  # Default to 5 results
+					},
+					timeout=cap_timeout(10)
+				)
+				if response.status_code >= 400:
+					fetch_span.status = "error"
+			result = response.json()
+
+			if response.status_code == 200:
+				scheduler.record_success()
+				break
+			action = _throttle_action(response.status_code, _error_reasons(result))
+			if action == "stop":
+				scheduler.quota_exhausted()
+			if action != "retry" or attempt == SEARCH_RETRIES:
+				break
+			scheduler.backoff(parse_retry_after(response.headers.get("Retry-After")))
+
+		if response.status_code != 200:
+			message = result.get("error", {}).get("message") if isinstance(result, dict) else None
+			return {"error": f"<HttpError {response.status_code} \"{message or response.reason_phrase}\">"}
+
+		if result and result.get('items'):
+			return result.get('items')
+		else:
+			return {"error": "No results found"}
+
+	except SearchThrottled as e:
+		# Refused by our own scheduler before reaching the API; not cached, so a later call can go through
+		return {"error": f"Search unavailable: {e}"}
 	except Exception as e:
 		return {"error": str(e)}
 
@@ -67,3 +271,119 @@ google_search._tool_params = {
 	"required": ["query"],
 	"additionalProperties": False
 }
+
+# Batch search: queries accepted per batch, and searches in flight at once for one batch
+SEARCH_BATCH_MAX_QUERIES = env_int("POWERUPS_SEARCH_BATCH_MAX_QUERIES", 10)
+SEARCH_BATCH_CONCURRENCY = env_int("POWERUPS_SEARCH_BATCH_CONCURRENCY", 5)
+# Reciprocal rank fusion constant: higher values flatten the weight of top ranks
+RRF_K = 60
+
+def merge_search_results(results_per_query, max_results=10):
+	"""
+	Merge ranked result lists from several queries into one list.
+
+	Results are deduplicated by canonical link and ranked by reciprocal rank
+	fusion, so a link found near the top by several queries ranks first.
+
+	Args:
+		results_per_query: List of (query, list of search result items) pairs
+		max_results: Maximum number of merged results to return
+
+	Returns:
+		List of compact results (title, link, snippet, queries), best first
+	"""
+	merged = {}
+	for query, items in results_per_query:
+		for rank, item in enumerate(items):
+			key = canonicalize_url(item.get("link")) or item.get("link")
+			if not key:
+				continue
+			entry = merged.get(key)
+			if entry is None:
+				entry = merged[key] = {"result": _compact_result(item), "score": 0.0, "queries": []}
+			entry["score"] += 1.0 / (RRF_K + rank + 1)
+			if query not in entry["queries"]:
+				entry["queries"].append(query)
+
+	ranked = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)
+	return [dict(entry["result"], queries=entry["queries"]) for entry in ranked[0:max_results]]
+
+@tool(
+	description="Run several Google searches at once and return one merged list of results, deduplicated across queries",
+	on_result=_prefetch_results
+)
+async def google_search_batch(queries: list, max_results: int = 10, api_key: str = None, search_id: str = None):
+	"""
+	Search Google for several queries concurrently and merge the results.
+
+	Each query goes through google_search (and its cache). Results are
+	deduplicated by canonical link and ranked across queries.
+
+	Args:
+		queries: The search query strings
+		max_results: Maximum number of merged results to return
+		api_key: Google API key (optional if set via environment variable)
+		search_id: Google Custom Search Engine ID (optional if set via environment variable)
+
+	Returns:
+		Dict with the merged results, and the error per query for queries that failed
+	"""
+	# Drop empty and duplicate queries, keeping the order they were given in
+	unique_queries = {}
+	for query in queries or []:
+		if isinstance(query, str) and query.strip():
+			unique_queries.setdefault(normalize_text(query), query.strip())
+	queries = list(unique_queries.values())
+
+	if not queries:
+		return {"error": "At least one query must be provided"}
+	if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+		return {"error": f"At most {SEARCH_BATCH_MAX_QUERIES} queries can be searched at once"}
+
+	semaphore = asyncio.Semaphore(SEARCH_BATCH_CONCURRENCY)
+
+	async def search(query):
+		# Batch searches queue behind interactive ones for the shared rate limit
+		with search_priority(BATCH):
+			async with semaphore:
+				try:
+					return await google_search_async(query, api_key=api_key, search_id=search_id)
+				except Exception as e:
+					return {"error": str(e)}
+
+	results = await asyncio.gather(*(search(query) for query in queries))
+
+	found = []
+	errors = {}
+	for query, result in zip(queries, results):
+		if isinstance(result, list):
+			found.append((query, result))
+		elif result.get("error") != "No results found":
+			errors[query] = result.get("error")
+
+	if errors and not found:
+		return {"error": "All searches failed", "errors": errors}
+
+	output = {"results": merge_search_results(found, max_results=max(1, max_results or 10))}
+	if errors:
+		output["errors"] = errors
+	return output
+
+# Built from google_search's schema, so both tools describe a query the same way
+google_search_batch._tool_params = {
+	"type": "object",
+	"properties": {
+		"queries": {
+			"type": "array",
+			"items": google_search._tool_params["properties"]["query"],
+			"description": f"The search queries to run (at most {SEARCH_BATCH_MAX_QUERIES})"
+		},
+		"max_results": {
+			"type": "integer",
+			"description": "Maximum number of merged results to return.",
+			"default": 10
+		}
+	},
+	"required": ["queries"],
+	"additionalProperties": False
+}
@@ -0,0 +1,495 @@
+"""
+Persistent job queue for bulk /powerup-demo workloads.
+
+Requests submitted as jobs are stored in a SQLite database (WAL mode, so every
+uvicorn worker on a host can share it) and run by a pool of async workers in
+each process, instead of holding an HTTP connection open for the whole agent
+loop. Clients poll a job or stream the results of a batch as jobs finish.
+
+Each completed agent round is checkpointed, so a job interrupted by a crash,
+a restart or a transient error resumes after its last completed round rather
+than from the start. Running jobs hold a lease that their worker keeps renewing;
+a job whose lease runs out (its process died) is picked up again by any worker.
+
+The queue is off unless POWERUPS_JOBS=1, so API processes that don't use it
+don't poll a database.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from utils.config import env_bool, env_int, env_float
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+	id TEXT PRIMARY KEY,
+	batch_id TEXT NOT NULL,
+	status TEXT NOT NULL,
+	request TEXT NOT NULL,
+	checkpoint TEXT,
+	rounds INTEGER NOT NULL DEFAULT 0,
+	result TEXT,
+	error TEXT,
+	attempts INTEGER NOT NULL DEFAULT 0,
+	created_at REAL NOT NULL,
+	started_at REAL,
+	heartbeat_at REAL,
+	finished_at REAL,
+	finished_seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, finished_seq);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+"""
+
+
+class JobCancelled(Exception):
+	"""Raised in a running job when it has been cancelled through the API."""
+
+
+class JobStore:
+	"""
+	SQLite-backed store of jobs, their checkpoints and results.
+
+	Args:
+		path (str): Database file. Every process using the same path shares the queue.
+		lease (float): Seconds a running job stays claimed without a heartbeat.
+		retention (float): Seconds finished jobs are kept before they are deleted.
+		max_attempts (int): Attempts before a job is marked failed, whether it raised or
+			its worker died while running it.
+	"""
+
+	# Delete expired finished jobs at most this often (seconds)
+	PURGE_INTERVAL = 600
+
+	def __init__(self, path, lease=300.0, retention=7 * 24 * 3600, max_attempts=3):
+		self.path = path
+		self.lease = lease
+		self.retention = retention
+		self.max_attempts = max_attempts
+		self._lock = threading.Lock()
+		self._conn = None
+		self._last_purge = 0.0
+		self._stats = {"submitted": 0, "claimed": 0, "reclaimed": 0, "checkpoints": 0, "succeeded": 0, "failed": 0, "retried": 0, "purged": 0}
+
+	def _connection(self):
+		if self._conn is None:
+			conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			conn.executescript(_SCHEMA)
+			self._conn = conn
+		return self._conn
+
+	async def _run(self, func, *args):
+		"""Run a blocking database call in the default executor."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, functools.partial(func, *args))
+
+	def _transaction(self, func):
+		"""Run func(conn) in an immediate (write-locked) transaction."""
+		with self._lock:
+			conn = self._connection()
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				result = func(conn)
+				conn.execute("COMMIT")
+			except Exception:
+				conn.execute("ROLLBACK")
+				raise
+			return result
+
+	def _submit(self, requests, batch_id):
+		now = time.time()
+		ids = [uuid.uuid4().hex for _ in requests]
+		rows = [(job_id, batch_id, QUEUED, json.dumps(request), now) for job_id, request in zip(ids, requests)]
+		self._transaction(lambda conn: conn.executemany(
+			"INSERT INTO jobs (id, batch_id, status, request, created_at) VALUES (?, ?, ?, ?, ?)", rows
+		))
+		self._stats["submitted"] += len(ids)
+		return ids
+
+	def _claim(self):
+		now = time.time()
+		# A plain read first, so idle polling never takes the database's write lock
+		with self._lock:
+			runnable = self._connection().execute(
+				"SELECT 1 FROM jobs WHERE status = ? OR (status = ? AND heartbeat_at < ?) LIMIT 1",
+				(QUEUED, RUNNING, now - self.lease)
+			).fetchone()
+		if runnable is None:
+			self._maybe_purge()
+			return None
+
+		def claim(conn):
+			# Oldest queued job first, then jobs whose worker stopped renewing its lease
+			row = conn.execute(
+				"SELECT id, status FROM jobs WHERE status = ? ORDER BY rowid LIMIT 1", (QUEUED,)
+			).fetchone()
+			while row is None:
+				expired = conn.execute(
+					"SELECT id, attempts FROM jobs WHERE status = ? AND heartbeat_at < ? ORDER BY rowid LIMIT 1",
+					(RUNNING, now - self.lease)
+				).fetchone()
+				if expired is None:
+					return None
+				if expired[1] < self.max_attempts:
+					row = (expired[0], RUNNING)
+					break
+				# Its worker died on every attempt (e.g. killed for running out of memory): don't run it again
+				error = f"Job stopped responding on each of its {expired[1]} attempts"
+				self._set_finished(conn, expired[0], FAILED, None, error, (RUNNING,))
+				self._stats["failed"] += 1
+				logger.warning("Job %s failed: %s", expired[0], error)
+			conn.execute(
+				"UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? WHERE id = ?",
+				(RUNNING, now, now, row[0])
+			)
+			return row[0], row[1], conn.execute(
+				"SELECT request, checkpoint, attempts FROM jobs WHERE id = ?", (row[0],)
+			).fetchone()
+
+		claimed = self._transaction(claim)
+		self._maybe_purge()
+		if claimed is None:
+			return None
+		job_id, previous_status, (request, checkpoint, attempts) = claimed
+		self._stats["claimed"] += 1
+		if previous_status == RUNNING:
+			self._stats["reclaimed"] += 1
+		return {
+			"id": job_id,
+			"request": json.loads(request),
+			"checkpoint": json.loads(checkpoint) if checkpoint else None,
+			"attempts": attempts,
+		}
+
+	def _checkpoint(self, job_id, checkpoint, rounds):
+		with self._lock:
+			cursor = self._connection().execute(
+				"UPDATE jobs SET checkpoint = ?, rounds = ?, heartbeat_at = ? WHERE id = ? AND status = ?",
+				(json.dumps(checkpoint, default=str), rounds, time.time(), job_id, RUNNING)
+			)
+		self._stats["checkpoints"] += 1
+		return cursor.rowcount > 0
+
+	def _heartbeat(self, job_ids):
+		now = time.time()
+		with self._lock:
+			self._connection().executemany(
+				"UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?", [(now, job_id, RUNNING) for job_id in job_ids]
+			)
+
+	def _set_finished(self, conn, job_id, status, result, error, from_statuses):
+		"""Record a job as finished, if it is still in one of from_statuses (in a transaction)."""
+		placeholders = ",".join("?" * len(from_statuses))
+		# finished_seq orders finished jobs across processes, for streaming a batch's results
+		seq = conn.execute("SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM jobs").fetchone()[0]
+		return conn.execute(
+			"UPDATE jobs SET status = ?, result = ?, error = ?, checkpoint = NULL, finished_at = ?, finished_seq = ? "
+			f"WHERE id = ? AND status IN ({placeholders})",
+			(status, json.dumps(result, default=str) if result is not None else None, error, time.time(), seq, job_id, *from_statuses)
+		).rowcount > 0
+
+	def _finish(self, job_id, status, result, error, from_statuses):
+		finished = self._transaction(lambda conn: self._set_finished(conn, job_id, status, result, error, from_statuses))
+		if finished and status in (SUCCEEDED, FAILED):
+			self._stats[status] += 1
+		return finished
+
+	def _release(self, job_id, error):
+		with self._lock:
+			self._connection().execute(
+				"UPDATE jobs SET status = ?, error = ? WHERE id = ? AND status = ?", (QUEUED, error, job_id, RUNNING)
+			)
+		if error:
+			self._stats["retried"] += 1
+
+	def _get(self, job_id):
+		with self._lock:
+			row = self._connection().execute(
+				"SELECT id, batch_id, status, request, rounds, result, error, attempts, created_at, started_at, finished_at "
+				"FROM jobs WHERE id = ?", (job_id,)
+			).fetchone()
+		return _job_dict(row) if row else None
+
+	def _batch(self, batch_id):
+		with self._lock:
+			rows = self._connection().execute(
+				"SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+			).fetchall()
+		if not rows:
+			return None
+		counts = dict(rows)
+		return {
+			"batch_id": batch_id,
+			"total": sum(counts.values()),
+			"counts": counts,
+			"done": not (counts.get(QUEUED) or counts.get(RUNNING)),
+		}
+
+	def _finished_after(self, batch_id, after_seq, limit):
+		with self._lock:
+			rows = self._connection().execute(
+				"SELECT id, batch_id, status, request, rounds, result, error, attempts, created_at, started_at, finished_at, finished_seq "
+				"FROM jobs WHERE batch_id = ? AND finished_seq > ? ORDER BY finished_seq LIMIT ?",
+				(batch_id, after_seq, limit)
+			).fetchall()
+		return [(_job_dict(row[:-1]), row[-1]) for row in rows]
+
+	def _counts(self):
+		with self._lock:
+			return dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+	def _maybe_purge(self):
+		now = time.time()
+		if now - self._last_purge < self.PURGE_INTERVAL:
+			return
+		self._last_purge = now
+		with self._lock:
+			purged = self._connection().execute(
+				"DELETE FROM jobs WHERE finished_at < ?", (now - self.retention,)
+			).rowcount
+		self._stats["purged"] += purged
+
+	async def submit(self, requests, batch_id=None):
+		"""
+		Queue requests as jobs.
+
+		Args:
+			requests (list): The requests, as JSON-serializable dicts.
+			batch_id (str): Batch the jobs belong to. A new one is generated if None.
+
+		Returns:
+			tuple: (batch_id, list of job ids in the order of requests)
+		"""
+		batch_id = batch_id or uuid.uuid4().hex
+		return batch_id, await self._run(self._submit, requests, batch_id)
+
+	async def claim(self):
+		"""Claim the next job to run: {"id", "request", "checkpoint", "attempts"}, or None if there is none."""
+		return await self._run(self._claim)
+
+	async def checkpoint(self, job_id, checkpoint, rounds):
+		"""Save the checkpoint of a running job. Returns False if the job is no longer running (e.g. cancelled)."""
+		return await self._run(self._checkpoint, job_id, checkpoint, rounds)
+
+	async def heartbeat(self, job_ids):
+		"""Renew the lease of running jobs."""
+		if job_ids:
+			await self._run(self._heartbeat, job_ids)
+
+	async def succeed(self, job_id, result):
+		"""Record the result of a job."""
+		return await self._run(self._finish, job_id, SUCCEEDED, result, None, (RUNNING,))
+
+	async def fail(self, job_id, error):
+		"""Record that a job has failed for good."""
+		return await self._run(self._finish, job_id, FAILED, None, error, (RUNNING,))
+
+	async def cancel(self, job_id):
+		"""Cancel a queued or running job. Returns False if it had already finished (or doesn't exist)."""
+		return await self._run(self._finish, job_id, CANCELLED, None, None, (QUEUED, RUNNING))
+
+	async def release(self, job_id, error=None):
+		"""Put a running job back in the queue (keeping its checkpoint), e.g. to retry it."""
+		await self._run(self._release, job_id, error)
+
+	async def get(self, job_id):
+		"""A job's status, request, result or error, or None if there is no such job."""
+		return await self._run(self._get, job_id)
+
+	async def batch(self, batch_id):
+		"""Job counts per status of a batch, and whether all its jobs have finished; None if unknown."""
+		return await self._run(self._batch, batch_id)
+
+	async def finished_after(self, batch_id, after_seq=0, limit=100):
+		"""
+		Jobs of a batch that finished after a point, in the order they finished.
+
+		Returns:
+			list: (job, finished_seq) pairs; pass the last finished_seq back to continue.
+		"""
+		return await self._run(self._finished_after, batch_id, after_seq, limit)
+
+	def close(self):
+		with self._lock:
+			if self._conn is not None:
+				self._conn.close()
+				self._conn = None
+
+	def stats(self):
+		"""
+		Job queue counters.
+
+		Returns:
+			dict: Jobs per status in the database, counters of this process, and configuration.
+		"""
+		stats = dict(self._stats)
+		try:
+			stats["jobs"] = self._counts()
+		except sqlite3.Error as e:
+			stats["jobs"] = {"error": str(e)}
+		stats["path"] = self.path
+		stats["lease"] = self.lease
+		stats["retention"] = self.retention
+		stats["max_attempts"] = self.max_attempts
+		return stats
+
+
+def _job_dict(row):
+	job_id, batch_id, status, request, rounds, result, error, attempts, created_at, started_at, finished_at = row
+	return {
+		"id": job_id,
+		"batch_id": batch_id,
+		"status": status,
+		"request": json.loads(request),
+		"rounds": rounds,
+		"result": json.loads(result) if result else None,
+		"error": error,
+		"attempts": attempts,
+		"created_at": created_at,
+		"started_at": started_at,
+		"finished_at": finished_at,
+	}
+
+
+class JobWorkers:
+	"""
+	A pool of async workers running jobs from a JobStore.
+
+	Args:
+		store (JobStore): The queue.
+		run_job: Async callable run_job(job, checkpoint) returning the job's result. It
+			must await checkpoint(data, rounds) after each completed round; that raises
+			JobCancelled if the job was cancelled meanwhile.
+		concurrency (int): Jobs run at once by this process.
+		poll_interval (float): Seconds between checks for jobs submitted by other processes.
+	"""
+
+	def __init__(self, store, run_job, concurrency=8, poll_interval=1.0):
+		self.store = store
+		self.run_job = run_job
+		self.concurrency = concurrency
+		self.poll_interval = poll_interval
+		self._slots = None
+		self._wake = None
+		self._tasks = []
+		self._running = {}
+
+	def start(self):
+		"""Start the dispatcher and the lease heartbeat on the running loop."""
+		self._slots = asyncio.Semaphore(self.concurrency)
+		self._wake = asyncio.Event()
+		self._tasks = [asyncio.ensure_future(self._dispatch()), asyncio.ensure_future(self._heartbeat())]
+
+	def notify(self):
+		"""Wake the dispatcher, e.g. right after jobs were submitted."""
+		if self._wake is not None:
+			self._wake.set()
+
+	async def stop(self):
+		"""Stop taking jobs and put the running ones back in the queue (they resume from their checkpoints)."""
+		for task in self._tasks:
+			task.cancel()
+		running = list(self._running.values())
+		for task in running:
+			task.cancel()
+		await asyncio.gather(*self._tasks, *running, return_exceptions=True)
+		self._tasks = []
+
+	async def _dispatch(self):
+		while True:
+			await self._slots.acquire()
+			try:
+				job = await self.store.claim()
+			except Exception as e:
+				logger.warning("Error claiming a job: %s", e)
+				job = None
+			if job is None:
+				self._slots.release()
+				self._wake.clear()
+				try:
+					await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+				except asyncio.TimeoutError:
+					pass
+				continue
+			self._running[job["id"]] = asyncio.ensure_future(self._run(job))
+
+	async def _heartbeat(self):
+		while True:
+			await asyncio.sleep(self.store.lease / 3)
+			try:
+				await self.store.heartbeat(list(self._running))
+			except Exception as e:
+				logger.warning("Error renewing job leases: %s", e)
+
+	async def _run(self, job):
+		job_id = job["id"]
+
+		async def checkpoint(data, rounds):
+			if not await self.store.checkpoint(job_id, data, rounds):
+				raise JobCancelled(job_id)
+
+		try:
+			result = await self.run_job(job, checkpoint)
+			await self.store.succeed(job_id, result)
+		except JobCancelled:
+			pass
+		except asyncio.CancelledError:
+			# Shutting down: hand the job back, it resumes from its last checkpoint
+			await self.store.release(job_id)
+			raise
+		except Exception as e:
+			error = str(e) or type(e).__name__
+			if job["attempts"] >= self.store.max_attempts:
+				logger.warning("Job %s failed after %d attempts: %s", job_id, job["attempts"], error)
+				await self.store.fail(job_id, error)
+			else:
+				await self.store.release(job_id, error)
+				self.notify()
+		finally:
+			self._running.pop(job_id, None)
+			self._slots.release()
+
+	def stats(self):
+		"""Workers of this process: configured concurrency and jobs running now."""
+		return {"concurrency": self.concurrency, "running": len(self._running)}
+
+
+_store = None
+
+def get_job_store():
+	"""
+	Get the process-wide job store, or None unless jobs are enabled with POWERUPS_JOBS=1.
+
+	Settings:
+		POWERUPS_JOBS_PATH: Database file (default: powerups_jobs.sqlite3 in the temp dir).
+		POWERUPS_JOBS_LEASE: Seconds before a job whose worker went silent is run again (default 300).
+		POWERUPS_JOBS_RETENTION: Seconds finished jobs are kept (default 7 days).
+		POWERUPS_JOBS_MAX_ATTEMPTS: Attempts before a job is marked failed (default 3).
+	"""
+	global _store
+	if _store is None and env_bool("POWERUPS_JOBS", False):
+		_store = JobStore(
+			path=os.getenv("POWERUPS_JOBS_PATH") or os.path.join(tempfile.gettempdir(), "powerups_jobs.sqlite3"),
+			lease=env_float("POWERUPS_JOBS_LEASE", 300),
+			retention=env_float("POWERUPS_JOBS_RETENTION", 7 * 24 * 3600),
+			max_attempts=env_int("POWERUPS_JOBS_MAX_ATTEMPTS", 3)
+		)
+	return _store
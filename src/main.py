@@ -1,19 +1,54 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import json
 import asyncio
+import logging
 import os
-from openai import OpenAI
+import sys
+from contextlib import asynccontextmanager
 
-# Import the tools and functions from example.py
-from internet.search.tools import google_search
-from internet.browse.tools import get_website_url_content
-from utils.tool_decorator import get_tool_definition, create_tools_list
+# Tools are declared in the manifest and their modules imported the first time a request uses them
+from internet.manifest import TOOL_MODULES
+from internet.search.scheduler import get_search_scheduler
+from internet.browse.page_store import get_page_store
+from internet.browse.prefetch import prefetch_scope, prefetch_stats
+from utils.tool_decorator import TOOL_CALL_COALESCING, dispatch_tool_call, format_tool_output, get_tool, load_tool, register_tool_modules, tool_loading_stats, tool_names
+from utils.http_client import get_http_pool, close_http_pool
+from utils.config import env_bool, env_int, env_float
+from utils.deadline import DeadlineExceeded
+from utils.metrics import REGISTRY, new_trace
+from agent import run_agent, format_sse
+from jobs import JobWorkers, get_job_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	"""Open the shared HTTP client pool and start the job workers on startup; stop and close them (and the page cache) on shutdown"""
+	if PRELOAD_TOOLS:
+		for tool_name in ENABLED_TOOLS:
+			load_tool(tool_name)
+	await get_http_pool().start()
+	if JOB_WORKERS:
+		JOB_WORKERS.start()
+	yield
+	if JOB_WORKERS:
+		await JOB_WORKERS.stop()
+	if get_job_store():
+		get_job_store().close()
+	await close_http_pool()
+	get_search_scheduler().close()
+	browse_tools = loaded_tool_module("internet.browse.tools")
+	if browse_tools:
+		browse_tools.CONVERT_POOL.shutdown()
+	if get_page_store():
+		get_page_store().close()
+
+# Log levels for the app's own loggers (e.g. per-round agent stats at INFO)
+logging.basicConfig(level=os.getenv("POWERUPS_LOG_LEVEL", "INFO").upper())
 
 # Initialize FastAPI app
-app = FastAPI(title="PowerUp Demo API")
+app = FastAPI(title="PowerUp Demo API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,39 +59,84 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+register_tool_modules(TOOL_MODULES)
+
+# Tools requests may use (comma separated; all tools in the manifest by default)
+ENABLED_TOOLS = [name.strip() for name in os.getenv("POWERUPS_ENABLED_TOOLS", "").split(",") if name.strip()] or tool_names()
+
+# Import the enabled tools at startup rather than on first use (trades cold start for first-request latency)
+PRELOAD_TOOLS = env_bool("POWERUPS_PRELOAD_TOOLS", False)
+
+def loaded_tool_module(module):
+	"""A tool module if it has been imported already, else None (so stats and shutdown don't import it)"""
+	return sys.modules.get(module)
+
+_openai_client = None
+
+def get_openai_client():
+	"""The OpenAI client (async, so model round trips don't block the event loop), created on first use since openai is slow to import"""
+	global _openai_client
+	if _openai_client is None:
+		from openai import AsyncOpenAI
+		_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+	return _openai_client
+
+# Default (and maximum) time budget per request in seconds, and maximum model rounds
+REQUEST_DEADLINE = env_float("POWERUPS_REQUEST_DEADLINE", 120)
+MAX_ROUNDS = env_int("POWERUPS_MAX_ROUNDS", 10)
 
 # Request model
 class PowerUpRequest(BaseModel):
 	tools: List[str]
 	message: str
+	# Positive when given; 0 or less would end the request before it starts
+	deadline_seconds: Optional[float] = Field(None, gt=0)
+	max_rounds: Optional[int] = Field(None, gt=0)
+
+def request_limits(request):
+	"""The time budget and round limit for a request, which may lower but not raise the server's"""
+	deadline = min(request.deadline_seconds or REQUEST_DEADLINE, REQUEST_DEADLINE) if REQUEST_DEADLINE else request.deadline_seconds
+	max_rounds = min(request.max_rounds or MAX_ROUNDS, MAX_ROUNDS) if MAX_ROUNDS else request.max_rounds
+	return {"deadline": deadline, "max_rounds": max_rounds}
 
 # Response model
 class PowerUpResponse(BaseModel):
 	response: str
 	tool_calls_executed: List[Dict[str, Any]]
+	metadata: Dict[str, Any] = {}
+
+# Bulk job submission model
+class JobSubmitRequest(BaseModel):
+	requests: List[PowerUpRequest]
+	batch_id: Optional[str] = None
+
+# Batch search request model
+class BatchSearchRequest(BaseModel):
+	queries: List[str]
+	max_results: int = 10
 
 async def execute_tool_call_async(tool_call):
-	"""Execute a tool call based on the name and arguments, supporting async functions"""
-	name = tool_call.name
-	args = json.loads(tool_call.arguments)
-	
-	if name == "google_search":
-		query = args.get("query")
-		api_key = os.getenv("GOOGLE_CONSTELLA_API_KEY")
-		search_id = os.getenv("GOOGLE_SEARCH_CX_ID")
-		return google_search(query, api_key, search_id)
-	
-	elif name == "get_website_url_content":
-		url = args.get("url")
-		ignore_links = args.get("ignore_links", False)
-		max_length = args.get("max_length", None)
-		# Call the async function and await its result
-		result = await get_website_url_content(url, ignore_links, max_length)
-		return result
-	
-	return {"error": f"Unknown tool: {name}"}
+	"""Execute a tool call through the tool registry (sync tools run off the event loop)"""
+	if tool_call.name not in ENABLED_TOOLS:
+		return {"error": f"Unknown tool: {tool_call.name}"}
+	return await dispatch_tool_call(tool_call.name, tool_call.arguments)
+
+def format_tool_call_output(tool_call, result):
+	"""Project a tool result to what the model needs and trim it to the tool's token budget"""
+	return format_tool_output(tool_call.name, result)
+
+def get_enabled_tool(tool_name):
+	"""Load an enabled tool by name (importing it on first use), rejecting unknown or disabled ones"""
+	if tool_name not in ENABLED_TOOLS:
+		raise HTTPException(status_code=400, detail=f"Unknown tool: {tool_name}")
+	try:
+		return get_tool(tool_name)
+	except (KeyError, ImportError) as e:
+		raise HTTPException(status_code=503, detail=f"Tool {tool_name} is unavailable: {e}")
+
+def get_available_tools(tool_names):
+	"""Get the (precomputed, once loaded) tool definitions for the requested tool names, rejecting unknown ones"""
+	return [get_enabled_tool(tool_name).definition for tool_name in tool_names]
 
 @app.post("/powerup-demo", response_model=PowerUpResponse)
 async def powerup_demo(request: PowerUpRequest):
@@ -68,63 +148,209 @@ async def powerup_demo(request: PowerUpRequest):
 	2. Execute any tool calls requested by the AI
 	3. Return the final AI response
 	"""
-	# Map tool names to their function definitions
-	tool_map = {
-		"google_search": google_search,
-		"get_website_url_content": get_website_url_content
-	}
+	available_tools = get_available_tools(request.tools)
+	new_trace()
+	
+	try:
+		with prefetch_scope():
+			async for event in run_agent(get_openai_client(), request.message, available_tools, execute_tool_call_async,
+					format_output=format_tool_call_output, **request_limits(request)):
+				if event["type"] == "response.done":
+					final = event
+	except DeadlineExceeded as e:
+		raise HTTPException(status_code=504, detail=str(e))
 	
-	# Filter and create tool definitions based on requested tools
-	available_tools = []
-	for tool_name in request.tools:
-		if tool_name in tool_map:
-			available_tools.append(get_tool_definition(tool_map[tool_name]))
-		else:
-			raise HTTPException(status_code=400, detail=f"Unknown tool: {tool_name}")
+	return PowerUpResponse(
+		response=final["response"],
+		tool_calls_executed=final["tool_calls_executed"],
+		metadata=final["metadata"]
+	)
+
+@app.post("/powerup-demo/stream")
+async def powerup_demo_stream(request: PowerUpRequest):
+	"""
+	Streaming variant of /powerup-demo, sent as Server-Sent Events.
 	
-	# Initialize conversation with user message
-	input_messages = [{"role": "user", "content": request.message}]
-	tool_calls_executed = []
+	Emits tool_call.started / tool_call.finished events as tools run and
+	output_text.delta events as the model produces tokens. The last event,
+	response.done, carries the same fields as PowerUpResponse.
+	"""
+	available_tools = get_available_tools(request.tools)
 	
-	# Continue processing until we get a text response (no more tool calls)
-	while True:
-		# Call the model with current conversation
-		response = openai_client.responses.create(
-			model="gpt-4o",
-			input=input_messages,
-			tools=available_tools
-		)
-		
-		# Check if there are any tool calls to process
-		has_tool_calls = False
-		for tool_call in response.output:
-			if tool_call.type == "function_call":
-				has_tool_calls = True
-				
-				# Execute the tool call
-				result = await execute_tool_call_async(tool_call)
-				
-				# Track executed tool calls for response
-				tool_calls_executed.append({
-					"name": tool_call.name,
-					"arguments": json.loads(tool_call.arguments),
-					"result": result
-				})
-				
-				# Add the function call and result to messages
-				input_messages.append(tool_call)
-				input_messages.append({
-					"type": "function_call_output",
-					"call_id": tool_call.call_id,
-					"output": json.dumps(result) if not isinstance(result, str) else result
-				})
-		
-		# If no tool calls were made, we have our final text response
-		if not has_tool_calls:
-			break
+	async def event_stream():
+		new_trace()
+		try:
+			with prefetch_scope():
+				async for event in run_agent(get_openai_client(), request.message, available_tools, execute_tool_call_async,
+						stream=True, format_output=format_tool_call_output, **request_limits(request)):
+					yield format_sse(event)
+		except Exception as e:
+			yield format_sse({"type": "error", "error": str(e)})
 	
+	return StreamingResponse(
+		event_stream(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+	)
+
+# Jobs one POST /jobs may submit, and jobs run at once by each process
+MAX_JOBS_PER_SUBMIT = env_int("POWERUPS_JOBS_MAX_SUBMIT", 1000)
+JOB_CONCURRENCY = env_int("POWERUPS_JOBS_WORKERS", 8)
+
+async def run_job(job, checkpoint):
+	"""Run a queued PowerUpRequest to completion, checkpointing after every round (and resuming from the last checkpoint)"""
+	request = PowerUpRequest(**job["request"])
+	available_tools = get_available_tools(request.tools)
+	new_trace()
+	with prefetch_scope():
+		async for event in run_agent(get_openai_client(), request.message, available_tools, execute_tool_call_async,
+				format_output=format_tool_call_output, checkpoints=True, resume=job["checkpoint"], **request_limits(request)):
+			if event["type"] == "round.completed":
+				await checkpoint(event["checkpoint"], event["round"])
+			elif event["type"] == "response.done":
+				final = event
 	return PowerUpResponse(
-		response=response.output_text,
-		tool_calls_executed=tool_calls_executed
+		response=final["response"],
+		tool_calls_executed=final["tool_calls_executed"],
+		metadata=final["metadata"]
+	).model_dump()
+
+JOB_WORKERS = JobWorkers(get_job_store(), run_job, concurrency=JOB_CONCURRENCY) if get_job_store() and JOB_CONCURRENCY else None
+
+def require_job_store():
+	if not get_job_store():
+		raise HTTPException(status_code=404, detail="Jobs are disabled (enable them with POWERUPS_JOBS=1)")
+	return get_job_store()
+
+@app.post("/jobs")
+async def submit_jobs(request: JobSubmitRequest):
+	"""
+	Queue many /powerup-demo requests at once.
+	
+	Returns the batch ID and one job ID per request, in order. Poll a job with
+	GET /jobs/{job_id}, or follow the whole batch with GET /jobs/batches/{batch_id}/stream.
+	"""
+	store = require_job_store()
+	if not request.requests:
+		raise HTTPException(status_code=400, detail="No requests to submit")
+	if len(request.requests) > MAX_JOBS_PER_SUBMIT:
+		raise HTTPException(status_code=400, detail=f"At most {MAX_JOBS_PER_SUBMIT} requests per submission")
+	for job_request in request.requests:
+		get_available_tools(job_request.tools)
+	batch_id, job_ids = await store.submit([job_request.model_dump() for job_request in request.requests], request.batch_id)
+	if JOB_WORKERS:
+		JOB_WORKERS.notify()
+	return {"batch_id": batch_id, "job_ids": job_ids}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+	"""A job's status, and its result (the PowerUpResponse fields) or error once finished."""
+	job = await require_job_store().get(job_id)
+	if job is None:
+		raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+	return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+	"""Cancel a queued or running job (a running one stops after its current round)."""
+	store = require_job_store()
+	if not await store.cancel(job_id):
+		job = await store.get(job_id)
+		if job is None:
+			raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+		raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+	return {"id": job_id, "status": "cancelled"}
+
+@app.get("/jobs/batches/{batch_id}")
+async def get_batch(batch_id: str):
+	"""Job counts per status of a batch, and whether every job has finished."""
+	batch = await require_job_store().batch(batch_id)
+	if batch is None:
+		raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+	return batch
+
+@app.get("/jobs/batches/{batch_id}/stream")
+async def stream_batch(batch_id: str, poll_interval: float = 0.5):
+	"""
+	The results of a batch as its jobs finish, sent as Server-Sent Events.
+	
+	Emits one job.finished event per job (already finished ones first), then
+	batch.done with the final counts.
+	"""
+	store = require_job_store()
+	if await store.batch(batch_id) is None:
+		raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+	poll_interval = min(max(poll_interval, 0.1), 10.0)
+	
+	async def event_stream():
+		after = 0
+		while True:
+			# Read the counts before the finished jobs, so no job finishing in between is missed
+			batch = await store.batch(batch_id)
+			while True:
+				finished = await store.finished_after(batch_id, after)
+				for job, after in finished:
+					yield format_sse({"type": "job.finished", "job": job})
+				if len(finished) < 100:
+					break
+			if batch["done"]:
+				yield format_sse({"type": "batch.done", "batch": batch})
+				return
+			await asyncio.sleep(poll_interval)
+	
+	return StreamingResponse(
+		event_stream(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 	)
 
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+	"""
+	Run several Google searches concurrently and return one merged, deduplicated result list.
+	"""
+	result = await get_enabled_tool("google_search_batch").func(request.queries, max_results=request.max_results)
+	if "results" not in result:
+		raise HTTPException(status_code=400 if "errors" not in result else 502, detail=result)
+	return result
+
+@app.get("/tools")
+async def list_tools():
+	"""The definitions of every enabled tool (which imports all of them)."""
+	return Response(content="[" + ", ".join(get_enabled_tool(name).definition_json for name in ENABLED_TOOLS) + "]", media_type="application/json")
+
+def tool_module_stats(module, name):
+	"""Stats source for an object of a tool module, reporting None until the module has been loaded"""
+	def collect():
+		loaded = loaded_tool_module(module)
+		return getattr(loaded, name).stats() if loaded else None
+	return collect
+
+# Sources of /stats, also exported as gauges on /metrics
+STATS_SOURCES = {
+	"http_pool": lambda: get_http_pool().stats(),
+	"search_cache": tool_module_stats("internet.search.tools", "SEARCH_CACHE"),
+	"search_scheduler": lambda: get_search_scheduler().stats(),
+	"tool_call_coalescing": TOOL_CALL_COALESCING.stats,
+	"tool_loading": tool_loading_stats,
+	"page_cache": lambda: get_page_store().stats() if get_page_store() else None,
+	"html_to_text": tool_module_stats("internet.browse.tools", "CONVERT_POOL"),
+	"fetch_hedging": tool_module_stats("internet.browse.tools", "FETCH_LATENCY"),
+	"host_breakers": tool_module_stats("internet.browse.tools", "HOST_BREAKERS"),
+	"failed_urls": tool_module_stats("internet.browse.tools", "FAILED_URLS"),
+	"passage_indexes": tool_module_stats("internet.browse.tools", "PASSAGE_INDEXES"),
+	"prefetch": prefetch_stats,
+	"jobs": lambda: dict(get_job_store().stats(), workers=JOB_WORKERS.stats() if JOB_WORKERS else None) if get_job_store() else None
+}
+for name, collect in STATS_SOURCES.items():
+	REGISTRY.add_collector(f"powerups_{name}", collect)
+
+@app.get("/stats")
+async def stats():
+	"""Runtime statistics: HTTP connection reuse, cache hit rates, coalesced tool calls, conversion pool load and failing hosts."""
+	return {name: collect() for name, collect in STATS_SOURCES.items()}
+
+@app.get("/metrics")
+async def metrics():
+	"""Latency histograms of model rounds, tool calls, fetches and conversions, byte counters and the /stats numbers, in the Prometheus text format."""
+	return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
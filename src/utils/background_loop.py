@@ -0,0 +1,121 @@
+"""
+A long-lived event loop in a background thread, for calling async code from sync code.
+
+asyncio.run() creates and tears down an event loop per call, and with it every
+pooled connection (the shared HTTP client is bound to the loop it was first used
+on). Synchronous callers that make many tool calls instead submit coroutines to
+one loop that runs for the life of the process, so its clients, connection
+pools and caches are reused across calls.
+"""
+import asyncio
+import atexit
+import threading
+
+from utils.http_client import close_http_pool
+
+
+class BackgroundLoop:
+    """
+    An event loop running forever in a daemon thread.
+
+    The loop and its thread start on first use. Coroutines are run with run()
+    (blocking the calling thread until the result is ready) or submit() (returning
+    a concurrent.futures.Future).
+
+    Args:
+        name (str): Name of the loop's thread.
+    """
+
+    def __init__(self, name="powerups-background-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The event loop, started on first access."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                loop = asyncio.new_event_loop()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the loop.
+
+        Returns:
+            concurrent.futures.Future: Its eventual result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the loop and wait for its result.
+
+        Args:
+            coro: The coroutine.
+            timeout (float): Seconds to wait; the coroutine is cancelled if it takes longer.
+
+        Returns:
+            The coroutine's result (its exception is raised here).
+
+        Raises:
+            RuntimeError: If called from the loop's own thread, which would deadlock.
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() called from the loop's own thread; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # A timeout or an interrupt (e.g. Ctrl-C) in the caller: don't leave the coroutine running
+            future.cancel()
+            raise
+
+    def stop(self, timeout=5.0):
+        """Close the shared HTTP client, then stop the loop and its thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(close_http_pool(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop():
+    """The process-wide BackgroundLoop, stopped at interpreter exit."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop()
+            atexit.register(_background_loop.stop)
+        return _background_loop
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the process-wide background loop and return its result."""
+    return get_background_loop().run(coro, timeout)
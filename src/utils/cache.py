@@ -0,0 +1,192 @@
+"""
+In-process result caching for tools.
+
+TTLCache is a bounded, thread-safe mapping with per-entry expiry and LRU
+eviction. The cached() decorator puts one in front of a sync or async function,
+and is what the `cache` option of @tool uses.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def normalize_text(text):
+    """
+    Normalize free text for use in a cache key.
+
+    Case and runs of whitespace are ignored, so "Latest AI  developments" and
+    "latest ai developments" produce the same key.
+    """
+    return " ".join(str(text).split()).casefold()
+
+
+class TTLCache:
+    """
+    A bounded cache with time-to-live expiry and least-recently-used eviction.
+
+    Args:
+        maxsize (int): Maximum number of entries before the least recently used is evicted.
+        ttl (float): Seconds a regular entry stays valid.
+        negative_ttl (float, optional): Seconds a negative entry (e.g. "No results found")
+            stays valid. Defaults to ttl.
+        name (str, optional): Name used when reporting stats.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, negative_ttl=None, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "negative_hits": 0}
+
+    def get(self, key, default=None):
+        """
+        Look up a key, refreshing its LRU position.
+
+        Returns:
+            The cached value, or default if the key is missing or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            value, expires_at, negative = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            if negative:
+                self._stats["negative_hits"] += 1
+            return value
+
+    def set(self, key, value, negative=False, ttl=None):
+        """
+        Store a value, evicting least recently used entries if the cache is full.
+
+        Args:
+            key: Hashable cache key.
+            value: The value to store.
+            negative (bool): Store as a negative entry, using negative_ttl.
+            ttl (float, optional): Override the entry's time to live.
+        """
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl, negative)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Hit/miss/eviction counters for the cache.
+
+        Returns:
+            dict: Counters, current size and configuration.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["maxsize"] = self.maxsize
+        stats["ttl"] = self.ttl
+        stats["negative_ttl"] = self.negative_ttl
+        if self.name:
+            stats["name"] = self.name
+        return stats
+
+
+def default_cache_key(func):
+    """
+    Build the default key function for a cached function: its bound arguments,
+    with defaults applied, serialized as JSON.
+    """
+    signature = inspect.signature(func)
+
+    def key(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return json.dumps(bound.arguments, sort_keys=True, default=str)
+
+    return key
+
+
+def _is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def cached(cache, key=None, is_negative=None):
+    """
+    Decorator caching a function's results in a TTLCache.
+
+    Results that are {"error": ...} dicts are not cached, unless is_negative
+    says they are an expected "negative" answer (such as no search results), in
+    which case they are cached for the cache's negative_ttl. Cached values are
+    shared between callers and should be treated as read-only.
+
+    Args:
+        cache (TTLCache): The cache to use.
+        key (callable, optional): Called with the function's arguments to build the
+            cache key. Defaults to the bound arguments serialized as JSON.
+        is_negative (callable, optional): Called with an error result; return True
+            to cache it as a negative entry.
+
+    Returns:
+        callable: Decorator for a sync or async function.
+    """
+    def decorator(func):
+        make_key = key or default_cache_key(func)
+
+        def store(cache_key, result):
+            if not _is_error(result):
+                cache.set(cache_key, result)
+            elif is_negative is not None and is_negative(result):
+                cache.set(cache_key, result, negative=True)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key = make_key(*args, **kwargs)
+                result = cache.get(cache_key, _MISSING)
+                if result is _MISSING:
+                    result = await func(*args, **kwargs)
+                    store(cache_key, result)
+                return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = make_key(*args, **kwargs)
+                result = cache.get(cache_key, _MISSING)
+                if result is _MISSING:
+                    result = func(*args, **kwargs)
+                    store(cache_key, result)
+                return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
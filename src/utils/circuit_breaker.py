@@ -0,0 +1,160 @@
+"""
+Per-host circuit breakers.
+
+After a run of consecutive failures (connection errors, timeouts, 5xx) a host's
+breaker opens and requests to it fail immediately instead of each waiting for a
+timeout. Once reset_timeout has passed the breaker is half-open: a single probe
+request goes through, and its outcome closes the breaker again or re-opens it.
+Failures below the threshold are forgotten after reset_timeout without another one.
+"""
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised when a request is refused because its host's breaker is open."""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"{host} is failing; not retrying for another {retry_in:.0f} seconds")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class _HostState:
+    __slots__ = ("failures", "failed_at", "opened_at", "probe_started_at")
+
+    def __init__(self):
+        self.failures = 0
+        self.failed_at = None
+        self.opened_at = None
+        self.probe_started_at = None
+
+
+class CircuitBreakers:
+    """
+    A circuit breaker per host.
+
+    Hosts are only tracked while they have recent failures, so healthy hosts cost
+    nothing: a host below the threshold is dropped once reset_timeout passes
+    without another failure.
+
+    Args:
+        name (str): Name used when reporting stats.
+        failure_threshold (int): Consecutive failures that open a host's breaker.
+        reset_timeout (float): Seconds a breaker stays open before a probe is allowed.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts = {}
+        self._swept_at = time.monotonic()
+        self._stats = {"trips": 0, "rejected": 0, "probes": 0, "recoveries": 0, "expired": 0}
+
+    def _expired(self, host_state, now):
+        """Whether a closed breaker's failures are too old to count."""
+        return host_state.opened_at is None and now - host_state.failed_at >= self.reset_timeout
+
+    def _sweep(self, now):
+        """Drop the hosts whose failures expired, at most once per reset_timeout."""
+        if now - self._swept_at < self.reset_timeout:
+            return
+        self._swept_at = now
+        for host in [host for host, host_state in self._hosts.items() if self._expired(host_state, now)]:
+            del self._hosts[host]
+            self._stats["expired"] += 1
+
+    def _state(self, host_state, now):
+        if host_state.opened_at is None:
+            return CLOSED
+        if now - host_state.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def state(self, host):
+        """The breaker state of a host: "closed", "open" or "half_open"."""
+        host_state = self._hosts.get(host)
+        return self._state(host_state, time.monotonic()) if host_state else CLOSED
+
+    def before_request(self, host):
+        """
+        Check that a request to host may go ahead.
+
+        Raises:
+            CircuitOpen: If the breaker is open, or half-open with a probe already in flight.
+        """
+        host_state = self._hosts.get(host)
+        if host_state is None:
+            return
+        now = time.monotonic()
+        state = self._state(host_state, now)
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back (e.g. it was
+            # cancelled) stops blocking others after reset_timeout
+            if host_state.probe_started_at is None or now - host_state.probe_started_at >= self.reset_timeout:
+                host_state.probe_started_at = now
+                self._stats["probes"] += 1
+                return
+        self._stats["rejected"] += 1
+        raise CircuitOpen(host, max(0.0, host_state.opened_at + self.reset_timeout - now))
+
+    def record_success(self, host):
+        """The host answered: close its breaker."""
+        host_state = self._hosts.pop(host, None)
+        if host_state is not None and host_state.opened_at is not None:
+            self._stats["recoveries"] += 1
+
+    def record_failure(self, host):
+        """The host failed: count it, opening the breaker at the threshold (or re-opening it after a failed probe)."""
+        now = time.monotonic()
+        self._sweep(now)
+        host_state = self._hosts.get(host)
+        if host_state is not None and self._expired(host_state, now):
+            # The earlier failures are too long ago to count towards this run
+            host_state.failures = 0
+            self._stats["expired"] += 1
+        if host_state is None:
+            host_state = self._hosts[host] = _HostState()
+        host_state.failures += 1
+        host_state.failed_at = now
+        if host_state.opened_at is not None:
+            if host_state.probe_started_at is not None:
+                # The probe failed: stay open for another reset_timeout
+                host_state.opened_at = now
+                host_state.probe_started_at = None
+        elif host_state.failures >= self.failure_threshold:
+            host_state.opened_at = now
+            self._stats["trips"] += 1
+
+    def stats(self):
+        """
+        Breaker counters and the hosts that are currently failing.
+
+        Returns:
+            dict: Trips, rejected requests, probes, recoveries, expired failure runs, configuration and,
+            per failing host, its state, consecutive failures and seconds until the next probe.
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        hosts = {}
+        for host, host_state in self._hosts.items():
+            if self._expired(host_state, now):
+                continue
+            state = self._state(host_state, now)
+            hosts[host] = {
+                "state": state,
+                "failures": host_state.failures,
+                "retry_in": round(max(0.0, host_state.opened_at + self.reset_timeout - now), 1) if state == OPEN else 0.0,
+            }
+        stats = dict(self._stats)
+        stats["open"] = sum(1 for host in hosts.values() if host["state"] != CLOSED)
+        stats["hosts"] = hosts
+        stats["failure_threshold"] = self.failure_threshold
+        stats["reset_timeout"] = self.reset_timeout
+        return stats
@@ -0,0 +1,28 @@
+"""
+Helpers for reading powerup settings from environment variables.
+"""
+import os
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment, falling back to a default."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def env_float(name, default):
+    """Read a float setting from the environment, falling back to a default."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def env_bool(name, default):
+    """Read a boolean setting from the environment, falling back to a default."""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
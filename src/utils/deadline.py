@@ -0,0 +1,133 @@
+"""
+Per-request deadlines.
+
+A request's deadline is an absolute time.monotonic() value kept in a context
+variable, so every task started on behalf of the request (tool calls, page
+fetches, searches) sees it without it being passed through each signature.
+Timeouts further down are capped to the time that is left.
+"""
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+# A time.monotonic() value, or a SharedDeadline
+_deadline = contextvars.ContextVar("powerups_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a request has run out of time."""
+
+
+class SharedDeadline:
+    """
+    The deadline of work shared by several requests, which can be moved later
+    while it runs (tasks it started see the change too).
+
+    Args:
+        deadline (float): A time.monotonic() value, or None for no deadline.
+    """
+
+    __slots__ = ("deadline",)
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def extend(self, deadline):
+        """Move the deadline to `deadline` if that is later; None removes it."""
+        if self.deadline is not None and (deadline is None or deadline > self.deadline):
+            self.deadline = deadline
+
+
+def _get():
+    value = _deadline.get()
+    return value.deadline if isinstance(value, SharedDeadline) else value
+
+
+def set_shared_deadline(shared):
+    """
+    Make a SharedDeadline the deadline of the current context. For code running
+    work in a context of its own (see utils.singleflight).
+
+    Args:
+        shared (SharedDeadline): The deadline.
+    """
+    _deadline.set(shared)
+
+
+def expires_at(seconds):
+    """
+    The absolute deadline for a budget starting now.
+
+    Args:
+        seconds (float): The budget. None or 0 means no deadline.
+
+    Returns:
+        float: A time.monotonic() value, or None.
+    """
+    return time.monotonic() + seconds if seconds else None
+
+
+def current_deadline():
+    """The deadline of the current context (a time.monotonic() value), or None."""
+    return _get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """
+    Set the deadline for code run in this block, and for tasks created in it.
+
+    A deadline later than the one already in effect is ignored, so a nested
+    scope can only shorten the budget.
+
+    Args:
+        deadline (float): A time.monotonic() value, or None to leave it unchanged.
+    """
+    outer = _get()
+    if deadline is None or (outer is not None and outer <= deadline):
+        yield
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(deadline=None):
+    """
+    Seconds left before the deadline.
+
+    Args:
+        deadline (float, optional): A time.monotonic() value. Defaults to the current context's.
+
+    Returns:
+        float: Seconds left (0 if already past), or None if there is no deadline.
+    """
+    deadline = deadline if deadline is not None else _get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def cap_timeout(timeout, deadline=None):
+    """
+    Cap a timeout to the time left before the deadline.
+
+    Args:
+        timeout (float): The timeout that applies without a deadline (None for none).
+        deadline (float, optional): A time.monotonic() value. Defaults to the current context's.
+
+    Returns:
+        float: The smaller of the two, or timeout if there is no deadline.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed.
+    """
+    left = remaining(deadline)
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
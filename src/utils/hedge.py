@@ -0,0 +1,102 @@
+"""
+Hedged requests.
+
+When a request is slower than most of its kind, a second copy is started and
+whichever answers first wins; the other is cancelled. A few slow hosts or
+connections then stop dominating tail latency, for the price of a few percent
+of duplicate requests. Only idempotent operations (GETs) should be hedged.
+"""
+import asyncio
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    Rolling window of latencies, giving the delay after which a request is hedged.
+
+    Args:
+        name (str): Name used when reporting stats.
+        percentile (float): Latency percentile to hedge at (e.g. 95).
+        window (int): Number of recent latencies kept.
+        min_samples (int): Latencies needed before hedging starts.
+        min_delay (float): Lower bound for the hedge delay, in seconds.
+    """
+
+    def __init__(self, name, percentile=95, window=500, min_samples=20, min_delay=0.05):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+    def record(self, seconds):
+        self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """The configured latency percentile, or None while there are too few samples."""
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    async def run(self, attempt, max_delay=None):
+        """
+        Run attempt(), starting a second attempt if the first is slower than the hedge delay.
+
+        Args:
+            attempt: Zero-argument function returning a coroutine for one attempt.
+            max_delay (float, optional): Don't hedge if the hedge delay is longer than this
+                (e.g. the time left before a deadline).
+
+        Returns:
+            The result of the first attempt to succeed. If both fail, the first error is raised.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self._stats["requests"] += 1
+
+        delay = self.hedge_delay()
+        if delay is None or (max_delay is not None and delay >= max_delay):
+            result = await attempt()
+            self.record(loop.time() - start)
+            return result
+
+        first = asyncio.ensure_future(attempt())
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._stats["hedged"] += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._stats["hedge_wins"] += 1
+                        self.record(loop.time() - start)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        """
+        Hedging counters.
+
+        Returns:
+            dict: Requests, hedges started, hedges that won, and the current hedge delay.
+        """
+        stats = dict(self._stats)
+        stats["hedge_delay_seconds"] = self.hedge_delay()
+        stats["samples"] = len(self._latencies)
+        stats["percentile"] = self.percentile
+        return stats
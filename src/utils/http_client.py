@@ -0,0 +1,234 @@
+"""
+Shared, pooled HTTP client used by the powerups that talk to the network.
+
+Creating an httpx.AsyncClient per call pays a new TCP+TLS handshake for every
+request. The pool below keeps one client for the lifetime of the app (or of the
+event loop it was first used on), with HTTP/2, keep-alive and connection caps.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.config import env_int, env_float, env_bool
+
+
+def _http2_available():
+    """HTTP/2 support in httpx needs the optional 'h2' package."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _HostSlots:
+    """A host's concurrency semaphore, how many requests hold or wait for it, and how many hold it."""
+
+    __slots__ = ("semaphore", "users", "in_flight")
+
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+        self.in_flight = 0
+
+
+class HTTPClientPool:
+    """
+    An app-lifetime httpx.AsyncClient with global and per-host connection caps.
+
+    Settings default to the POWERUPS_HTTP_* environment variables:
+        POWERUPS_HTTP_MAX_CONNECTIONS (int): Global cap on open connections.
+        POWERUPS_HTTP_MAX_KEEPALIVE (int): Idle connections kept for reuse.
+        POWERUPS_HTTP_MAX_PER_HOST (int): Concurrent requests allowed per host.
+        POWERUPS_HTTP_KEEPALIVE_EXPIRY (float): Seconds an idle connection is kept.
+        POWERUPS_HTTP2 (bool): Negotiate HTTP/2 when the 'h2' package is installed.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive_connections=None, max_per_host=None,
+                 keepalive_expiry=None, http2=None, timeout=5.0):
+        self.max_connections = max_connections or env_int("POWERUPS_HTTP_MAX_CONNECTIONS", 100)
+        self.max_keepalive_connections = max_keepalive_connections or env_int("POWERUPS_HTTP_MAX_KEEPALIVE", 20)
+        self.max_per_host = max_per_host or env_int("POWERUPS_HTTP_MAX_PER_HOST", 10)
+        self.keepalive_expiry = keepalive_expiry or env_float("POWERUPS_HTTP_KEEPALIVE_EXPIRY", 30.0)
+        if http2 is None:
+            http2 = env_bool("POWERUPS_HTTP2", True)
+        self.http2 = http2 and _http2_available()
+        self.timeout = timeout
+
+        self._client = None
+        self._loop = None
+        # Only hosts with requests in flight or queued; idle hosts are dropped
+        self._host_semaphores = {}
+        self._stats = {
+            "requests": 0,
+            "failed_requests": 0,
+            "connections_opened": 0,
+            "http2_responses": 0,
+            "http1_responses": 0,
+            "clients_created": 0,
+        }
+
+    def _create_client(self):
+        """Create the underlying httpx client bound to the running event loop."""
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        self._stats["clients_created"] += 1
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+    @property
+    def client(self):
+        """
+        The shared httpx.AsyncClient.
+
+        Connections belong to the event loop they were opened on, so if the pool
+        is used from a different loop (e.g. successive asyncio.run calls) a fresh
+        client is created for that loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = self._create_client()
+            self._loop = loop
+            self._host_semaphores = {}
+        return self._client
+
+    async def start(self):
+        """Eagerly create the client on the current loop (called on app startup)."""
+        return self.client
+
+    async def aclose(self):
+        """Close the client and drop every pooled connection."""
+        client, self._client = self._client, None
+        self._loop = None
+        self._host_semaphores = {}
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    @asynccontextmanager
+    async def _host_slot(self, url):
+        """
+        Hold one of the host's slots under the per-host concurrency cap.
+
+        The host's semaphore is dropped once no request holds or waits for it,
+        so the table only grows with the hosts in use, not every host ever seen.
+        """
+        host = urlsplit(str(url)).netloc.lower()
+        slots = self._host_semaphores.get(host)
+        if slots is None:
+            slots = _HostSlots(self.max_per_host)
+            self._host_semaphores[host] = slots
+        slots.users += 1
+        try:
+            async with slots.semaphore:
+                slots.in_flight += 1
+                try:
+                    yield
+                finally:
+                    slots.in_flight -= 1
+        finally:
+            slots.users -= 1
+            if not slots.users and self._host_semaphores.get(host) is slots:
+                del self._host_semaphores[host]
+
+    async def _trace(self, event_name, info):
+        """httpcore trace hook, used to count how many connections were opened."""
+        if event_name == "connection.connect_tcp.complete":
+            self._stats["connections_opened"] += 1
+
+    def _record_response(self, response):
+        if response.http_version == "HTTP/2":
+            self._stats["http2_responses"] += 1
+        else:
+            self._stats["http1_responses"] += 1
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """
+        Stream a request through the shared client, holding a per-host slot
+        until the response is closed.
+
+        Args:
+            method (str): HTTP method.
+            url (str): The URL to request.
+            **kwargs: Passed through to httpx.AsyncClient.stream.
+
+        Yields:
+            httpx.Response: The response, with the body not yet read.
+        """
+        client = self.client
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions.setdefault("trace", self._trace)
+        async with self._host_slot(url):
+            self._stats["requests"] += 1
+            try:
+                async with client.stream(method, str(url), extensions=extensions, **kwargs) as response:
+                    self._record_response(response)
+                    yield response
+            except httpx.HTTPError:
+                self._stats["failed_requests"] += 1
+                raise
+
+    async def request(self, method, url, **kwargs):
+        """Send a request through the shared client and read the full body."""
+        async with self.stream(method, url, **kwargs) as response:
+            await response.aread()
+        return response
+
+    async def get(self, url, **kwargs):
+        """Shortcut for a GET request through the shared client."""
+        return await self.request("GET", url, **kwargs)
+
+    def stats(self):
+        """
+        Connection-reuse statistics for the pool.
+
+        Returns:
+            dict: Request and connection counters plus pool configuration.
+        """
+        stats = dict(self._stats)
+        stats["connections_reused"] = max(stats["requests"] - stats["failed_requests"] - stats["connections_opened"], 0)
+        completed = stats["requests"] - stats["failed_requests"]
+        stats["reuse_ratio"] = round(stats["connections_reused"] / completed, 4) if completed else 0.0
+        stats["hosts_in_flight"] = {
+            host: slots.in_flight for host, slots in self._host_semaphores.items() if slots.in_flight
+        }
+        stats["hosts_tracked"] = len(self._host_semaphores)
+        stats["config"] = {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "max_per_host": self.max_per_host,
+            "keepalive_expiry": self.keepalive_expiry,
+            "http2": self.http2,
+        }
+        return stats
+
+
+_pool = None
+
+
+def get_http_pool():
+    """
+    Get the process-wide HTTP client pool, creating it on first use.
+
+    Returns:
+        HTTPClientPool: The shared pool.
+    """
+    global _pool
+    if _pool is None:
+        _pool = HTTPClientPool()
+    return _pool
+
+
+async def close_http_pool():
+    """Close the process-wide pool, if one was created."""
+    if _pool is not None:
+        await _pool.aclose()
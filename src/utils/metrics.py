@@ -0,0 +1,286 @@
+"""
+Metrics and lightweight tracing.
+
+Spans time an operation (a model round, a tool call, a page fetch, an HTML
+conversion) and record its duration in a latency histogram labelled with the
+kind of span, its name and its outcome. Counters track volumes such as bytes
+downloaded. Everything is kept in process and rendered in the Prometheus text
+format by the /metrics endpoint; spans are also logged at DEBUG with the id of
+the request they belong to.
+"""
+import contextvars
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a fast cache hit to a slow agent round
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace_id = contextvars.ContextVar("powerups_trace_id", default=None)
+
+
+def new_trace():
+    """Start a trace for the current request, returning its id (spans started from here carry it)."""
+    trace_id = uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace():
+    """The id of the current request's trace, or None."""
+    return _trace_id.get()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count, per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        help (str): Description.
+        labelnames (tuple): Label names.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Distribution of observed values (e.g. latencies) in cumulative buckets.
+
+    Args:
+        name (str): Metric name.
+        help (str): Description.
+        labelnames (tuple): Label names.
+        buckets (tuple): Upper bounds of the buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+                      for key, value in self._series.items()}
+        samples = []
+        for key, value in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, value["buckets"]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative))
+            samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", "+Inf")]), value["count"]))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), value["sum"]))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), value["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, plus collectors that turn existing stats() dicts into gauges.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        """Get or create a counter."""
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram."""
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def add_collector(self, prefix, collect):
+        """
+        Export the numeric fields of a stats dict as gauges at every scrape.
+
+        Args:
+            prefix (str): Metric name prefix, e.g. "powerups_search_cache".
+            collect: Zero-argument callable returning the stats dict (or None).
+        """
+        self._collectors.append((prefix, collect))
+
+    def _collected_samples(self):
+        samples = []
+        for prefix, collect in self._collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                logger.warning("Error collecting %s metrics: %s", prefix, e)
+                continue
+            samples.extend(_flatten(prefix, stats))
+        return samples
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        for name, value in self._collected_samples():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix, stats, depth=2):
+    """
+    Numeric leaves of a stats dict as (metric name, value) pairs.
+
+    Only two levels are followed, which leaves out per-host breakdowns and
+    other unbounded sets of keys.
+    """
+    if isinstance(stats, bool):
+        return [(prefix, int(stats))]
+    if isinstance(stats, (int, float)):
+        return [(prefix, stats)]
+    if isinstance(stats, dict) and depth > 0:
+        samples = []
+        for key, value in stats.items():
+            samples.extend(_flatten(f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', str(key))}", value, depth - 1))
+        return samples
+    return []
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "powerups_span_seconds",
+    "Duration of model rounds, tool calls, page fetches and HTML conversions",
+    ("span", "name", "status")
+)
+
+
+def observe_span(kind, name, duration, status="ok"):
+    """
+    Record an operation timed by the caller, for work that isn't one block (e.g.
+    a conversion fed chunk by chunk between network reads).
+
+    Args:
+        kind (str): The kind of operation, as for span.
+        name (str): What was done.
+        duration (float): Seconds spent.
+        status (str): The outcome.
+    """
+    SPAN_SECONDS.observe(duration, span=kind, name=name, status=status)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("span kind=%s name=%s status=%s duration=%.4fs trace=%s",
+                     kind, name, status, duration, current_trace())
+
+
+class span:
+    """
+    Time an operation and record it in powerups_span_seconds.
+
+    The status is "ok", or "error" if the block raises; set span.status to report
+    other outcomes (e.g. a tool returning an {"error": ...} result, or a fetch
+    rejecting its content), which then also stands if the block raises.
+
+    Usage:
+        with span("tool_call", "google_search") as s:
+            result = ...
+            if "error" in result:
+                s.status = "error"
+
+    Args:
+        kind (str): The kind of operation (model_round, tool_call, http_fetch, or the
+            function run by an offloader, e.g. html_to_text, pdf_to_text, build_index).
+        name (str): What was done, e.g. the tool name. Keep this low-cardinality.
+    """
+
+    __slots__ = ("kind", "name", "status", "start", "duration")
+
+    def __init__(self, kind, name=""):
+        self.kind = kind
+        self.name = name
+        self.status = "ok"
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None and self.status == "ok":
+            # Cancelled tasks and closed (abandoned) generators aren't failures of the operation
+            self.status = "cancelled" if exc_type.__name__ in ("CancelledError", "GeneratorExit") else "error"
+        observe_span(self.kind, self.name, self.duration, self.status)
+        return False
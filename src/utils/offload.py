@@ -0,0 +1,159 @@
+"""
+Offloading CPU-bound work (such as HTML conversion) off the event loop.
+
+Pure-Python work like html2text holds the event loop thread for as long as it
+runs, stalling every other request on the worker. CPUOffloader sends large
+inputs to a process pool (or a thread pool as a fallback) and keeps a fast
+inline path for small ones, where the hand-off would cost more than the work.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class CPUOffloader:
+    """
+    Runs a function inline, in a process pool or in a thread pool depending on input size.
+
+    Args:
+        name (str): Name used when reporting stats.
+        executor (str): "process" or "thread". Falls back to "thread" if a process
+            pool cannot be created on this platform.
+        workers (int, optional): Pool size. Defaults to the CPU count.
+        inline_max_size (int): Inputs up to this size run inline on the event loop.
+        offload_max_size (int): Inputs above this size skip the process pool and
+            run in a thread, to avoid pickling very large payloads between processes.
+    """
+
+    def __init__(self, name, executor="process", workers=None, inline_max_size=64 * 1024,
+                 offload_max_size=8 * 1024 * 1024):
+        self.name = name
+        self.executor_kind = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.inline_max_size = inline_max_size
+        self.offload_max_size = offload_max_size
+
+        self._executor = None
+        self._thread_executor = None
+        self._queue_depth = 0
+        self._durations = deque(maxlen=1000)
+        self._stats = {
+            "inline": 0,
+            "process": 0,
+            "thread": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        }
+
+    def _thread_pool(self):
+        if self._thread_executor is None:
+            self._thread_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._thread_executor
+
+    def _pool(self):
+        """The primary executor, created on first use."""
+        if self._executor is None:
+            if self.executor_kind == "process":
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (OSError, NotImplementedError, ImportError) as e:
+                    # e.g. no working semaphores in a restricted sandbox
+                    logger.warning("Process pool unavailable for %s, using threads: %s", self.name, e)
+                    self.executor_kind = "thread"
+            if self._executor is None:
+                self._executor = self._thread_pool()
+        return self._executor
+
+    def _record(self, mode, elapsed):
+        self._stats[mode] += 1
+        self._stats["total_seconds"] += elapsed
+        self._stats["max_seconds"] = max(self._stats["max_seconds"], elapsed)
+        self._durations.append(elapsed)
+
+    async def run(self, func, *args, size=0, inline=True):
+        """
+        Run func(*args), off the event loop if the input is large enough.
+
+        The call is recorded as a span named after the function, with the mode
+        (inline, process or thread) as the span's name.
+
+        Args:
+            func: A picklable (module-level) function.
+            *args: Its arguments.
+            size (int): Size of the input, used to pick inline vs. offloaded execution.
+            inline (bool): Whether small inputs may run inline. Pass False for work
+                whose cost doesn't follow its input size (e.g. parsing a PDF).
+
+        Returns:
+            The function's result.
+        """
+        start = time.perf_counter()
+        kind = getattr(func, "__name__", self.name)
+        if inline and size <= self.inline_max_size:
+            try:
+                with span(kind, "inline"):
+                    result = func(*args)
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            self._record("inline", time.perf_counter() - start)
+            return result
+
+        if size > self.offload_max_size:
+            mode, executor = "thread", self._thread_pool()
+        else:
+            executor = self._pool()
+            mode = self.executor_kind
+
+        self._queue_depth += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue_depth)
+        try:
+            loop = asyncio.get_running_loop()
+            with span(kind, mode):
+                result = await loop.run_in_executor(executor, functools.partial(func, *args))
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._queue_depth -= 1
+        self._record(mode, time.perf_counter() - start)
+        return result
+
+    def shutdown(self):
+        """Shut the pools down (called on app shutdown)."""
+        for executor in (self._executor, self._thread_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._executor = None
+        self._thread_executor = None
+
+    def stats(self):
+        """
+        Conversion duration and queue depth figures, for sizing the pool.
+
+        Returns:
+            dict: Call counts per mode, queue depth, duration percentiles and configuration.
+        """
+        stats = dict(self._stats)
+        stats["queue_depth"] = self._queue_depth
+        durations = sorted(self._durations)
+        if durations:
+            stats["p50_seconds"] = durations[len(durations) // 2]
+            stats["p95_seconds"] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        stats["config"] = {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "inline_max_size": self.inline_max_size,
+            "offload_max_size": self.offload_max_size,
+        }
+        return stats
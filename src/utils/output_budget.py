@@ -0,0 +1,161 @@
+"""
+Token budgets for tool outputs sent back to the model.
+
+Model latency and cost grow with the size of function_call_output items, so
+each tool output can be trimmed to a token budget before it is sent. Tokens
+are counted with tiktoken when it is installed, and estimated at about four
+characters per token otherwise. Only bounded prefixes are ever tokenized, since
+this runs on the event loop and outputs can be megabytes long.
+"""
+import json
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Characters per token assumed when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+# Longest text tokenized whole; longer ones are extrapolated from a prefix this long
+EXACT_COUNT_MAX_CHARS = 65536
+
+# A token is rarely longer than this many characters, so text past max_tokens times it can't fit a budget
+MAX_CHARS_PER_TOKEN = 8
+
+# Marker appended to trimmed strings
+TRUNCATION_MARKER = "…"
+
+_encodings = {}
+
+
+def _encoding(name):
+    """The tiktoken encoding, or None if tiktoken (or its data files) are unavailable."""
+    if tiktoken is None:
+        return None
+    if name not in _encodings:
+        try:
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            # e.g. the encoding files can't be downloaded
+            logger.warning("Error loading tiktoken encoding, estimating tokens instead: %s", e)
+            _encodings[name] = None
+    return _encodings[name]
+
+
+def count_tokens(text, encoding="o200k_base"):
+    """
+    Count the tokens in a string.
+
+    Args:
+        text (str): The text.
+        encoding (str): The tiktoken encoding to use (o200k_base is GPT-4o's).
+
+    Returns:
+        int: The token count: exact with tiktoken up to EXACT_COUNT_MAX_CHARS (extrapolated
+        from that prefix beyond it), and estimated without tiktoken.
+    """
+    enc = _encoding(encoding)
+    if enc is not None:
+        if len(text) <= EXACT_COUNT_MAX_CHARS:
+            return len(enc.encode(text, disallowed_special=()))
+        prefix_tokens = len(enc.encode(text[:EXACT_COUNT_MAX_CHARS], disallowed_special=()))
+        return prefix_tokens * len(text) // EXACT_COUNT_MAX_CHARS
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def serialize_output(result):
+    """Serialize a tool result the way it is sent to the model."""
+    return result if isinstance(result, str) else json.dumps(result)
+
+
+def _cap_strings(value, max_chars):
+    """Copy of a JSON-like value with every string longer than max_chars cut down."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + TRUNCATION_MARKER
+    if isinstance(value, list):
+        return [_cap_strings(item, max_chars) for item in value]
+    if isinstance(value, dict):
+        return {key: _cap_strings(item, max_chars) for key, item in value.items()}
+    return value
+
+
+def _longest_string(value):
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list):
+        return max((_longest_string(item) for item in value), default=0)
+    if isinstance(value, dict):
+        return max((_longest_string(item) for item in value.values()), default=0)
+    return 0
+
+
+def fit_to_budget(result, max_tokens, encoding="o200k_base"):
+    """
+    Serialize a tool result, trimming it to fit a token budget.
+
+    Structured results stay valid JSON: the longest strings are shortened first
+    (to a common length, found by bisection), and trailing list items are only
+    dropped if that is not enough.
+
+    Args:
+        result: The tool result (a string or a JSON-serializable value).
+        max_tokens (int): The budget. None or 0 means no budget.
+        encoding (str): The tiktoken encoding used to count tokens.
+
+    Returns:
+        tuple: (output string, {"tokens": tokens sent, "truncated": bool})
+    """
+    output = serialize_output(result)
+    tokens = count_tokens(output, encoding)
+    if not max_tokens or tokens <= max_tokens:
+        return output, {"tokens": tokens, "truncated": False}
+
+    # Nothing past this many characters can fit, so longer text is never tokenized
+    max_chars = max_tokens * MAX_CHARS_PER_TOKEN
+    if isinstance(result, str):
+        # Cut proportionally, then tighten until it fits
+        head = result[:max_chars]
+        head_tokens = count_tokens(head, encoding)
+        if len(head) == len(result) and head_tokens <= max_tokens:
+            # Only the extrapolated count was over
+            return result, {"tokens": head_tokens, "truncated": False}
+        keep = len(head) if head_tokens <= max_tokens else len(head) * max_tokens // head_tokens
+        while keep > 0:
+            output = result[:keep] + TRUNCATION_MARKER
+            tokens = count_tokens(output, encoding)
+            if tokens <= max_tokens:
+                break
+            keep = keep * max_tokens // (tokens + 1)
+        return output, {"tokens": tokens, "truncated": True}
+
+    # Largest per-string length that fits
+    low, high = 0, min(_longest_string(result), max_chars)
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = serialize_output(_cap_strings(result, middle))
+        candidate_tokens = count_tokens(candidate, encoding)
+        if candidate_tokens <= max_tokens:
+            best, tokens = candidate, candidate_tokens
+            low = middle + 1
+        else:
+            high = middle - 1
+    if best is not None:
+        return best, {"tokens": tokens, "truncated": True}
+
+    # Too many items even with short strings: drop items from the end
+    if isinstance(result, list):
+        items = _cap_strings(result, 200)
+        while items:
+            items = items[:-1]
+            output = serialize_output(items)
+            tokens = count_tokens(output, encoding)
+            if tokens <= max_tokens:
+                return output, {"tokens": tokens, "truncated": True}
+
+    # Last resort: cut the serialized text
+    return fit_to_budget(output, max_tokens, encoding)
@@ -0,0 +1,152 @@
+"""
+Passage retrieval over page text.
+
+Long pages are split into passages of a few hundred characters and indexed
+with BM25, so a tool can return only the passages that match a question
+instead of the first N characters of the page (which are often navigation).
+"""
+import math
+import re
+from collections import Counter
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_HEADING = re.compile(r"^#{1,6}\s")
+
+# Very common English words that carry no signal for matching
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when where "
+    "which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text, without stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def split_passages(text, target_chars=800, max_chars=1600):
+    """
+    Split converted page text into passages.
+
+    Paragraphs (separated by blank lines) are merged up to target_chars, and
+    paragraphs longer than max_chars are cut at line or word boundaries. Each
+    passage is prefixed with the markdown heading it falls under, so it still
+    makes sense on its own.
+
+    Args:
+        text (str): The page text (html2text output).
+        target_chars (int): Size passages are merged up to.
+        max_chars (int): Size above which a paragraph is split.
+
+    Returns:
+        list: The passages, in document order.
+    """
+    passages = []
+    heading = None
+    current = []
+    current_size = 0
+
+    def flush():
+        nonlocal current, current_size
+        if current:
+            body = "\n\n".join(current)
+            if heading and not body.startswith(heading):
+                body = heading + "\n\n" + body
+            passages.append(body)
+        current = []
+        current_size = 0
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _HEADING.match(paragraph):
+            # A new section starts a new passage
+            flush()
+            heading = paragraph.splitlines()[0]
+        pieces = [paragraph]
+        if len(paragraph) > max_chars:
+            pieces = _split_long(paragraph, max_chars)
+        for piece in pieces:
+            if current_size and current_size + len(piece) > target_chars:
+                flush()
+            current.append(piece)
+            current_size += len(piece)
+    flush()
+    return passages
+
+
+def _split_long(paragraph, max_chars):
+    """Cut a long paragraph into pieces of at most max_chars, at line or word boundaries."""
+    pieces = []
+    while len(paragraph) > max_chars:
+        cut = paragraph.rfind("\n", 0, max_chars)
+        if cut < max_chars // 2:
+            cut = paragraph.rfind(" ", 0, max_chars)
+        if cut < max_chars // 2:
+            cut = max_chars
+        pieces.append(paragraph[:cut].strip())
+        paragraph = paragraph[cut:].strip()
+    if paragraph:
+        pieces.append(paragraph)
+    return pieces
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over a list of passages.
+
+    Args:
+        passages (list): The passages to index.
+        k1 (float): Term frequency saturation.
+        b (float): Length normalization.
+    """
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self._term_counts = [Counter(tokenize(passage)) for passage in passages]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter()
+        for counts in self._term_counts:
+            document_frequency.update(counts.keys())
+        total = len(passages)
+        self._idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def search(self, query, top_k=5):
+        """
+        Find the passages that best match a query.
+
+        Args:
+            query (str): The question or keywords.
+            top_k (int): Number of passages to return.
+
+        Returns:
+            list: (passage index, score) pairs, best first. Passages with no
+            matching term are left out.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        if not terms or not self.passages:
+            return []
+        scores = []
+        for index, counts in enumerate(self._term_counts):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / (self._average_length or 1))
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((index, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[0:top_k]
+
+
+def build_index(text):
+    """Split a page's text into passages and index them (a module-level function, so it can run in a process pool)."""
+    return BM25Index(split_passages(text))
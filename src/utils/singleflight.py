@@ -0,0 +1,146 @@
+"""
+Coalescing of identical concurrent calls ("single flight").
+
+When many requests ask for the same thing at once (the same trending URL, the
+same search), only the first call runs; the others wait for it and share its
+result or exception. Once the call finishes it is forgotten, so later calls run
+again (or hit a cache).
+
+The shared call runs in a clean context rather than the first caller's, so it
+doesn't see that caller's per-request state. Context variables every caller may
+safely share can be carried over with share_context_var(). Its deadline is the
+latest of its callers' (none if one of them has none), moved later as callers
+join, and each caller stops waiting when its own deadline passes.
+"""
+import asyncio
+import contextvars
+
+from utils.deadline import DeadlineExceeded, SharedDeadline, current_deadline, remaining, set_shared_deadline
+
+
+class _Call:
+    """An in-flight call, its deadline and the number of callers waiting on it."""
+
+    __slots__ = ("task", "loop", "deadline", "waiters")
+
+    def __init__(self, task, loop, deadline):
+        self.task = task
+        self.loop = loop
+        self.deadline = deadline
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing its outcome with concurrent callers.
+
+    A caller that is cancelled (e.g. by a tool timeout) stops waiting without
+    affecting the others. The underlying call is cancelled only when every
+    caller has gone.
+
+    Args:
+        name (str): Name used when reporting stats.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0, "cancelled": 0}
+        self._coalesced_by_group = {}
+        self._shared_vars = []
+
+    def share_context_var(self, var):
+        """
+        Carry a context variable from the first caller into shared calls.
+
+        Only for values that are safe for every coalesced caller to use (e.g. a
+        store of prefetched pages, which other requests may also read from).
+
+        Args:
+            var (contextvars.ContextVar): The variable.
+        """
+        if var not in self._shared_vars:
+            self._shared_vars.append(var)
+
+    def _context(self, deadline):
+        """A clean context holding only the shared variables of the current one, and `deadline`."""
+        context = contextvars.Context()
+        for var in self._shared_vars:
+            value = var.get(None)
+            if value is not None:
+                context.run(var.set, value)
+        context.run(set_shared_deadline, deadline)
+        return context
+
+    async def do(self, key, func, group=None):
+        """
+        Run func() unless a call with the same key is already in flight, and return its result.
+
+        Args:
+            key: Hashable key identifying identical calls.
+            func: Zero-argument function returning the coroutine to run.
+            group (str, optional): Label for the coalesced counter (e.g. the tool name).
+
+        Returns:
+            The call's result. Its exception is raised to every caller if it failed.
+
+        Raises:
+            DeadlineExceeded: If this caller's deadline passes before the call finishes.
+        """
+        loop = asyncio.get_running_loop()
+        self._stats["calls"] += 1
+
+        call = self._calls.get(key)
+        if call is None or call.loop is not loop:
+            # The task copies the context it is created in: a clean one, not the caller's
+            deadline = SharedDeadline(current_deadline())
+            call = _Call(self._context(deadline).run(asyncio.ensure_future, func()), loop, deadline)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._forget(key, call))
+            self._stats["executed"] += 1
+        else:
+            # The call may now run for as long as its most patient caller waits
+            call.deadline.extend(current_deadline())
+            self._stats["coalesced"] += 1
+            if group is not None:
+                self._coalesced_by_group[group] = self._coalesced_by_group.get(group, 0) + 1
+
+        call.waiters += 1
+        try:
+            # Shielded, so one caller's cancellation (or deadline) doesn't cancel the shared call
+            left = remaining()
+            if left is None:
+                return await asyncio.shield(call.task)
+            try:
+                return await asyncio.wait_for(asyncio.shield(call.task), left)
+            except asyncio.TimeoutError:
+                if call.task.done():
+                    # The call itself timed out
+                    raise
+                raise DeadlineExceeded("Request deadline exceeded") from None
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting any more
+                call.task.cancel()
+                self._stats["cancelled"] += 1
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception as retrieved even if every caller had gone
+            call.task.exception()
+
+    def stats(self):
+        """
+        Coalescing counters.
+
+        Returns:
+            dict: Calls made, calls actually executed, calls coalesced (total and per
+            group), calls cancelled after their callers left, and calls in flight.
+        """
+        stats = dict(self._stats)
+        stats["coalesced_by_group"] = dict(self._coalesced_by_group)
+        stats["in_flight"] = len(self._calls)
+        return stats
@@ -1,78 +1,536 @@
 """
 Decorator for marking and configuring functions as tools for OpenAI's function calling.
+
+Every decorated function is also added to a registry keyed by tool name, so the
+app can look tools up, reuse their precomputed definitions and dispatch model
+tool calls to them without a hand-written if/elif chain.
+
+Tools can also be declared in a manifest (tool name -> module) instead of being
+imported up front. Their module, and with it their dependencies, is then only
+imported the first time the tool is looked up.
 """
+import asyncio
+import functools
+import importlib
+import inspect
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import typing
+
+from utils.cache import TTLCache, cached
+from utils.config import env_int
+from utils.metrics import span
+from utils.output_budget import count_tokens, fit_to_budget, serialize_output
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Tool name -> RegisteredTool, filled in by @tool at import time
+TOOL_REGISTRY = {}
+
+# Tool name -> module defining it, for tools imported on first use (see register_tool_modules)
+TOOL_MANIFEST = {}
+
+# Module -> seconds its import took, for tool modules loaded from the manifest
+TOOL_IMPORT_SECONDS = {}
+
+_load_lock = threading.Lock()
+
+# Identical tool calls in flight at the same time share one execution
+TOOL_CALL_COALESCING = SingleFlight(name="tool_calls")
 
-def tool(name=None, description=None):
+# Default token budget for a tool output sent to the model (0 for none, the default: tools
+# like get_website_url_content already return as much as the model asked for)
+TOOL_OUTPUT_MAX_TOKENS = env_int("POWERUPS_TOOL_OUTPUT_MAX_TOKENS", 0)
+
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+}
+
+def _json_type(annotation):
+    """Map a type hint to a JSON schema type, unwrapping Optional[...] and generics."""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _json_type(args[0]) if len(args) == 1 else None
+    return _JSON_TYPES.get(origin or annotation)
+
+def _docstring_arg_descriptions(doc):
+    """Read 'name (type): description' / 'name: description' lines from an Args: section."""
+    descriptions = {}
+    in_args = False
+    for line in (doc or "").splitlines():
+        stripped = line.strip()
+        if stripped.lower() in ("args:", "arguments:", "parameters:"):
+            in_args = True
+            continue
+        if in_args:
+            if stripped.endswith(":") and " " not in stripped:
+                # Next section (Returns:, Raises:, ...)
+                break
+            match = re.match(r"^(\w+)\s*(?:\([^)]*\))?\s*:\s*(.+)$", stripped)
+            if match:
+                descriptions[match.group(1)] = match.group(2)
+    return descriptions
+
+def schema_from_type_hints(func, exclude=()):
+    """
+    Generate a JSON schema for a function's arguments from its type hints and docstring.
+
+    Args:
+        func: The function to describe.
+        exclude: Parameter names to leave out of the schema (e.g. credentials).
+
+    Returns:
+        dict: A JSON schema object describing the parameters.
+    """
+    signature = inspect.signature(func)
+    try:
+        hints = typing.get_type_hints(func)
+    except Exception:
+        hints = {}
+    descriptions = _docstring_arg_descriptions(func.__doc__)
+
+    properties = {}
+    required = []
+    for param in signature.parameters.values():
+        if param.name in exclude or param.name.startswith("_"):
+            continue
+        if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        prop = {}
+        json_type = _json_type(hints.get(param.name, param.annotation))
+        if json_type:
+            prop["type"] = json_type
+        if param.name in descriptions:
+            prop["description"] = descriptions[param.name]
+        if param.default is param.empty:
+            required.append(param.name)
+        else:
+            prop["default"] = param.default
+        properties[param.name] = prop
+
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": required,
+        "additionalProperties": False
+    }
+
+def _format_output(result, project=None, max_tokens=None):
+    """Project, serialize and trim a tool result, measuring it before and after."""
+    raw = serialize_output(result)
+    if project is not None and not (isinstance(result, dict) and "error" in result):
+        result = project(result)
+    if max_tokens is None:
+        max_tokens = TOOL_OUTPUT_MAX_TOKENS
+    output, budget = fit_to_budget(result, max_tokens)
+    return output, {
+        "tokens_before": count_tokens(raw) if output != raw else budget["tokens"],
+        "tokens_after": budget["tokens"],
+        "chars_before": len(raw),
+        "chars_after": len(output),
+        "truncated": budget["truncated"]
+    }
+
+class RegisteredTool:
+    """
+    A registry entry for a tool: its function, an optional async implementation,
+    and its definition, computed once and then reused for every request.
+    """
+
+    def __init__(self, func, exclude=(), coalesce=True, project=None, max_output_tokens=None, on_result=None):
+        self.func = func
+        self.name = func._tool_name
+        self.description = func._tool_description
+        self.exclude = exclude
+        self.coalesce = coalesce
+        self.project = project
+        self.on_result = on_result
+        self.max_output_tokens = max_output_tokens
+        self.async_func = None
+        self._definition = None
+        self._definition_json = None
+        self._accepted = None
+
+    @property
+    def parameters(self):
+        """The argument schema: the tool's _tool_params, as built by @tool or assigned after it."""
+        return self.func._tool_params
+
+    @property
+    def definition(self):
+        """The Responses API tool definition (built once, then shared)."""
+        if self._definition is None:
+            self._definition = {
+                "type": "function",
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters
+            }
+        return self._definition
+
+    @property
+    def definition_json(self):
+        """The tool definition, pre-serialized as JSON."""
+        if self._definition_json is None:
+            self._definition_json = json.dumps(self.definition)
+        return self._definition_json
+
+    def _accepted_arguments(self):
+        """Argument names the model may pass: the properties of the schema."""
+        if self._accepted is None:
+            self._accepted = frozenset(self.parameters.get("properties", {}))
+        return self._accepted
+
+    @property
+    def is_async(self):
+        """Whether the tool function itself is a coroutine function."""
+        return asyncio.iscoroutinefunction(self.func)
+
+    def _kwargs(self, arguments):
+        """Parse model-provided arguments, dropping any outside the tool's schema."""
+        if isinstance(arguments, str):
+            arguments = json.loads(arguments) if arguments else {}
+        accepted = self._accepted_arguments()
+        return {key: value for key, value in arguments.items() if key in accepted}
+
+    def coalescing_key(self, kwargs):
+        """Key matching identical calls: the tool name and its arguments as canonical JSON."""
+        return (self.name, json.dumps(kwargs, sort_keys=True, default=str))
+
+    async def call(self, arguments):
+        """
+        Call the tool with model-provided arguments.
+
+        Arguments outside the tool's schema are dropped. Identical calls already in
+        flight are joined instead of run again (before any result cache is consulted).
+        The async implementation is awaited when there is one; sync tools run in the
+        default executor so they never block the event loop. Every call is timed in
+        a tool_call span. The on_result hook runs in the caller's context, so it
+        sees the caller's request even when the execution was shared.
+
+        Args:
+            arguments (dict | str): The arguments, as a dict or a JSON string.
+
+        Returns:
+            The tool's result.
+        """
+        with span("tool_call", self.name) as tool_span:
+            kwargs = self._kwargs(arguments)
+            if self.coalesce:
+                result = await TOOL_CALL_COALESCING.do(
+                    self.coalescing_key(kwargs),
+                    lambda: self._run(kwargs),
+                    group=self.name
+                )
+            else:
+                result = await self._run(kwargs)
+            if isinstance(result, dict) and "error" in result:
+                tool_span.status = "error"
+            elif self.on_result is not None:
+                try:
+                    self.on_result(result)
+                except Exception as e:
+                    logger.warning("Error in on_result hook of %s: %s", self.name, e)
+            return result
+
+    async def _run(self, kwargs):
+        func = self.async_func or self.func
+        if asyncio.iscoroutinefunction(func):
+            return await func(**kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, **kwargs))
+
+    def format_output(self, result, max_tokens=None):
+        """
+        Prepare a tool result for the model: project it to the fields the model needs,
+        serialize it and trim it to the token budget.
+
+        Args:
+            result: The tool's result.
+            max_tokens (int, optional): Token budget. Defaults to the tool's
+                max_output_tokens, then POWERUPS_TOOL_OUTPUT_MAX_TOKENS.
+
+        Returns:
+            tuple: (output string, {"tokens_before", "tokens_after", "chars_before",
+            "chars_after", "truncated"})
+        """
+        if max_tokens is None:
+            max_tokens = self.max_output_tokens
+        return _format_output(result, project=self.project, max_tokens=max_tokens)
+
+    def call_sync(self, arguments):
+        """
+        Call a sync tool directly with model-provided arguments, without an event loop.
+
+        Args:
+            arguments (dict | str): The arguments, as a dict or a JSON string.
+
+        Returns:
+            The tool's result.
+        """
+        if self.is_async:
+            raise TypeError(f"Tool {self.name} is async and must be awaited")
+        return self.func(**self._kwargs(arguments))
+
+def tool(name=None, description=None, cache=None, cache_key=None, cache_negative=None, parameters=None, exclude=(),
+         coalesce=True, project=None, max_output_tokens=None, on_result=None):
     """
     Decorator to mark a function as an OpenAI tool and add metadata.
-    
+
     Args:
         name (str, optional): Custom name for the tool. Defaults to the function name.
-        description (str, optional): Description of what the tool does. 
+        description (str, optional): Description of what the tool does.
                                      Defaults to the function docstring.
-    
+        cache (bool | dict | TTLCache, optional): Cache the tool's results in memory.
+                                     True uses a default TTLCache, a dict is passed as
+                                     TTLCache keyword arguments.
+        cache_key (callable, optional): Builds the cache key from the tool's arguments.
+                                     Defaults to all arguments, serialized as JSON.
+        cache_negative (callable, optional): Called with an {"error": ...} result; return
+                                     True to cache it for the cache's negative_ttl.
+        parameters (dict, optional): JSON schema of the arguments. If neither this nor a
+                                     later `_tool_params` assignment is given, the schema
+                                     is generated from the type hints and docstring.
+        exclude (tuple, optional): Parameters left out of a generated schema.
+        coalesce (bool, optional): Let concurrent calls with identical arguments share
+                                     one execution. Disable for tools with side effects.
+        project (callable, optional): Maps a (non-error) result to the part the model
+                                     needs before it is sent back, e.g. dropping metadata.
+        max_output_tokens (int, optional): Token budget for the output sent to the model.
+                                     Defaults to POWERUPS_TOOL_OUTPUT_MAX_TOKENS.
+        on_result (callable, optional): Called with each (non-error) result of a dispatched
+                                     call, e.g. to start work the next call will need.
+
     Returns:
         callable: The decorated function with added tool metadata
     """
     def decorator(func):
+        # Put a result cache in front of the function if requested
+        if cache is not None and cache is not False:
+            if isinstance(cache, TTLCache):
+                result_cache = cache
+            elif isinstance(cache, dict):
+                result_cache = TTLCache(**cache)
+            else:
+                result_cache = TTLCache()
+            func = cached(result_cache, key=cache_key, is_negative=cache_negative)(func)
+
         # Mark this function as a tool
         func._is_tool = True
-        
+
         # Set tool name (use function name if not specified)
         func._tool_name = name or func.__name__
-        
+
         # Set tool description (use docstring if not specified)
         func._tool_description = description or func.__doc__
-        
+
+        # Build the argument schema now, when the tool's module is imported, instead of
+        # on the first request; a later `_tool_params` assignment replaces it
+        if parameters is not None:
+            func._tool_params = parameters
+        else:
+            func._tool_params = schema_from_type_hints(func, exclude=exclude)
+
         # Function to convert the tool to the OpenAI format
         def to_openai_tool():
             """Convert this function to the OpenAI tool format."""
-            if not hasattr(func, '_tool_params'):
-                raise AttributeError(f"Tool function {func.__name__} is missing '_tool_params' attribute")
-                
             return {
                 "type": "function",
                 "function": {
                     "name": func._tool_name,
                     "description": func._tool_description,
-                    "parameters": func._tool_params
+                    "parameters": TOOL_REGISTRY[func._tool_name].parameters
                 }
             }
-        
+
         # Attach the conversion method to the function
         func.to_openai_tool = to_openai_tool
-        
+
+        # Register the tool by name
+        TOOL_REGISTRY[func._tool_name] = RegisteredTool(
+            func, exclude=exclude, coalesce=coalesce, project=project, max_output_tokens=max_output_tokens,
+            on_result=on_result
+        )
+
         return func
     return decorator
 
+def async_implementation(tool_func):
+    """
+    Decorator registering an async implementation of a sync tool.
+
+    The sync function stays the public entry point (and keeps its definition),
+    while dispatched tool calls await the async implementation instead.
+
+    Args:
+        tool_func: A function decorated with @tool
+
+    Returns:
+        callable: Decorator for the async function
+    """
+    def decorator(func):
+        TOOL_REGISTRY[tool_func._tool_name].async_func = func
+        tool_func._async_impl = func
+        return func
+    return decorator
+
+def register_tool_modules(manifest):
+    """
+    Declare which module defines each tool, so tools are imported on first use.
+
+    Args:
+        manifest (dict): Tool name -> module name, e.g. {"google_search": "internet.search.tools"}.
+    """
+    TOOL_MANIFEST.update(manifest)
+
+def tool_names():
+    """Names of every known tool: those in the manifest, then any other registered ones."""
+    return list(dict.fromkeys([*TOOL_MANIFEST, *TOOL_REGISTRY]))
+
+def load_tool(name):
+    """
+    Look up a tool by name, importing its module from the manifest if it is not registered yet.
+
+    Args:
+        name (str): The tool name.
+
+    Returns:
+        RegisteredTool: The registry entry, or None for an unknown tool.
+
+    Raises:
+        ImportError: If the tool's module (or one of its dependencies) can't be imported.
+    """
+    registered = TOOL_REGISTRY.get(name)
+    if registered is not None or name not in TOOL_MANIFEST:
+        return registered
+    module = TOOL_MANIFEST[name]
+    with _load_lock:
+        if module not in sys.modules:
+            start = time.perf_counter()
+            importlib.import_module(module)
+            TOOL_IMPORT_SECONDS[module] = round(time.perf_counter() - start, 4)
+            logger.info("Loaded tool module %s in %.3fs", module, TOOL_IMPORT_SECONDS[module])
+    registered = TOOL_REGISTRY.get(name)
+    if registered is None:
+        raise ImportError(f"Module {module} does not define tool {name}")
+    return registered
+
+def tool_loading_stats():
+    """
+    Lazy tool loading: tools known and registered, and the import time of each tool module loaded on first use.
+
+    Returns:
+        dict: {"known", "loaded", "import_seconds": {module: seconds}}
+    """
+    return {
+        "known": len(tool_names()),
+        "loaded": len(TOOL_REGISTRY),
+        "import_seconds": dict(TOOL_IMPORT_SECONDS)
+    }
+
+def get_tool(name):
+    """
+    Look up a tool by name, importing it from the manifest if needed.
+
+    Args:
+        name (str): The tool name.
+
+    Returns:
+        RegisteredTool: The registry entry.
+
+    Raises:
+        KeyError: If no tool with that name is registered or declared.
+    """
+    registered = load_tool(name)
+    if registered is None:
+        raise KeyError(name)
+    return registered
+
+def get_tool_definitions(names):
+    """
+    Get the precomputed definitions for a list of tool names.
+
+    Args:
+        names (list): Tool names.
+
+    Returns:
+        list: Tool definitions, in the same order.
+
+    Raises:
+        KeyError: If a name is not registered or declared.
+    """
+    return [get_tool(name).definition for name in names]
+
+async def dispatch_tool_call(name, arguments):
+    """
+    Execute a tool call by name.
+
+    Args:
+        name (str): The tool name requested by the model.
+        arguments (dict | str): The arguments, as a dict or a JSON string.
+
+    Returns:
+        The tool's result, or an {"error": ...} dict for an unknown tool (or one that can't be loaded).
+    """
+    try:
+        registered = load_tool(name)
+    except ImportError as e:
+        return {"error": f"Tool {name} is unavailable: {e}"}
+    if registered is None:
+        return {"error": f"Unknown tool: {name}"}
+    return await registered.call(arguments)
+
+def format_tool_output(name, result):
+    """
+    Prepare a tool result for the model (see RegisteredTool.format_output).
+
+    Args:
+        name (str): The tool name.
+        result: The tool's result.
+
+    Returns:
+        tuple: (output string, size info dict)
+    """
+    registered = TOOL_REGISTRY.get(name)
+    if registered is None:
+        return _format_output(result)
+    return registered.format_output(result)
+
 def get_tool_definition(func):
     """
     Helper function to get the OpenAI tool definition from a decorated function.
-    
+
     Args:
         func: A function decorated with @tool
-        
+
     Returns:
         dict: The OpenAI tool definition
     """
     if not hasattr(func, '_is_tool') or not func._is_tool:
         raise ValueError(f"Function {func.__name__} is not marked as a tool")
-    
-    return {
-        "type": "function",
-		"name": func._tool_name,
-		"description": func._tool_description,
-		"parameters": func._tool_params
-    }
+
+    return TOOL_REGISTRY[func._tool_name].definition
 
 def create_tools_list(funcs):
     """
     Convert a list of tool functions to OpenAI tools format.
-    
+
     Args:
         funcs: List of functions decorated with @tool
-        
+
     Returns:
         list: List of OpenAI tool definitions
     """
-    return [get_tool_definition(func) for func in funcs]
\ No newline at end of file
+    return [get_tool_definition(func) for func in funcs]
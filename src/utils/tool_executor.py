@@ -0,0 +1,72 @@
+"""
+Concurrent execution of the tool calls requested in a single model turn.
+"""
+import asyncio
+
+from utils.config import env_int, env_float
+from utils.deadline import DeadlineExceeded, cap_timeout, remaining
+
+
+async def _run_one(index, tool_call, execute, semaphore, timeout, on_start, on_finish):
+    """
+    Run a single tool call under the shared semaphore.
+
+    Failures and timeouts are turned into {"error": ...} results so that one bad
+    tool call never cancels its siblings. The timeout is capped to the time left
+    before the request deadline, if there is one.
+    """
+    async with semaphore:
+        if on_start is not None:
+            on_start(index, tool_call)
+        try:
+            call_timeout = cap_timeout(timeout or None)
+            if call_timeout:
+                result = await asyncio.wait_for(execute(tool_call), call_timeout)
+            else:
+                result = await execute(tool_call)
+        except DeadlineExceeded:
+            result = {"error": f"Tool {tool_call.name} was not run: the request deadline was exceeded"}
+        except asyncio.TimeoutError:
+            if remaining() == 0:
+                result = {"error": f"Tool {tool_call.name} was cancelled at the request deadline"}
+            else:
+                result = {"error": f"Tool {tool_call.name} timed out after {timeout} seconds"}
+        except Exception as e:
+            result = {"error": f"Tool {tool_call.name} failed: {str(e)}"}
+        if on_finish is not None:
+            on_finish(index, tool_call, result)
+        return result
+
+
+async def execute_tool_calls(tool_calls, execute, max_concurrency=None, timeout=None,
+                             on_start=None, on_finish=None):
+    """
+    Execute the tool calls of one model turn concurrently.
+
+    Args:
+        tool_calls: The function_call items from the model response.
+        execute: Async callable taking a tool call and returning its result.
+        max_concurrency (int, optional): Maximum tool calls in flight at once.
+            Defaults to POWERUPS_TOOL_CONCURRENCY (8).
+        timeout (float, optional): Per-call timeout in seconds.
+            Defaults to POWERUPS_TOOL_TIMEOUT (30). Use 0 to disable. Either way
+            calls stop at the request deadline (see utils.deadline).
+        on_start (callable, optional): Called as on_start(index, tool_call) when a
+            call starts running.
+        on_finish (callable, optional): Called as on_finish(index, tool_call, result)
+            as soon as a call completes, in completion order.
+
+    Returns:
+        list: One result per tool call, in the same order as tool_calls.
+    """
+    if max_concurrency is None:
+        max_concurrency = env_int("POWERUPS_TOOL_CONCURRENCY", 8)
+    if timeout is None:
+        timeout = env_float("POWERUPS_TOOL_TIMEOUT", 30.0)
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    # gather keeps the results in the order of the tool calls
+    return await asyncio.gather(*(
+        _run_one(index, tool_call, execute, semaphore, timeout, on_start, on_finish)
+        for index, tool_call in enumerate(tool_calls)
+    ))
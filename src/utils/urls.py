@@ -0,0 +1,65 @@
+"""
+URL helpers shared by the powerups that follow or merge links.
+"""
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url, base=None):
+    """
+    Normalize a URL so that equivalent spellings compare equal.
+
+    Relative URLs are resolved against base. The scheme and host are lower-cased,
+    default ports, fragments and tracking parameters are dropped, the remaining
+    query parameters are sorted and an empty path becomes "/".
+
+    Args:
+        url (str): The URL (or href) to normalize.
+        base (str, optional): URL to resolve relative links against.
+
+    Returns:
+        str: The canonical URL, or None if it is not an http(s) URL.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if port and port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(_TRACKING_PARAMS)
+    ]
+    query.sort()
+
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def url_host(url):
+    """
+    The lower-cased host (with non-default port) of a URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The host, or "" if the URL has none.
+    """
+    return urlsplit(url).netloc.lower()
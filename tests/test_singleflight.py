@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.deadline import DeadlineExceeded, current_deadline, deadline_scope, expires_at
+from utils.singleflight import SingleFlight
+
+
+class SingleFlightDeadlineTest(unittest.TestCase):
+
+    def test_shared_call_is_not_bound_by_first_callers_deadline(self):
+        flight = SingleFlight(name="test")
+        seen = []
+
+        async def work():
+            await asyncio.sleep(0.2)
+            # B has no deadline, so neither has the shared call once B joined
+            seen.append(current_deadline())
+            return "page"
+
+        async def caller(deadline):
+            with deadline_scope(deadline):
+                return await flight.do("key", work)
+
+        async def main():
+            # A (short deadline) starts the call, B (no deadline) joins it
+            first = asyncio.ensure_future(caller(expires_at(0.05)))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(caller(None))
+            return await asyncio.gather(first, second, return_exceptions=True)
+
+        started = time.monotonic()
+        first, second = asyncio.run(main())
+        self.assertIsInstance(first, DeadlineExceeded)
+        self.assertEqual(second, "page")
+        self.assertEqual(seen, [None])
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(flight.stats()["executed"], 1)
+        self.assertEqual(flight.stats()["coalesced"], 1)
+
+    def test_shared_call_sees_the_callers_deadline(self):
+        flight = SingleFlight(name="test")
+        seen = []
+
+        async def work():
+            seen.append(current_deadline())
+            await asyncio.sleep(0.1)
+            seen.append(current_deadline())
+            return "page"
+
+        first_deadline = expires_at(5)
+        second_deadline = expires_at(10)
+
+        async def caller(deadline):
+            with deadline_scope(deadline):
+                return await flight.do("key", work)
+
+        async def main():
+            first = asyncio.ensure_future(caller(first_deadline))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(caller(second_deadline))
+            return await asyncio.gather(first, second)
+
+        self.assertEqual(asyncio.run(main()), ["page", "page"])
+        # The first caller's deadline, then the later one of the caller that joined
+        self.assertEqual(seen, [first_deadline, second_deadline])
+
+    def test_shared_call_only_sees_shared_context_vars(self):
+        shared = contextvars.ContextVar("shared", default=None)
+        private = contextvars.ContextVar("private", default=None)
+        flight = SingleFlight(name="test")
+        flight.share_context_var(shared)
+
+        async def work():
+            return shared.get(), private.get()
+
+        async def main():
+            shared.set("store")
+            private.set("trace")
+            return await flight.do("key", work)
+
+        self.assertEqual(asyncio.run(main()), ("store", None))
+
+    def test_shared_call_is_cancelled_when_every_caller_ran_out_of_time(self):
+        flight = SingleFlight(name="test")
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.5)
+            finished.append(True)
+
+        async def main():
+            with deadline_scope(expires_at(0.05)):
+                with self.assertRaises(DeadlineExceeded):
+                    await flight.do("key", work)
+            await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        self.assertEqual(finished, [])
+        self.assertEqual(flight.stats()["cancelled"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()